@@ -1,10 +1,39 @@
 #!/usr/bin/env python3
 import os
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+try:
+    import orjson # Optional: faster JSON responses when installed
+except ImportError:
+    orjson = None
 from routes import register_routes
 from modbus_routes import register_modbus_routes
 
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that serializes with orjson.
+    Pretty-printed output and values orjson rejects (e.g. integers beyond 64 bits) go through the default provider.
+    """
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {"separators"}:
+            return super().dumps(obj, **kwargs)
+        # Dates are passed to default() so they keep Flask's HTTP date format
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode()
+        except orjson.JSONEncodeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
 # Register all routes from routes.py
 register_routes(app)
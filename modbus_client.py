@@ -15,9 +15,9 @@ import argparse
 import logging
 import requests
 import time
+import struct
+import socket
 from pymodbus.client.sync import ModbusTcpClient
-from pymodbus.constants import Endian
-from pymodbus.payload import BinaryPayloadDecoder, BinaryPayloadBuilder
 
 # Configure logging
 logging.basicConfig(
@@ -26,6 +26,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Precompiled packers for 32-bit floats and pairs of 16-bit registers
+_PACK_F32 = struct.Struct('>f')
+_PACK_WORDS = struct.Struct('>HH')
+
+# Float register codecs by conversion string: (encode, decode)
+_FLOAT_CODECS = {}
+
+def _float_codec(conversion):
+    """Return the cached (encode, decode) functions for a float conversion string"""
+    codec = _FLOAT_CODECS.get(conversion)
+    if codec is None:
+        # Little endian word order and "swap word" each reverse the registers
+        swap = ("little endian" in conversion.lower()) != ("swap word" in conversion.lower())
+        
+        def encode(value):
+            high, low = _PACK_WORDS.unpack(_PACK_F32.pack(float(value)))
+            return [low, high] if swap else [high, low]
+        
+        def decode(registers):
+            high, low = (registers[1], registers[0]) if swap else (registers[0], registers[1])
+            return _PACK_F32.unpack(_PACK_WORDS.pack(high, low))[0]
+        
+        codec = _FLOAT_CODECS[conversion] = (encode, decode)
+    return codec
+
+def _sleep_until(deadline):
+    """Sleep until a time.monotonic() deadline and return it, or now if it has already passed"""
+    sleep_for = deadline - time.monotonic()
+    if sleep_for > 0:
+        time.sleep(sleep_for)
+        return deadline
+    return time.monotonic()
+
 # Utility functions for colored output
 def print_success(message):
     """Print a success message in green"""
@@ -77,26 +110,7 @@ def read_modbus_value(client, address, count=1, unit=1, datatype="analog", conve
             if conversion and "float" in conversion.lower():
                 # Need at least 2 registers for a float
                 if len(result.registers) >= 2:
-                    # Different byte orders based on conversion string
-                    if "little endian" in conversion.lower():
-                        word_order = Endian.Little
-                    else:
-                        word_order = Endian.Big
-                        
-                    if "swap word" in conversion.lower():
-                        # Swap the registers
-                        registers = [result.registers[1], result.registers[0]]
-                    else:
-                        registers = result.registers
-                    
-                    # Create decoder
-                    decoder = BinaryPayloadDecoder.fromRegisters(
-                        registers,
-                        byteorder=Endian.Big,
-                        wordorder=word_order
-                    )
-                    
-                    return decoder.decode_32bit_float()
+                    return _float_codec(conversion)[1](result.registers)
             
             # Default handling for registers
             if len(result.registers) == 1:
@@ -128,27 +142,7 @@ def write_modbus_value(client, address, value, unit=1, datatype="analog", conver
                     # Convert to float
                     float_value = float(value)
                     
-                    # Different byte orders based on conversion string
-                    if "little endian" in conversion.lower():
-                        word_order = Endian.Little
-                    else:
-                        word_order = Endian.Big
-                    
-                    # Create builder
-                    builder = BinaryPayloadBuilder(
-                        byteorder=Endian.Big,
-                        wordorder=word_order
-                    )
-                    
-                    # Add float value
-                    builder.add_32bit_float(float_value)
-                    
-                    # Get registers
-                    registers = builder.to_registers()
-                    
-                    # Swap if needed
-                    if "swap word" in conversion.lower():
-                        registers = [registers[1], registers[0]]
+                    registers = _float_codec(conversion)[0](float_value)
                     
                     result = client.write_registers(address-40001, registers, unit=unit)
                 else:
@@ -189,6 +183,9 @@ def test_direct_modbus(args):
             print_error(f"Failed to connect to {args.slave_ip}:{args.slave_port}")
             return
         
+        # Send each small Modbus frame immediately instead of waiting on Nagle's algorithm
+        client.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        
         print_success(f"Connected to {args.slave_ip}:{args.slave_port}")
         
         try:
@@ -239,6 +236,7 @@ def test_direct_modbus(args):
                 print_info(f"Monitoring address {args.address}. Press Ctrl+C to stop...")
                 
                 try:
+                    deadline = time.monotonic()
                     while True:
                         value = read_modbus_value(
                             client=client,
@@ -254,7 +252,7 @@ def test_direct_modbus(args):
                         else:
                             print(f"Error reading address {args.address}")
                         
-                        time.sleep(args.scan_rate)
+                        deadline = _sleep_until(deadline + args.scan_rate)
                 except KeyboardInterrupt:
                     print_info("Monitoring stopped")
         
@@ -340,6 +338,7 @@ def test_gateway_api(args):
                     print_info(f"Monitoring {args.slave_name}. Press Ctrl+C to stop...")
                     
                     try:
+                        deadline = time.monotonic()
                         while True:
                             response = requests.get(endpoint, timeout=5)
                             
@@ -352,7 +351,7 @@ def test_gateway_api(args):
                             else:
                                 print(f"Error: {response.status_code} - {response.text}")
                             
-                            time.sleep(args.scan_rate)
+                            deadline = _sleep_until(deadline + args.scan_rate)
                     except KeyboardInterrupt:
                         print_info("Monitoring stopped")
                 else:
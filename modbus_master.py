@@ -5,23 +5,29 @@ Modbus Master Module for IoT Gateway
 This module implements a Modbus master to communicate with Modbus slaves.
 It reads configuration from a YAML file and stores tag definitions in a CSV file.
 Supports comprehensive data type conversions and scaling methods.
+Adjacent tags on the same device are read in bulk with a single request per scan.
 """
-####multiple addresses from the same slave in order or not in order reading in bulk
-####
-
 
 import csv
 import os
 import yaml
+try:
+    # libyaml-backed parser; same safe YAML semantics, implemented in C
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 import time
 import math
 import struct
+import socket
+import operator
+import queue
 import logging
 import threading
+from types import SimpleNamespace
+from concurrent.futures import Future
 from pymodbus.client.sync import ModbusTcpClient, ModbusSerialClient
-from pymodbus.constants import Endian
-from pymodbus.payload import BinaryPayloadDecoder, BinaryPayloadBuilder
-from pymodbus.exceptions import ModbusException
+from pymodbus.exceptions import ModbusException, ConnectionException
 
 # Configure logging
 logging.basicConfig(
@@ -33,6 +39,16 @@ logger = logging.getLogger(__name__)
 # Path for CSV storage
 CSV_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modbus_tags.csv")
 
+# Append-only journal of tag changes made since the last CSV snapshot
+JOURNAL_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modbus_ops.log")
+
+# Journal operations
+JOURNAL_PUT = "PUT"
+JOURNAL_DEL = "DEL"
+
+# Compact the journal into the CSV once it holds this many entries per snapshot row
+JOURNAL_COMPACTION_RATIO = 2
+
 # CSV Headers - based on required arguments
 CSV_HEADERS = [
     "slave_name", "ip_address", "port", "slave_id", "datatype", "conversion",
@@ -42,6 +58,12 @@ CSV_HEADERS = [
     "input_high", "input_low"
 ]
 
+# Fields every slave configuration must provide
+SLAVE_REQUIRED_FIELDS = frozenset({"slave_name", "ip_address"})
+
+# Extracts a tag's CSV row as a tuple in CSV_HEADERS order
+CSV_ROW_GETTER = operator.itemgetter(*CSV_HEADERS)
+
 # Default values for optional parameters
 DEFAULT_VALUES = {
     "port": 502,
@@ -65,6 +87,21 @@ DEFAULT_VALUES = {
     "input_low": 0.0
 }
 
+# Readable Modbus address ranges: (first address, last address, client read method)
+READ_RANGES = (
+    (1, 9999, "read_coils"),
+    (10001, 19999, "read_discrete_inputs"),
+    (30001, 39999, "read_input_registers"),
+    (40001, 49999, "read_holding_registers"),
+)
+
+# Largest number of coils/discrete inputs and registers fetched by one bulk scan read
+MAX_BULK_BITS = 2000
+MAX_BULK_REGISTERS = 125
+
+# Seconds to wait for a queued write to complete
+WRITE_TIMEOUT = 5
+
 # Supported data conversion types
 DATA_CONVERSIONS = {
     # INT64 types
@@ -117,20 +154,146 @@ SCALING_TYPES = [
     "Square Root of (Input/(F2-F1)) to Span"
 ]
 
+# Precompiled packers for 32-bit floats and pairs of 16-bit registers. Packing a float
+# little endian and reading it back as little endian words yields [low, high] directly,
+# so the word-swapped layout needs no reordering after unpacking.
+_PACK_F32 = struct.Struct('>f')
+_PACK_WORDS = struct.Struct('>HH')
+_PACK_F32_LE = struct.Struct('<f')
+_PACK_WORDS_LE = struct.Struct('<HH')
+
+def _float_words_swapped(conversion):
+    """Return True if a float write conversion puts the low word first"""
+    conversion = conversion.lower()
+    # Little endian word order and "swap word" each reverse the two registers
+    return ("little endian" in conversion) != ("swap word" in conversion)
+
+def _build_float_encoder(conversion):
+    """Build a function converting a float to registers for a conversion string
+    
+    Equivalent to ModbusMaster._convert_float_to_registers, with the conversion
+    string parsed once instead of on every write.
+    """
+    if _float_words_swapped(conversion):
+        pack, unpack = _PACK_F32_LE.pack, _PACK_WORDS_LE.unpack
+    else:
+        pack, unpack = _PACK_F32.pack, _PACK_WORDS.unpack
+    
+    def encode(value):
+        return list(unpack(pack(float(value))))
+    
+    return encode
+
+# Float encoders by conversion string, shared by all writes using the same conversion
+_FLOAT_ENCODERS = {}
+
+def _float_encoder(conversion):
+    """Return the cached float encoder for a conversion string"""
+    encoder = _FLOAT_ENCODERS.get(conversion)
+    if encoder is None:
+        encoder = _FLOAT_ENCODERS[conversion] = _build_float_encoder(conversion)
+    return encoder
+
+# struct format characters for the register types decoded by a plain byte reordering
+_STRUCT_TYPES = {"int32": "i", "uint32": "I", "int64": "q", "uint64": "Q", "float32": "f", "float64": "d"}
+
+def _build_register_decoder(conv_spec):
+    """Build a function decoding registers for a DATA_CONVERSIONS entry
+    
+    Equivalent to BinaryPayloadDecoder.fromRegisters with the entry's byte and word
+    order, with the reordering fixed up front: little endian word order reverses the
+    registers and little endian byte order packs each register byte-swapped.
+    Returns None for the special types handled in _process_read_result.
+    """
+    fmt = _STRUCT_TYPES.get(conv_spec["type"])
+    if fmt is None:
+        return None
+    size = conv_spec["size"]
+    words = slice(size - 1, None, -1) if conv_spec["word_order"] == "little" else slice(0, size)
+    pack = struct.Struct(('<' if conv_spec["byte_order"] == "little" else '>') + f'{size}H').pack
+    unpack = struct.Struct('>' + fmt).unpack
+    
+    def decode(registers):
+        return unpack(pack(*registers[words]))[0]
+    
+    return decode
+
+# Register decoders by conversion string, built once for every standard conversion
+_REGISTER_DECODERS = {
+    conversion: _build_register_decoder(conv_spec)
+    for conversion, conv_spec in DATA_CONVERSIONS.items()
+}
+
+def _read_count(conversion):
+    """Return the number of registers read for a conversion string"""
+    if conversion in DATA_CONVERSIONS:
+        return DATA_CONVERSIONS[conversion]["size"]
+    return 2 if "float" in conversion.lower() or "double" in conversion.lower() else 1
+
+def _build_read_plan(address, conversion, count=None):
+    """Return (read_method, offset, count) for an integer address, or None if it is not readable"""
+    if count is None:
+        count = _read_count(conversion)
+    for first, last, read_method in READ_RANGES:
+        if first <= address <= last:
+            return read_method, address - first, count
+    return None
+
+class NoDelayTcpClient(ModbusTcpClient):
+    """ModbusTcpClient that disables Nagle's algorithm on every new connection
+    
+    Modbus frames are a few dozen bytes, so without TCP_NODELAY each request can be
+    held back by the kernel waiting to coalesce it with more data.
+    """
+    
+    def connect(self):
+        fresh = self.socket is None
+        connected = super().connect()
+        if connected and fresh:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return connected
+
 class ModbusMaster:
     """Modbus Master class to communicate with Modbus slaves"""
     
     def __init__(self, yaml_config=None):
         self.clients = {}  # Dictionary to store clients by slave_name
+        self.write_queues = {}  # Pending writes by slave_name, drained by one writer thread per slave
+        self.write_threads = {}
+        self.write_plans = {}  # Pre-parsed write parameters by slave_name
+        self.client_locks = {}  # Serializes transactions on each slave's client between scan and writer threads
         self.tags = {}     # Dictionary to store tag configurations
         self.csv_file = CSV_FILE_PATH
+        self.journal_file = JOURNAL_FILE_PATH
         self.running = False
         self.scan_thread = None
         self.tag_values = {}  # Store latest values
         
+        # Journal bookkeeping
+        self._csv_lock = threading.Lock()
+        self._journal_enabled = True
+        self._journal_entries = 0
+        self._snapshot_size = 0
+        self._compaction_thread = None
+        
+        # Bumped on every change to self.tags so derived structures can be rebuilt lazily
+        self._tags_version = 0
+        self._scan_groups = {}
+        self._scan_groups_version = -1
+        self._slave_body_cache = {}  # slave_name -> (tags_version, serialized GET response body)
+        
+        # Hashes of the last applied configuration and CSV import, to skip identical re-submissions
+        self._config_hash = None
+        self._last_import_hash = None
+        
         # Load configuration if provided
         if yaml_config:
+            # A fresh configuration replaces whatever was persisted before: load it without
+            # journaling and write it out as the new snapshot, which also empties the journal
+            self._journal_enabled = False
             self.load_config_from_yaml(yaml_config)
+            self._journal_enabled = True
+            self._save_to_csv()
     
     def load_config_from_yaml(self, yaml_config):
         """Load configuration from YAML string or file"""
@@ -138,10 +301,10 @@ class ModbusMaster:
             if os.path.isfile(yaml_config):
                 # It's a file path
                 with open(yaml_config, 'r') as f:
-                    config = yaml.safe_load(f)
+                    config = yaml.load(f, Loader=YamlLoader)
             else:
                 # It's a YAML string
-                config = yaml.safe_load(yaml_config)
+                config = yaml.load(yaml_config, Loader=YamlLoader)
         else:
             # It's already a dictionary
             config = yaml_config
@@ -159,10 +322,9 @@ class ModbusMaster:
     def _process_slave_config(self, slave_config):
         """Process a single slave configuration"""
         # Check required fields
-        required_fields = ["slave_name", "ip_address"]
-        for field in required_fields:
-            if field not in slave_config:
-                raise ValueError(f"Missing required field '{field}' in slave configuration")
+        missing = SLAVE_REQUIRED_FIELDS - slave_config.keys()
+        if missing:
+            raise ValueError(f"Missing required fields {sorted(missing)} in slave configuration")
         
         # Set default values for optional fields
         for key, default_value in DEFAULT_VALUES.items():
@@ -172,9 +334,11 @@ class ModbusMaster:
         # Save tag configuration
         slave_name = slave_config["slave_name"]
         self.tags[slave_name] = slave_config
+        self.write_plans[slave_name] = self._build_write_plan(slave_config)
         
-        # Save to CSV
-        self._save_to_csv()
+        # Record the change in the journal
+        self._journal_op(JOURNAL_PUT, slave_name)
+        self._tags_version += 1
         
         # Create client if it doesn't exist
         if slave_name not in self.clients:
@@ -187,18 +351,81 @@ class ModbusMaster:
         port = int(slave_config["port"])
         
         try:
-            client = ModbusTcpClient(
+            client = NoDelayTcpClient(
                 host=ip_address,
                 port=port,
                 timeout=3
             )
             self.clients[slave_name] = client
+            self._start_writer(slave_name)
             logger.info(f"Created Modbus client for {slave_name} at {ip_address}:{port}")
             return True
         except Exception as e:
             logger.error(f"Error creating Modbus client for {slave_name}: {e}")
             return False
     
+    def _client_lock(self, slave_name):
+        """Return the lock guarding a slave's client"""
+        lock = self.client_locks.get(slave_name)
+        if lock is None:
+            lock = self.client_locks.setdefault(slave_name, threading.Lock())
+        return lock
+    
+    def _start_writer(self, slave_name):
+        """Start the writer thread that serializes writes to a slave"""
+        if slave_name in self.write_threads:
+            return
+        write_queue = queue.Queue()
+        thread = threading.Thread(target=self._write_loop, args=(slave_name, write_queue))
+        thread.daemon = True
+        self.write_queues[slave_name] = write_queue
+        self.write_threads[slave_name] = thread
+        thread.start()
+    
+    def _stop_writer(self, slave_name):
+        """Stop the writer thread of a slave once its pending writes are done"""
+        write_queue = self.write_queues.pop(slave_name, None)
+        self.write_threads.pop(slave_name, None)
+        if write_queue:
+            write_queue.put(None)
+    
+    def shutdown(self):
+        """Stop scanning and the writer threads, then close all clients"""
+        self.stop_scanning()
+        writer_threads = list(self.write_threads.values())
+        for slave_name in list(self.write_queues):
+            self._stop_writer(slave_name)
+        # Let writes already queued finish before their sockets are closed
+        for thread in writer_threads:
+            thread.join(timeout=WRITE_TIMEOUT)
+        self.disconnect_all()
+    
+    def _write_loop(self, slave_name, write_queue):
+        """Process queued writes for a single slave"""
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            future, value = item
+            # Skip writes whose request already timed out and cancelled them
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.write_data_fast(slave_name, value))
+            except Exception as e:
+                future.set_exception(e)
+    
+    def submit_write(self, slave_name, value):
+        """Queue a write to a slave and return a Future resolving to the write_data_fast result"""
+        future = Future()
+        write_queue = self.write_queues.get(slave_name)
+        if write_queue is None:
+            logger.error(f"Unknown slave: {slave_name}")
+            future.set_result(False)
+            return future
+        write_queue.put((future, value))
+        return future
+    
     def connect_all(self):
         """Connect to all configured slaves"""
         for slave_name, client in self.clients.items():
@@ -220,53 +447,149 @@ class ModbusMaster:
             except Exception as e:
                 logger.error(f"Error disconnecting from Modbus slave {slave_name}: {e}")
     
+    def _fill_csv_defaults(self, tag):
+        """Ensure all CSV fields are present on a tag"""
+        for header in CSV_HEADERS:
+            if header not in tag:
+                tag[header] = DEFAULT_VALUES.get(header, "")
+        return tag
+    
+    def csv_rows(self):
+        """Return all tag configurations as tuples in CSV_HEADERS order"""
+        rows = []
+        for tag in list(self.tags.values()):
+            try:
+                rows.append(CSV_ROW_GETTER(tag))
+            except KeyError:
+                rows.append(CSV_ROW_GETTER(self._fill_csv_defaults(tag)))
+        return rows
+    
     def _save_to_csv(self):
-        """Save all tag configurations to CSV"""
+        """Save all tag configurations to CSV and truncate the journal"""
         try:
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(self.csv_file), exist_ok=True)
-            
-            # Write to CSV
-            with open(self.csv_file, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
-                writer.writeheader()
+            with self._csv_lock:
+                # Create directory if it doesn't exist
+                os.makedirs(os.path.dirname(self.csv_file), exist_ok=True)
                 
-                # Write each tag to CSV
-                for slave_name, tag in self.tags.items():
-                    # Ensure all fields are present
-                    for header in CSV_HEADERS:
-                        if header not in tag:
-                            tag[header] = DEFAULT_VALUES.get(header, "")
-                    
-                    writer.writerow(tag)
+                # Write to a temporary file first so readers never see a partial snapshot
+                tmp_file = f"{self.csv_file}.tmp"
+                rows = self.csv_rows()
+                with open(tmp_file, 'w', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(CSV_HEADERS)
+                    writer.writerows(rows)
+                os.replace(tmp_file, self.csv_file)
+                
+                # Everything in the journal is now part of the snapshot
+                open(self.journal_file, 'w').close()
+                self._journal_entries = 0
+                self._snapshot_size = len(rows)
             
-            logger.info(f"Saved {len(self.tags)} tag configurations to {self.csv_file}")
+            logger.info(f"Saved {len(rows)} tag configurations to {self.csv_file}")
             return True
         except Exception as e:
             logger.error(f"Error saving to CSV: {e}")
             return False
     
+    def _journal_op(self, op, slave_name):
+        """Append a single tag change to the journal instead of rewriting the CSV
+        
+        PUT entries carry the full CSV row of the tag, DEL entries only the slave name.
+        The CSV is rebuilt in the background once the journal grows past
+        JOURNAL_COMPACTION_RATIO times the size of the last snapshot.
+        """
+        if not self._journal_enabled:
+            return True
+        try:
+            with self._csv_lock:
+                os.makedirs(os.path.dirname(self.journal_file), exist_ok=True)
+                with open(self.journal_file, 'a', newline='') as f:
+                    writer = csv.writer(f)
+                    if op == JOURNAL_PUT:
+                        tag = self._fill_csv_defaults(self.tags[slave_name])
+                        writer.writerow((op,) + CSV_ROW_GETTER(tag))
+                    else:
+                        writer.writerow([op, slave_name])
+                self._journal_entries += 1
+                needs_compaction = self._journal_entries > JOURNAL_COMPACTION_RATIO * max(self._snapshot_size, 1)
+        except Exception as e:
+            logger.error(f"Error writing to journal: {e}")
+            return False
+        
+        if needs_compaction:
+            self._schedule_compaction()
+        return True
+    
+    def _schedule_compaction(self):
+        """Rebuild the CSV snapshot from the current tags in a background thread"""
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self._save_to_csv)
+        self._compaction_thread.daemon = True
+        self._compaction_thread.start()
+    
+    def remove_slave(self, slave_name):
+        """Remove a slave, closing its client, and record the removal in the journal"""
+        if slave_name in self.clients:
+            self._stop_writer(slave_name)
+            self.clients.pop(slave_name).close()
+        self.tags.pop(slave_name, None)
+        self.write_plans.pop(slave_name, None)
+        self._tags_version += 1
+        self._journal_op(JOURNAL_DEL, slave_name)
+    
+    def _replay_journal(self):
+        """Apply journal entries on top of tags loaded from the CSV snapshot"""
+        if not os.path.exists(self.journal_file):
+            return
+        
+        entries = 0
+        with open(self.journal_file, 'r', newline='') as f:
+            for entry in csv.reader(f):
+                if not entry:
+                    continue
+                op, fields = entry[0], entry[1:]
+                if op == JOURNAL_PUT and len(fields) == len(CSV_HEADERS):
+                    row = dict(zip(CSV_HEADERS, fields))
+                    self.tags[row["slave_name"]] = row
+                elif op == JOURNAL_DEL and fields:
+                    self.tags.pop(fields[0], None)
+                else:
+                    logger.warning(f"Skipping malformed journal entry: {entry}")
+                    continue
+                entries += 1
+        self._journal_entries = entries
+    
     def load_from_csv(self):
-        """Load tag configurations from CSV"""
-        if not os.path.exists(self.csv_file):
+        """Load tag configurations from the CSV snapshot and the journal"""
+        csv_exists = os.path.exists(self.csv_file)
+        if not csv_exists and not os.path.exists(self.journal_file):
             logger.warning(f"CSV file not found: {self.csv_file}")
             return False
         
         try:
-            with open(self.csv_file, 'r', newline='') as f:
-                reader = csv.DictReader(f)
-                
-                # Clear existing tags
-                self.tags = {}
-                
-                # Read each row as a tag configuration
-                for row in reader:
-                    slave_name = row["slave_name"]
-                    self.tags[slave_name] = row
+            # Clear existing tags
+            self.tags = {}
+            self.write_plans = {}
+            
+            # Without a snapshot yet, every tag comes from the journal
+            if csv_exists:
+                with open(self.csv_file, 'r', newline='') as f:
+                    reader = csv.DictReader(f)
                     
-                    # Create client if it doesn't exist
-                    if slave_name not in self.clients:
-                        self._create_client(row)
+                    # Read each row as a tag configuration
+                    for row in reader:
+                        self.tags[row["slave_name"]] = row
+            self._snapshot_size = len(self.tags)
+            
+            # Apply changes recorded since the snapshot was written
+            self._replay_journal()
+            self._tags_version += 1
+            
+            # Create clients that don't exist yet
+            for slave_name, row in self.tags.items():
+                if slave_name not in self.clients:
+                    self._create_client(row)
             
             logger.info(f"Loaded {len(self.tags)} tag configurations from {self.csv_file}")
             return True
@@ -280,7 +603,6 @@ class ModbusMaster:
             logger.error(f"Unknown slave: {slave_name}")
             return None
         
-        client = self.clients[slave_name]
         tag = self.tags.get(slave_name)
         
         # If tag exists, use its values for missing parameters
@@ -297,55 +619,67 @@ class ModbusMaster:
             datatype = datatype or "analog"
             conversion = conversion or "FLOAT, Big Endian (ABCD)"
         
-        # Determine count based on conversion type if not specified
-        if count is None:
-            if conversion in DATA_CONVERSIONS:
-                count = DATA_CONVERSIONS[conversion]["size"]
-            else:
-                count = 2 if "float" in conversion.lower() or "double" in conversion.lower() else 1
-        
-        # Check if client is connected
-        if not client.is_socket_open():
-            try:
-                client.connect()
-            except Exception as e:
-                logger.error(f"Error connecting to {slave_name}: {e}")
-                return None
-        
         try:
-            # Convert address to integer
+            # Convert address to integer and resolve function code and count
             address = int(address)
-            
-            # Determine function code based on address range
-            if 1 <= address <= 9999:  # Coils
-                result = client.read_coils(address-1, count, unit=unit)
-            elif 10001 <= address <= 19999:  # Discrete Inputs
-                result = client.read_discrete_inputs(address-10001, count, unit=unit)
-            elif 30001 <= address <= 39999:  # Input Registers
-                result = client.read_input_registers(address-30001, count, unit=unit)
-            elif 40001 <= address <= 49999:  # Holding Registers
-                result = client.read_holding_registers(address-40001, count, unit=unit)
-            else:
-                logger.error(f"Invalid address: {address}")
-                return None
-            
-            # Check for errors
-            if result.isError():
-                logger.error(f"Error reading from {slave_name} at address {address}: {result}")
-                return None
-            
-            # Process the result based on datatype and conversion
-            raw_value = self._process_read_result(result, datatype, conversion)
-            
-            # Apply scaling if tag exists and we have a valid raw value
-            if tag and raw_value is not None:
-                return self._apply_scaling(raw_value, tag)
-            
-            return raw_value
-        
+            plan = _build_read_plan(address, conversion, count)
         except Exception as e:
             logger.error(f"Error reading from {slave_name} at address {address}: {e}")
             return None
+        
+        if plan is None:
+            logger.error(f"Invalid address: {address}")
+            return None
+        
+        return self._read_planned(slave_name, address, plan, unit, datatype, conversion)
+    
+    def _execute(self, client, method, *args, **kwargs):
+        """Run a client request, reconnecting and retrying once if the connection dropped
+        
+        pymodbus connects on demand inside each request, so callers need no connect
+        check beforehand. A failed fresh connect is not retried, so an unreachable
+        slave costs one connect timeout. Must be called with the slave's client lock held.
+        """
+        was_open = client.is_socket_open()
+        try:
+            return getattr(client, method)(*args, **kwargs)
+        except ConnectionException:
+            client.close()
+            if not was_open:
+                raise
+            return getattr(client, method)(*args, **kwargs)
+    
+    def _read_planned(self, slave_name, address, plan, unit, datatype, conversion):
+        """Read a tag whose function code, offset and count were resolved by _build_read_plan"""
+        client = self.clients.get(slave_name)
+        if client is None:
+            logger.error(f"Unknown slave: {slave_name}")
+            return None
+        tag = self.tags.get(slave_name)
+        read_method, offset, count = plan
+        
+        # Only one transaction at a time on the shared client socket
+        with self._client_lock(slave_name):
+            try:
+                result = self._execute(client, read_method, offset, count, unit=unit)
+                
+                # Check for errors
+                if result.isError():
+                    logger.error(f"Error reading from {slave_name} at address {address}: {result}")
+                    return None
+                
+                # Process the result based on datatype and conversion
+                raw_value = self._process_read_result(result, datatype, conversion)
+                
+                # Apply scaling if tag exists and we have a valid raw value
+                if tag and raw_value is not None:
+                    return self._apply_scaling(raw_value, tag)
+                
+                return raw_value
+            
+            except Exception as e:
+                logger.error(f"Error reading from {slave_name} at address {address}: {e}")
+                return None
     
     def write_data(self, slave_name, address, value, unit=1, datatype="analog", conversion=""):
         """Write data to a Modbus slave"""
@@ -355,50 +689,108 @@ class ModbusMaster:
         
         client = self.clients[slave_name]
         
-        # Check if client is connected
-        if not client.is_socket_open():
+        # Only one transaction at a time on the shared client socket
+        with self._client_lock(slave_name):
             try:
-                client.connect()
+                # Convert address to integer
+                address = int(address)
+                
+                # Determine function code and prepare value based on address range and datatype
+                if 1 <= address <= 9999:  # Coils
+                    # Convert value to boolean
+                    bool_value = bool(value)
+                    result = self._execute(client, "write_coil", address-1, bool_value, unit=unit)
+                elif 40001 <= address <= 49999:  # Holding Registers
+                    if datatype.lower() == "analog":
+                        # Handle different data types
+                        if isinstance(value, float):
+                            # Convert float to registers based on conversion
+                            registers = self._convert_float_to_registers(value, conversion)
+                            result = self._execute(client, "write_registers", address-40001, registers, unit=unit)
+                        else:
+                            # Write as single register
+                            result = self._execute(client, "write_register", address-40001, int(value), unit=unit)
+                    else:
+                        # Write as single register
+                        result = self._execute(client, "write_register", address-40001, int(value), unit=unit)
+                else:
+                    logger.error(f"Invalid address or not writable: {address}")
+                    return False
+                
+                # Check for errors
+                if result.isError():
+                    logger.error(f"Error writing to {slave_name} at address {address}: {result}")
+                    return False
+                
+                return True
+            
             except Exception as e:
-                logger.error(f"Error connecting to {slave_name}: {e}")
+                logger.error(f"Error writing to {slave_name} at address {address}: {e}")
                 return False
+    
+    def _build_write_plan(self, tag):
+        """Pre-parse the write parameters of a tag
         
+        Returns a tuple (write_kind, register_offset, unit, is_analog, encoder), where
+        write_kind is "coil", "holding" or None for addresses that are not writable or malformed.
+        """
         try:
-            # Convert address to integer
-            address = int(address)
-            
-            # Determine function code and prepare value based on address range and datatype
-            if 1 <= address <= 9999:  # Coils
-                # Convert value to boolean
-                bool_value = bool(value)
-                result = client.write_coil(address-1, bool_value, unit=unit)
-            elif 40001 <= address <= 49999:  # Holding Registers
-                if datatype.lower() == "analog":
-                    # Handle different data types
-                    if isinstance(value, float):
-                        # Convert float to registers based on conversion
-                        registers = self._convert_float_to_registers(value, conversion)
-                        result = client.write_registers(address-40001, registers, unit=unit)
+            address = int(tag.get("address", 0))
+            unit = int(tag.get("slave_id", 1))
+        except (TypeError, ValueError):
+            # Never fall back to a default unit or address, which would write to the wrong device
+            logger.error(f"Malformed address or slave_id in tag {tag.get('slave_name')}: "
+                         f"address={tag.get('address')!r}, slave_id={tag.get('slave_id')!r}")
+            return None, None, None, False, None
+        
+        if 1 <= address <= 9999:  # Coils
+            write_kind, offset = "coil", address - 1
+        elif 40001 <= address <= 49999:  # Holding Registers
+            write_kind, offset = "holding", address - 40001
+        else:
+            write_kind, offset = None, address
+        
+        is_analog = str(tag.get("datatype", "analog")).lower() == "analog"
+        encoder = _float_encoder(tag.get("conversion", ""))
+        return write_kind, offset, unit, is_analog, encoder
+    
+    def write_data_fast(self, slave_name, value):
+        """Write a value to a slave using its tag configuration pre-parsed at config time"""
+        client = self.clients.get(slave_name)
+        tag = self.tags.get(slave_name)
+        if client is None or tag is None:
+            logger.error(f"Unknown slave: {slave_name}")
+            return False
+        
+        plan = self.write_plans.get(slave_name)
+        if plan is None:
+            plan = self.write_plans[slave_name] = self._build_write_plan(tag)
+        write_kind, offset, unit, is_analog, encoder = plan
+        
+        # Only one transaction at a time on the shared client socket
+        with self._client_lock(slave_name):
+            try:
+                if write_kind == "coil":
+                    result = self._execute(client, "write_coil", offset, bool(value), unit=unit)
+                elif write_kind == "holding":
+                    if is_analog and isinstance(value, float):
+                        result = self._execute(client, "write_registers", offset, encoder(value), unit=unit)
                     else:
-                        # Write as single register
-                        result = client.write_register(address-40001, int(value), unit=unit)
+                        result = self._execute(client, "write_register", offset, int(value), unit=unit)
                 else:
-                    # Write as single register
-                    result = client.write_register(address-40001, int(value), unit=unit)
-            else:
-                logger.error(f"Invalid address or not writable: {address}")
-                return False
+                    logger.error(f"Invalid address or not writable: {tag.get('address')}")
+                    return False
+                
+                # Check for errors
+                if result.isError():
+                    logger.error(f"Error writing to {slave_name} at address {tag.get('address')}: {result}")
+                    return False
+                
+                return True
             
-            # Check for errors
-            if result.isError():
-                logger.error(f"Error writing to {slave_name} at address {address}: {result}")
+            except Exception as e:
+                logger.error(f"Error writing to {slave_name} at address {tag.get('address')}: {e}")
                 return False
-            
-            return True
-        
-        except Exception as e:
-            logger.error(f"Error writing to {slave_name} at address {address}: {e}")
-            return False
     
     def _process_read_result(self, result, datatype, conversion):
         """Process read result based on datatype and conversion"""
@@ -454,30 +846,10 @@ class ModbusMaster:
                         result = result * 10 + nibble
             return result
         
-        # Use PyModbus decoder for standard types
-        byte_order = Endian.Big if conv_spec["byte_order"] == "big" else Endian.Little
-        word_order = Endian.Big if conv_spec["word_order"] == "big" else Endian.Little
-        
-        # Create decoder
-        decoder = BinaryPayloadDecoder.fromRegisters(
-            registers, 
-            byteorder=byte_order,
-            wordorder=word_order
-        )
-        
-        # Decode based on type
-        if conv_type == "int32":
-            return decoder.decode_32bit_int()
-        elif conv_type == "uint32":
-            return decoder.decode_32bit_uint()
-        elif conv_type == "int64":
-            return decoder.decode_64bit_int()
-        elif conv_type == "uint64":
-            return decoder.decode_64bit_uint()
-        elif conv_type == "float32":
-            return decoder.decode_32bit_float()
-        elif conv_type == "float64":
-            return decoder.decode_64bit_float()
+        # Decode standard types with the precompiled decoder for this conversion
+        decode = _REGISTER_DECODERS.get(conversion) if conversion in DATA_CONVERSIONS else _REGISTER_DECODERS["FLOAT, Big Endian (ABCD)"]
+        if decode is not None:
+            return decode(registers)
         
         # Default handling for registers if type wasn't processed
         if len(registers) == 1:
@@ -601,29 +973,7 @@ class ModbusMaster:
     
     def _convert_float_to_registers(self, value, conversion):
         """Convert a float value to Modbus registers based on conversion string"""
-        # Different byte orders based on conversion string
-        if "little endian" in conversion.lower():
-            word_order = Endian.Little
-        else:
-            word_order = Endian.Big
-        
-        # Create builder
-        builder = BinaryPayloadBuilder(
-            byteorder=Endian.Big,
-            wordorder=word_order
-        )
-        
-        # Add float value
-        builder.add_32bit_float(float(value))
-        
-        # Get registers
-        registers = builder.to_registers()
-        
-        # Swap if needed
-        if "swap word" in conversion.lower():
-            return [registers[1], registers[0]]
-        
-        return registers
+        return _float_encoder(conversion)(value)
     
     def start_scanning(self):
         """Start scanning all tags based on their scan rates"""
@@ -645,45 +995,136 @@ class ModbusMaster:
             self.scan_thread = None
         logger.info("Stopped scanning tags")
     
+    def _build_scan_groups(self):
+        """Group tags by scan rate into bulk read blocks of pre-parsed read parameters
+        
+        Tags on the same device (ip_address, port, slave_id) and function code whose
+        registers are adjacent or overlapping share one block, so each block costs one
+        request per scan. Returns {scan_rate: [(read_method, start, count, members)]},
+        where members are (slave_name, address, read_plan, unit, datatype, conversion).
+        """
+        buckets = {}
+        for slave_name, tag in list(self.tags.items()):
+            try:
+                scan_rate = int(tag.get("scan_rate", 1))
+                address = int(tag["address"])
+                unit = int(tag["slave_id"])
+                datatype = tag["datatype"]
+                conversion = tag["conversion"]
+                plan = _build_read_plan(address, conversion)
+                device = (tag.get("ip_address"), str(tag.get("port")), unit)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping tag {slave_name} in scan: invalid configuration ({e})")
+                continue
+            
+            if plan is None:
+                logger.warning(f"Skipping tag {slave_name} in scan: invalid address {address}")
+                continue
+            
+            key = (scan_rate, device, plan[0])
+            buckets.setdefault(key, []).append((slave_name, address, plan, unit, datatype, conversion))
+        
+        scan_groups = {}
+        for (scan_rate, device, read_method), members in buckets.items():
+            max_count = MAX_BULK_BITS if read_method in ("read_coils", "read_discrete_inputs") else MAX_BULK_REGISTERS
+            blocks = scan_groups.setdefault(scan_rate, [])
+            block = None
+            for member in sorted(members, key=lambda m: m[2][1]):
+                _, offset, count = member[2]
+                if block is not None:
+                    start, end = block[1], block[1] + block[2]
+                    new_end = max(end, offset + count)
+                    if offset <= end and new_end - start <= max_count:
+                        block[2] = new_end - start
+                        block[3].append(member)
+                        continue
+                block = [read_method, offset, count, [member]]
+                blocks.append(block)
+        return scan_groups
+    
+    def _read_block(self, read_method, start, count, members):
+        """Read a bulk block once and decode each member tag from its slice of the response
+        
+        Returns {slave_name: value}. Falls back to reading members one by one when the
+        bulk request fails, so one bad tag does not hide the others.
+        """
+        lead_name = members[0][0]
+        unit = members[0][3]
+        client = self.clients.get(lead_name)
+        if client is None:
+            return {}
+        
+        result = None
+        with self._client_lock(lead_name):
+            try:
+                result = self._execute(client, read_method, start, count, unit=unit)
+                if result.isError():
+                    logger.error(f"Error bulk reading {count} from {lead_name} at offset {start}: {result}")
+                    result = None
+            except Exception as e:
+                logger.error(f"Error bulk reading {count} from {lead_name} at offset {start}: {e}")
+                result = None
+        
+        values = {}
+        if result is None:
+            for slave_name, address, plan, unit, datatype, conversion in members:
+                values[slave_name] = self._read_planned(slave_name, address, plan, unit, datatype, conversion)
+            return values
+        
+        registers = getattr(result, 'registers', None)
+        bits = getattr(result, 'bits', None)
+        for slave_name, address, plan, unit, datatype, conversion in members:
+            first = plan[1] - start
+            last = first + plan[2]
+            part = SimpleNamespace(
+                registers=registers[first:last] if registers else None,
+                bits=bits[first:last] if bits else None
+            )
+            try:
+                raw_value = self._process_read_result(part, datatype, conversion)
+                tag = self.tags.get(slave_name)
+                if tag and raw_value is not None:
+                    raw_value = self._apply_scaling(raw_value, tag)
+                values[slave_name] = raw_value
+            except Exception as e:
+                logger.error(f"Error decoding {slave_name} at address {address}: {e}")
+        return values
+    
     def _scan_loop(self):
         """Main loop for scanning tags"""
+        deadline = time.monotonic()
         while self.running:
             scan_start = time.time()
             
-            # Group tags by scan rate
-            scan_groups = {}
-            for slave_name, tag in self.tags.items():
-                scan_rate = int(tag.get("scan_rate", 1))
-                if scan_rate not in scan_groups:
-                    scan_groups[scan_rate] = []
-                scan_groups[scan_rate].append(tag)
+            # Regroup tags by scan rate only when they have changed
+            if self._scan_groups_version != self._tags_version:
+                self._scan_groups_version = self._tags_version
+                self._scan_groups = self._build_scan_groups()
             
             # Process each scan group
-            for scan_rate, tags in scan_groups.items():
+            for scan_rate, blocks in self._scan_groups.items():
                 # Check if it's time to scan this group
                 if scan_start % scan_rate < 1:
-                    for tag in tags:
-                        slave_name = tag["slave_name"]
-                        address = int(tag["address"])
-                        unit = int(tag["slave_id"])
-                        datatype = tag["datatype"]
-                        conversion = tag["conversion"]
+                    for read_method, start, count, members in blocks:
+                        # Read the block's tags
+                        if len(members) == 1:
+                            slave_name, address, plan, unit, datatype, conversion = members[0]
+                            values = {slave_name: self._read_planned(slave_name, address, plan, unit, datatype, conversion)}
+                        else:
+                            values = self._read_block(read_method, start, count, members)
                         
-                        # Read the tag
-                        value = self.read_data(
-                            slave_name=slave_name,
-                            address=address,
-                            unit=unit,
-                            datatype=datatype,
-                            conversion=conversion
-                        )
-                        
-                        # Store the value
-                        if value is not None:
-                            self.tag_values[slave_name] = value
+                        # Store the values
+                        for slave_name, value in values.items():
+                            if value is not None:
+                                self.tag_values[slave_name] = value
             
-            # Sleep until next scan
-            time.sleep(1)
+            # Sleep until next scan, measured from the previous deadline so scan time does not drift
+            deadline += 1
+            sleep_for = deadline - time.monotonic()
+            if sleep_for > 0:
+                time.sleep(sleep_for)
+            else:
+                deadline = time.monotonic()
     
     def get_tag_value(self, slave_name):
         """Get the latest value for a tag"""
@@ -699,10 +1140,10 @@ def load_yaml_config(yaml_file_or_string):
         # Check if it's a file path
         if os.path.isfile(yaml_file_or_string):
             with open(yaml_file_or_string, 'r') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=YamlLoader)
         else:
             # It's a YAML string
-            config = yaml.safe_load(yaml_file_or_string)
+            config = yaml.load(yaml_file_or_string, Loader=YamlLoader)
         
         return config
     except Exception as e:
@@ -7,433 +7,486 @@ This module provides Flask routes to configure and use the Modbus master functio
 
 import os
 import yaml
+try:
+    # libyaml-backed parser; same safe YAML semantics, implemented in C
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 import json
 import csv
-from flask import request, jsonify, send_file
+import hashlib
+import logging
+from functools import wraps
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import request, jsonify, send_file, abort, make_response, Response
 from io import StringIO
-from modbus_master import ModbusMaster, CSV_HEADERS
+from werkzeug.exceptions import HTTPException
+from modbus_master import ModbusMaster, CSV_HEADERS, WRITE_TIMEOUT, SLAVE_REQUIRED_FIELDS
 
-# Global ModbusMaster instance
-MODBUS_MASTER = None
+logger = logging.getLogger(__name__)
+
+class _MasterHandle:
+    """Holder for the active ModbusMaster
+    
+    Rebinding ``ref`` is a single attribute store, so routes that read the handle
+    once per request always see either the old or the new master, never a mix.
+    """
+    __slots__ = ('ref',)
+    
+    def __init__(self):
+        self.ref = None
+    
+    def get(self):
+        """Return the active ModbusMaster, aborting the request with 404 if there is none"""
+        master = self.ref
+        if master is None:
+            abort(make_response(jsonify({
+                "error": "Modbus master not configured"
+            }), 404))
+        return master
+    
+    def get_or_create(self):
+        """Return the active ModbusMaster, creating an empty one if there is none"""
+        master = self.ref
+        if master is None:
+            master = self.ref = ModbusMaster()
+        return master
+
+# Handle to the active ModbusMaster instance
+HANDLE = _MasterHandle()
+
+def _content_hash(data):
+    """Return a stable hash of a request payload (bytes, str, or JSON-serializable object)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    elif not isinstance(data, bytes):
+        data = json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.blake2b(data).hexdigest()
+
+def _cached_slave_body(master, slave_name, dumps):
+    """Return the serialized GET response for a slave, re-serializing only after tag changes"""
+    version = master._tags_version
+    entry = master._slave_body_cache.get(slave_name)
+    if entry is None or entry[0] != version:
+        entry = (version, dumps({
+            "success": True,
+            "slave": master.tags[slave_name]
+        }))
+        master._slave_body_cache[slave_name] = entry
+    return entry[1]
+
+def _api(error_prefix):
+    """Wrap a route with the shared error handling of the Modbus API
+    
+    ValueError and KeyError become 400 responses, any other exception a 500,
+    each reported as {"error": "<error_prefix>: <message>"}. HTTP exceptions
+    raised by abort() pass through unchanged.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                return fn(*args, **kwargs)
+            except HTTPException:
+                raise
+            except KeyError as e:
+                return jsonify({
+                    "error": f"{error_prefix}: missing {e}"
+                }), 400
+            except ValueError as e:
+                return jsonify({
+                    "error": f"{error_prefix}: {str(e)}"
+                }), 400
+            except Exception as e:
+                logger.exception(error_prefix)
+                return jsonify({
+                    "error": f"{error_prefix}: {str(e)}"
+                }), 500
+        return wrapper
+    return decorator
 
 def register_modbus_routes(app):
     """Register Modbus routes with the Flask app"""
     
     @app.route('/api/modbus/configure', methods=['POST'])
+    @_api("Error configuring Modbus master")
     def modbus_configure():
         """
         Configure the Modbus master
         Expects a YAML or JSON payload with configuration
         """
-        global MODBUS_MASTER
+        # Parse request data
+        if request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
+            config = yaml.load(request.data, Loader=YamlLoader)
+        elif request.content_type == 'application/json':
+            config = request.json
+        else:
+            return jsonify({
+                "error": "Content-Type must be application/x-yaml, text/yaml, or application/json"
+            }), 400
         
-        try:
-            # Parse request data
-            if request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
-                config = yaml.safe_load(request.data)
-            elif request.content_type == 'application/json':
-                config = request.json
-            else:
-                return jsonify({
-                    "error": "Content-Type must be application/x-yaml, text/yaml, or application/json"
-                }), 400
-            
-            # Create a new ModbusMaster with the configuration
-            MODBUS_MASTER = ModbusMaster(config)
-            
-            # Connect to all slaves
-            MODBUS_MASTER.connect_all()
-            
-            # Start scanning
-            MODBUS_MASTER.start_scanning()
-            
+        # Skip identical reconfiguration of a running master
+        config_hash = _content_hash(config)
+        current = HANDLE.ref
+        if current is not None and current.running and current._config_hash == config_hash:
             return jsonify({
                 "success": True,
-                "message": "Modbus master configured and started",
-                "slave_count": len(MODBUS_MASTER.tags)
+                "message": "Modbus master configuration unchanged",
+                "slave_count": len(current.tags),
+                "cached": True
             })
         
-        except Exception as e:
-            return jsonify({
-                "error": f"Error configuring Modbus master: {str(e)}"
-            }), 500
+        # Create a new ModbusMaster with the configuration
+        master = ModbusMaster(config)
+        master._config_hash = config_hash
+        
+        # Release the threads and sockets of the master being replaced
+        if current is not None:
+            current.shutdown()
+        HANDLE.ref = master
+        
+        # Connect to all slaves
+        master.connect_all()
+        
+        # Start scanning
+        master.start_scanning()
+        
+        return jsonify({
+            "success": True,
+            "message": "Modbus master configured and started",
+            "slave_count": len(master.tags)
+        })
     
     @app.route('/api/modbus/status', methods=['GET'])
+    @_api("Error getting Modbus status")
     def modbus_status():
         """Get the status of the Modbus master"""
-        global MODBUS_MASTER
-        
-        if not MODBUS_MASTER:
-            return jsonify({
-                "error": "Modbus master not configured"
-            }), 404
-        
-        try:
-            # Get status information
-            status = {
-                "running": MODBUS_MASTER.running,
-                "slave_count": len(MODBUS_MASTER.tags),
-                "slaves": list(MODBUS_MASTER.tags.keys())
-            }
-            
-            return jsonify({
-                "success": True,
-                "status": status
-            })
-        
-        except Exception as e:
-            return jsonify({
-                "error": f"Error getting Modbus status: {str(e)}"
-            }), 500
+        master = HANDLE.get()
+        
+        # Get status information
+        status = {
+            "running": master.running,
+            "slave_count": len(master.tags),
+            "slaves": list(master.tags.keys())
+        }
+        
+        return jsonify({
+            "success": True,
+            "status": status
+        })
     
     @app.route('/api/modbus/stop', methods=['POST'])
+    @_api("Error stopping Modbus master")
     def modbus_stop():
         """Stop the Modbus master"""
-        global MODBUS_MASTER
+        master = HANDLE.get()
         
-        if not MODBUS_MASTER:
-            return jsonify({
-                "error": "Modbus master not configured"
-            }), 404
+        # Stop scanning
+        master.stop_scanning()
         
-        try:
-            # Stop scanning
-            MODBUS_MASTER.stop_scanning()
-            
-            # Disconnect from all slaves
-            MODBUS_MASTER.disconnect_all()
-            
-            return jsonify({
-                "success": True,
-                "message": "Modbus master stopped"
-            })
+        # Disconnect from all slaves
+        master.disconnect_all()
         
-        except Exception as e:
-            return jsonify({
-                "error": f"Error stopping Modbus master: {str(e)}"
-            }), 500
+        return jsonify({
+            "success": True,
+            "message": "Modbus master stopped"
+        })
     
     @app.route('/api/modbus/slaves', methods=['GET'])
+    @_api("Error getting Modbus slaves")
     def get_modbus_slaves():
         """Get all configured Modbus slaves"""
-        global MODBUS_MASTER
-        
-        if not MODBUS_MASTER:
-            return jsonify({
-                "error": "Modbus master not configured"
-            }), 404
-        
-        try:
-            return jsonify({
-                "success": True,
-                "slaves": MODBUS_MASTER.tags
-            })
+        master = HANDLE.get()
         
-        except Exception as e:
-            return jsonify({
-                "error": f"Error getting Modbus slaves: {str(e)}"
-            }), 500
+        return jsonify({
+            "success": True,
+            "slaves": master.tags
+        })
     
     @app.route('/api/modbus/slaves/<slave_name>', methods=['GET'])
+    @_api("Error getting Modbus slave")
     def get_modbus_slave(slave_name):
         """Get a specific Modbus slave by name"""
-        global MODBUS_MASTER
+        master = HANDLE.get()
         
-        if not MODBUS_MASTER:
+        # Check if slave exists
+        if slave_name not in master.tags:
             return jsonify({
-                "error": "Modbus master not configured"
+                "error": f"Slave not found: {slave_name}"
             }), 404
         
-        try:
-            # Check if slave exists
-            if slave_name not in MODBUS_MASTER.tags:
-                return jsonify({
-                    "error": f"Slave not found: {slave_name}"
-                }), 404
-            
-            return jsonify({
-                "success": True,
-                "slave": MODBUS_MASTER.tags[slave_name]
-            })
-        
-        except Exception as e:
-            return jsonify({
-                "error": f"Error getting Modbus slave: {str(e)}"
-            }), 500
+        return app.response_class(
+            _cached_slave_body(master, slave_name, app.json.dumps),
+            mimetype='application/json'
+        )
     
     @app.route('/api/modbus/values', methods=['GET'])
+    @_api("Error getting Modbus values")
     def get_modbus_values():
         """Get all Modbus tag values"""
-        global MODBUS_MASTER
-        
-        if not MODBUS_MASTER:
-            return jsonify({
-                "error": "Modbus master not configured"
-            }), 404
-        
-        try:
-            return jsonify({
-                "success": True,
-                "values": MODBUS_MASTER.get_all_tag_values()
-            })
+        master = HANDLE.get()
         
-        except Exception as e:
-            return jsonify({
-                "error": f"Error getting Modbus values: {str(e)}"
-            }), 500
+        return jsonify({
+            "success": True,
+            "values": master.get_all_tag_values()
+        })
     
     @app.route('/api/modbus/values/<slave_name>', methods=['GET'])
+    @_api("Error getting Modbus value")
     def get_modbus_value(slave_name):
         """Get a specific Modbus tag value by slave name"""
-        global MODBUS_MASTER
+        master = HANDLE.get()
         
-        if not MODBUS_MASTER:
+        # Check if slave exists
+        if slave_name not in master.tags:
             return jsonify({
-                "error": "Modbus master not configured"
+                "error": f"Slave not found: {slave_name}"
             }), 404
         
-        try:
-            # Check if slave exists
-            if slave_name not in MODBUS_MASTER.tags:
+        value = master.get_tag_value(slave_name)
+        
+        return jsonify({
+            "success": True,
+            "slave_name": slave_name,
+            "value": value
+        })
+    
+    @app.route('/api/modbus/values:batch', methods=['GET', 'POST'])
+    @_api("Error getting Modbus values")
+    def get_modbus_values_batch():
+        """
+        Get the values of several Modbus slaves in one streamed NDJSON response
+        Slave names come from ?names=a,b,c or a JSON list in the request body
+        """
+        master = HANDLE.get()
+        
+        if request.is_json:
+            names = request.get_json(cache=False)
+            if not isinstance(names, list):
                 return jsonify({
-                    "error": f"Slave not found: {slave_name}"
-                }), 404
-            
-            value = MODBUS_MASTER.get_tag_value(slave_name)
-            
-            return jsonify({
-                "success": True,
-                "slave_name": slave_name,
-                "value": value
-            })
+                    "error": "JSON body must be a list of slave names"
+                }), 400
+        else:
+            names = [name for name in request.args.get('names', '').split(',') if name]
         
-        except Exception as e:
+        if not names:
             return jsonify({
-                "error": f"Error getting Modbus value: {str(e)}"
-            }), 500
+                "error": "No slave names given"
+            }), 400
+        
+        # Snapshot the state now, the generator runs after the view returns
+        tags = master.tags
+        tag_values = master.get_all_tag_values()
+        dumps = app.json.dumps
+        
+        def generate():
+            for slave_name in dict.fromkeys(names):
+                if slave_name in tags:
+                    line = {
+                        "success": True,
+                        "slave_name": slave_name,
+                        "value": tag_values.get(slave_name)
+                    }
+                else:
+                    line = {
+                        "slave_name": slave_name,
+                        "error": f"Slave not found: {slave_name}"
+                    }
+                yield dumps(line) + '\n'
+        
+        return Response(generate(), mimetype='application/x-ndjson')
     
     @app.route('/api/modbus/write/<slave_name>', methods=['POST'])
+    @_api("Error writing Modbus value")
     def write_modbus_value(slave_name):
         """Write a value to a Modbus slave"""
-        global MODBUS_MASTER
+        master = HANDLE.get()
         
-        if not MODBUS_MASTER:
+        # Check if slave exists
+        if slave_name not in master.tags:
             return jsonify({
-                "error": "Modbus master not configured"
+                "error": f"Slave not found: {slave_name}"
             }), 404
         
+        # Parse request data, JSON first since writes only carry {"value": x}
+        if request.is_json:
+            data = request.get_json(cache=False)
+        elif request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
+            data = yaml.load(request.data, Loader=YamlLoader)
+        else:
+            return jsonify({
+                "error": "Content-Type must be application/x-yaml, text/yaml, or application/json"
+            }), 400
+        
+        # Check for required fields
+        if not isinstance(data, dict) or 'value' not in data:
+            return jsonify({
+                "error": "Missing required field: value"
+            }), 400
+        
+        # Queue the write on the slave's writer thread
+        future = master.submit_write(slave_name, data['value'])
+        
         try:
-            # Check if slave exists
-            if slave_name not in MODBUS_MASTER.tags:
-                return jsonify({
-                    "error": f"Slave not found: {slave_name}"
-                }), 404
-            
-            # Parse request data
-            if request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
-                data = yaml.safe_load(request.data)
-            elif request.content_type == 'application/json':
-                data = request.json
-            else:
-                return jsonify({
-                    "error": "Content-Type must be application/x-yaml, text/yaml, or application/json"
-                }), 400
-            
-            # Check for required fields
-            if 'value' not in data:
-                return jsonify({
-                    "error": "Missing required field: value"
-                }), 400
-            
-            # Get slave configuration
-            slave_config = MODBUS_MASTER.tags[slave_name]
-            
-            # Write the value
-            success = MODBUS_MASTER.write_data(
-                slave_name=slave_name,
-                address=int(slave_config['address']),
-                value=data['value'],
-                unit=int(slave_config['slave_id']),
-                datatype=slave_config['datatype'],
-                conversion=slave_config['conversion']
-            )
-            
-            if success:
-                return jsonify({
-                    "success": True,
-                    "message": f"Value written to {slave_name}"
-                })
-            else:
-                return jsonify({
-                    "error": f"Failed to write value to {slave_name}"
-                }), 500
+            success = future.result(timeout=WRITE_TIMEOUT)
+        except FutureTimeoutError:
+            # Don't let the write run later if it hasn't started yet
+            future.cancel()
+            return jsonify({
+                "error": f"Timed out writing value to {slave_name}"
+            }), 504
         
-        except Exception as e:
+        if success:
             return jsonify({
-                "error": f"Error writing Modbus value: {str(e)}"
+                "success": True,
+                "message": f"Value written to {slave_name}"
+            })
+        else:
+            return jsonify({
+                "error": f"Failed to write value to {slave_name}"
             }), 500
     
     @app.route('/api/modbus/add-slave', methods=['POST'])
+    @_api("Error adding Modbus slave")
     def add_modbus_slave():
         """Add a new Modbus slave"""
-        global MODBUS_MASTER
-        
-        if not MODBUS_MASTER:
-            # Create a new ModbusMaster if it doesn't exist
-            MODBUS_MASTER = ModbusMaster()
-        
-        try:
-            # Parse request data
-            if request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
-                slave_config = yaml.safe_load(request.data)
-            elif request.content_type == 'application/json':
-                slave_config = request.json
-            else:
-                return jsonify({
-                    "error": "Content-Type must be application/x-yaml, text/yaml, or application/json"
-                }), 400
-            
-            # Check for required fields
-            required_fields = ['slave_name', 'ip_address']
-            for field in required_fields:
-                if field not in slave_config:
-                    return jsonify({
-                        "error": f"Missing required field: {field}"
-                    }), 400
-            
-            # Process the slave configuration
-            MODBUS_MASTER._process_slave_config(slave_config)
-            
+        # Create a new ModbusMaster if it doesn't exist
+        master = HANDLE.get_or_create()
+        
+        # Parse request data
+        if request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
+            slave_config = yaml.load(request.data, Loader=YamlLoader)
+        elif request.content_type == 'application/json':
+            slave_config = request.json
+        else:
             return jsonify({
-                "success": True,
-                "message": f"Slave {slave_config['slave_name']} added"
-            })
+                "error": "Content-Type must be application/x-yaml, text/yaml, or application/json"
+            }), 400
         
-        except Exception as e:
+        # Check for required fields
+        if not isinstance(slave_config, dict):
             return jsonify({
-                "error": f"Error adding Modbus slave: {str(e)}"
-            }), 500
+                "error": f"Missing required fields: {', '.join(sorted(SLAVE_REQUIRED_FIELDS))}"
+            }), 400
+        missing = SLAVE_REQUIRED_FIELDS - slave_config.keys()
+        if missing:
+            return jsonify({
+                "error": f"Missing required fields: {', '.join(sorted(missing))}"
+            }), 400
+        
+        # Process the slave configuration
+        master._process_slave_config(slave_config)
+        
+        # The tags no longer match the last configuration or import
+        master._config_hash = None
+        master._last_import_hash = None
+        
+        return jsonify({
+            "success": True,
+            "message": f"Slave {slave_config['slave_name']} added"
+        })
     
     @app.route('/api/modbus/remove-slave/<slave_name>', methods=['DELETE'])
+    @_api("Error removing Modbus slave")
     def remove_modbus_slave(slave_name):
         """Remove a Modbus slave"""
-        global MODBUS_MASTER
+        master = HANDLE.get()
         
-        if not MODBUS_MASTER:
+        # Check if slave exists
+        if slave_name not in master.tags:
             return jsonify({
-                "error": "Modbus master not configured"
+                "error": f"Slave not found: {slave_name}"
             }), 404
         
-        try:
-            # Check if slave exists
-            if slave_name not in MODBUS_MASTER.tags:
-                return jsonify({
-                    "error": f"Slave not found: {slave_name}"
-                }), 404
-            
-            # Disconnect client if it exists
-            if slave_name in MODBUS_MASTER.clients:
-                MODBUS_MASTER.clients[slave_name].close()
-                del MODBUS_MASTER.clients[slave_name]
-            
-            # Remove from tags
-            del MODBUS_MASTER.tags[slave_name]
-            
-            # Save to CSV
-            MODBUS_MASTER._save_to_csv()
-            
-            return jsonify({
-                "success": True,
-                "message": f"Slave {slave_name} removed"
-            })
+        # Disconnect the client, remove the tags and record the removal in the journal
+        master.remove_slave(slave_name)
         
-        except Exception as e:
-            return jsonify({
-                "error": f"Error removing Modbus slave: {str(e)}"
-            }), 500
+        # The tags no longer match the last configuration or import
+        master._config_hash = None
+        master._last_import_hash = None
+        
+        return jsonify({
+            "success": True,
+            "message": f"Slave {slave_name} removed"
+        })
     
     @app.route('/api/modbus/export-csv', methods=['GET'])
+    @_api("Error exporting CSV")
     def export_modbus_csv():
         """Export Modbus configuration as CSV"""
-        global MODBUS_MASTER
+        master = HANDLE.get()
         
-        if not MODBUS_MASTER:
-            return jsonify({
-                "error": "Modbus master not configured"
-            }), 404
+        # Create a CSV string
+        csv_output = StringIO()
+        writer = csv.writer(csv_output)
+        writer.writerow(CSV_HEADERS)
+        writer.writerows(master.csv_rows())
         
-        try:
-            # Create a CSV string
-            csv_output = StringIO()
-            writer = csv.DictWriter(csv_output, fieldnames=CSV_HEADERS)
-            writer.writeheader()
-            
-            for slave_name, tag in MODBUS_MASTER.tags.items():
-                writer.writerow(tag)
-            
-            # Return as a file download
-            csv_output.seek(0)
-            
-            return csv_output.getvalue(), 200, {
-                'Content-Type': 'text/csv',
-                'Content-Disposition': 'attachment; filename=modbus_config.csv'
-            }
-        
-        except Exception as e:
-            return jsonify({
-                "error": f"Error exporting CSV: {str(e)}"
-            }), 500
+        # Return as a file download
+        csv_output.seek(0)
+        
+        return csv_output.getvalue(), 200, {
+            'Content-Type': 'text/csv',
+            'Content-Disposition': 'attachment; filename=modbus_config.csv'
+        }
     
     @app.route('/api/modbus/import-csv', methods=['POST'])
+    @_api("Error importing CSV")
     def import_modbus_csv():
         """Import Modbus configuration from CSV"""
-        global MODBUS_MASTER
+        # Check if file was uploaded
+        if 'file' not in request.files:
+            return jsonify({
+                "error": "No file part in the request"
+            }), 400
         
-        try:
-            # Check if file was uploaded
-            if 'file' not in request.files:
-                return jsonify({
-                    "error": "No file part in the request"
-                }), 400
-            
-            file = request.files['file']
-            
-            if file.filename == '':
-                return jsonify({
-                    "error": "No file selected"
-                }), 400
-            
-            if not file.filename.endswith('.csv'):
-                return jsonify({
-                    "error": "File must be CSV format"
-                }), 400
-            
-            # Create a new ModbusMaster if it doesn't exist
-            if not MODBUS_MASTER:
-                MODBUS_MASTER = ModbusMaster()
-            
-            # Read CSV file
-            csv_content = file.read().decode('utf-8')
-            csv_file = StringIO(csv_content)
-            reader = csv.DictReader(csv_file)
-            
-            # Process each row as a slave configuration
-            for row in reader:
-                MODBUS_MASTER._process_slave_config(row)
-            
-            # Connect to all slaves
-            MODBUS_MASTER.connect_all()
-            
-            # Start scanning if not already running
-            if not MODBUS_MASTER.running:
-                MODBUS_MASTER.start_scanning()
-            
+        file = request.files['file']
+        
+        if file.filename == '':
+            return jsonify({
+                "error": "No file selected"
+            }), 400
+        
+        if not file.filename.endswith('.csv'):
+            return jsonify({
+                "error": "File must be CSV format"
+            }), 400
+        
+        # Create a new ModbusMaster if it doesn't exist
+        master = HANDLE.get_or_create()
+        
+        # Read CSV file
+        csv_content = file.read().decode('utf-8')
+        
+        # Skip re-importing the same CSV into a running master
+        import_hash = _content_hash(csv_content)
+        if master.running and master._last_import_hash == import_hash:
             return jsonify({
                 "success": True,
-                "message": f"Imported {len(MODBUS_MASTER.tags)} slaves from CSV"
+                "message": "CSV unchanged, import skipped",
+                "cached": True
             })
         
-        except Exception as e:
-            return jsonify({
-                "error": f"Error importing CSV: {str(e)}"
-            }), 500
+        # The tags no longer match the last configuration
+        master._config_hash = None
+        
+        csv_file = StringIO(csv_content)
+        reader = csv.DictReader(csv_file)
+        
+        # Process each row as a slave configuration
+        for row in reader:
+            master._process_slave_config(row)
+        
+        # Connect to all slaves
+        master.connect_all()
+        
+        # Start scanning if not already running
+        if not master.running:
+            master.start_scanning()
+        
+        master._last_import_hash = import_hash
+        
+        return jsonify({
+            "success": True,
+            "message": f"Imported {len(master.tags)} slaves from CSV"
+        })
@@ -1,7 +1,14 @@
 # models.py
 from typing import Optional, Dict, Any
 from sqlmodel import Field, SQLModel, create_engine
+from sqlalchemy import event
 import os
+import functools
+import hashlib
+import hmac
+import secrets
+import threading
+import time
 import bcrypt # For password hashing
 import logging
 from asyncua import ua # For VariantType reference
@@ -9,6 +16,7 @@ from asyncua import ua # For VariantType reference
 _logger = logging.getLogger(__name__)
 
 # Helper to map string to VariantType (moved here for broader access if needed)
+@functools.lru_cache(maxsize=64)
 def get_variant_type(type_str: str) -> ua.VariantType:
     try:
         return getattr(ua.VariantType, type_str.upper())
@@ -16,6 +24,41 @@ def get_variant_type(type_str: str) -> ua.VariantType:
         _logger.warning(f"Unknown data type: {type_str}. Defaulting to String.")
         return ua.VariantType.String
 
+# bcrypt work factor used when hashing new passwords
+BCRYPT_ROUNDS = 12
+
+# Successful bcrypt checks keyed by (stored hash, HMAC of the password under a per-process
+# random key), so repeated authentication with the same credentials skips the deliberately
+# slow hash without keeping plaintext passwords or bare digests in memory. Entries expire
+# after _VERIFY_CACHE_TTL seconds; failed attempts are never cached and stay slow.
+_VERIFY_CACHE: Dict[tuple, float] = {}
+_VERIFY_CACHE_SIZE = 256
+_VERIFY_CACHE_TTL = 300
+_VERIFY_CACHE_KEY = secrets.token_bytes(32)
+_VERIFY_CACHE_LOCK = threading.Lock()
+
+def _cached_verify(password_hash: str, password: str) -> bool:
+    digest = hmac.new(_VERIFY_CACHE_KEY, password.encode('utf-8'), hashlib.sha256).digest()
+    key = (password_hash, digest)
+    now = time.monotonic()
+    with _VERIFY_CACHE_LOCK:
+        expiry = _VERIFY_CACHE.get(key)
+        if expiry is not None:
+            if expiry > now:
+                return True
+            _VERIFY_CACHE.pop(key, None)
+    if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+        return False
+    with _VERIFY_CACHE_LOCK:
+        if len(_VERIFY_CACHE) >= _VERIFY_CACHE_SIZE:
+            _VERIFY_CACHE.pop(next(iter(_VERIFY_CACHE)), None)
+        _VERIFY_CACHE[key] = now + _VERIFY_CACHE_TTL
+    return True
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    """Returns the bcrypt hash of a password. Pure and CPU-bound, so safe to run in a worker thread."""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
 class ServerConfig(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     enable_service: bool = Field(default=True)
@@ -45,17 +88,20 @@ class ServerConfig(SQLModel, table=True):
     registration_interval_seconds: int = Field(default=300)
 
     # Method to hash a password
-    def set_password(self, password: str):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    def set_password(self, password: str, rounds: int = BCRYPT_ROUNDS):
+        self.password_hash = hash_password(password, rounds)
+        with _VERIFY_CACHE_LOCK:
+            _VERIFY_CACHE.clear() # Drop results cached for the previous hash
 
     # Method to verify a password
     def verify_password(self, password: str) -> bool:
         if self.password_hash is None:
             return False
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return _cached_verify(self.password_hash, password)
 
-class OpcUaNode(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
+# Node columns without the primary key; validating against this plain model skips the
+# SQLAlchemy instance bookkeeping of the table model, e.g. for bulk imports
+class OpcUaNodeBase(SQLModel):
     name: str
     node_id: str = Field(unique=True, index=True) # NodeId on the GATEWAY's server
     data_type: str # e.g., "Double", "Int32", "Boolean", "String"
@@ -76,33 +122,57 @@ class OpcUaNode(SQLModel, table=True):
     opcua_client_security_mode: Optional[str] = Field(default="None", description="e.g., 'None', 'Sign', 'SignAndEncrypt'")
     opcua_client_security_policy: Optional[str] = Field(default="None", description="e.g., 'None', 'Basic256Sha256'")
 
+class OpcUaNode(OpcUaNodeBase, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+
 
 # Database engine setup
 sqlite_file_name = "database.db"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
-engine = create_engine(sqlite_url, echo=False) # echo=True for SQL logs
+# FastAPI runs sync endpoints in a threadpool (40 threads by default), so connections are
+# shared across threads and the pool is sized so those threads never queue for a connection
+engine = create_engine(
+    sqlite_url,
+    echo=False, # echo=True for SQL logs
+    connect_args={"check_same_thread": False},
+    pool_size=20,
+    max_overflow=20,
+    pool_pre_ping=True,
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL journaling and memory-mapped reads on every new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.close()
 
 def create_db_and_tables():
     """Creates database tables based on SQLModel definitions."""
     SQLModel.metadata.create_all(engine)
 
+# Converters from stored initial value strings to Python values, keyed by VariantType
+_TYPE_CONVERTERS = {
+    ua.VariantType.Double: float,
+    ua.VariantType.Int32: int,
+    ua.VariantType.Boolean: lambda s: s.lower() == 'true' or s == '1',
+    ua.VariantType.String: str,
+    # Add more conversions as needed
+}
+
 # Helper function to get initial value in correct type for OPC UA Server
 def get_initial_value_typed(value_str: Optional[str], data_type_str: str) -> Any:
     if value_str is None:
         return None # Let asyncua handle default for None
 
-    variant_type = get_variant_type(data_type_str)
-    try:
-        if variant_type == ua.VariantType.Double:
-            return float(value_str)
-        elif variant_type == ua.VariantType.Int32:
-            return int(value_str)
-        elif variant_type == ua.VariantType.Boolean:
-            return value_str.lower() == 'true' or value_str == '1'
-        elif variant_type == ua.VariantType.String:
-            return str(value_str)
-        # Add more conversions as needed
+    converter = _TYPE_CONVERTERS.get(get_variant_type(data_type_str))
+    if converter is None:
         return value_str # Fallback
+    try:
+        return converter(value_str)
     except (ValueError, TypeError) as e:
         _logger.error(f"Failed to convert initial value '{value_str}' to {data_type_str}: {e}. Returning original string.")
         return value_str
\ No newline at end of file
@@ -1,6 +1,8 @@
 # main.py
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request
 from fastapi.responses import Response
+from sqlalchemy import bindparam, exists, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select, delete
 import logging
@@ -8,21 +10,46 @@ import asyncio
 import os
 import bcrypt
 import yaml # pip install PyYAML
+try:
+    # libyaml-backed parser/emitter; same safe YAML semantics, implemented in C
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
 import io # For in-memory file operations for export
+import json
+try:
+    import orjson # Optional: faster JSON export when installed
+except ImportError:
+    orjson = None
+try:
+    from watchfiles import awatch # Optional: filesystem events instead of polling for the CSV file
+except ImportError:
+    awatch = None
 import subprocess
 import sys
 import signal
 import time
+import threading
 from contextlib import asynccontextmanager
 from pydantic import BaseModel # Moved Pydantic import earlier
 
-from models import create_db_and_tables, ServerConfig, OpcUaNode, engine
+from models import create_db_and_tables, ServerConfig, OpcUaNode, OpcUaNodeBase, engine, hash_password
 from typing import List, Dict, Any, Optional
 
 _logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-running_opcua_subprocesses = []
+running_opcua_subprocesses = [] # asyncio.subprocess.Process handles
+
+# Platform specifics for managed subprocesses, resolved once at import
+if os.name == 'nt':
+    _CREATION_FLAGS = subprocess.CREATE_NEW_PROCESS_GROUP
+    def _terminate_process(process):
+        process.send_signal(signal.CTRL_BREAK_EVENT) # For Windows, to allow graceful shutdown if handled
+else:
+    _CREATION_FLAGS = 0
+    def _terminate_process(process):
+        process.terminate() # SIGTERM
 
 # Global list to keep track of running OPC UA related subprocesses
 
@@ -31,6 +58,14 @@ def get_db():
     with Session(engine) as session:
         yield session
 
+def _dump_json(data) -> bytes:
+    """Serializes plain Python data to JSON bytes, with orjson when it is installed."""
+    return orjson.dumps(data) if orjson else json.dumps(data).encode("utf-8")
+
+def _load_json(stream):
+    """Parses a binary JSON stream, with orjson when it is installed."""
+    return orjson.loads(stream.read()) if orjson else json.load(stream)
+
 # New functions for OPC UA components management
 
 def write_opcua_client_config(config_data: dict, output_path: str):
@@ -38,14 +73,14 @@ def write_opcua_client_config(config_data: dict, output_path: str):
     try:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         with open(output_path, 'w') as f:
-            yaml.dump(config_data, f, sort_keys=False)
+            yaml.dump(config_data, f, Dumper=YamlDumper, sort_keys=False)
         _logger.info(f"OPC UA client configuration written to {output_path}")
         return True
     except Exception as e:
         _logger.error(f"Failed to write OPC UA client configuration to {output_path}: {e}")
         return False
 
-def start_opcua_gateway_client(client_settings: dict):
+async def start_opcua_gateway_client(client_settings: dict):
     """Starts the opcua_gateway_client.py script as a subprocess."""
     if not client_settings.get("enabled", False):
         _logger.info("OPC UA Gateway Client is disabled in configuration.")
@@ -69,7 +104,7 @@ def start_opcua_gateway_client(client_settings: dict):
     
     try:
         _logger.info(f"Starting OPC UA Gateway Client: {script_path}")
-        process = subprocess.Popen([sys.executable, script_path], creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0)
+        process = await asyncio.create_subprocess_exec(sys.executable, script_path, creationflags=_CREATION_FLAGS)
         running_opcua_subprocesses.append(process)
         _logger.info(f"OPC UA Gateway Client started with PID: {process.pid}")
         return process
@@ -77,7 +112,16 @@ def start_opcua_gateway_client(client_settings: dict):
         _logger.error(f"Failed to start OPC UA Gateway Client: {e}")
         return None
 
-def start_opcua_csv_data_server(server_settings: dict):
+# Command line flags of opcua_csv_data_server.py and the settings keys that supply them
+_CSV_SERVER_ARGS = (
+    ("--url", "url"),
+    ("--ns_uri", "namespace_uri"),
+    ("--csv_file", "csv_file_path"),
+    ("--interval", "update_interval_seconds"),
+    ("--log_level", "log_level"),
+)
+
+async def start_opcua_csv_data_server(server_settings: dict):
     """Starts the opcua_csv_data_server.py script as a subprocess."""
     if not server_settings.get("enabled", False):
         _logger.info("OPC UA CSV Data Server is disabled in configuration.")
@@ -89,20 +133,14 @@ def start_opcua_csv_data_server(server_settings: dict):
         return None
 
     cmd = [sys.executable, script_path]
-    if server_settings.get("url"):
-        cmd.extend(["--url", server_settings["url"]])
-    if server_settings.get("namespace_uri"):
-        cmd.extend(["--ns_uri", server_settings["namespace_uri"]])
-    if server_settings.get("csv_file_path"):
-        cmd.extend(["--csv_file", server_settings["csv_file_path"]])
-    if server_settings.get("update_interval_seconds"):
-        cmd.extend(["--interval", str(server_settings["update_interval_seconds"])])
-    if server_settings.get("log_level"):
-        cmd.extend(["--log_level", server_settings["log_level"]])
+    for flag, key in _CSV_SERVER_ARGS:
+        value = server_settings.get(key)
+        if value:
+            cmd.extend((flag, str(value)))
 
     try:
         _logger.info(f"Starting OPC UA CSV Data Server: {' '.join(cmd)}")
-        process = subprocess.Popen(cmd, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0)
+        process = await asyncio.create_subprocess_exec(*cmd, creationflags=_CREATION_FLAGS)
         running_opcua_subprocesses.append(process)
         _logger.info(f"OPC UA CSV Data Server started with PID: {process.pid}")
         return process
@@ -110,24 +148,31 @@ def start_opcua_csv_data_server(server_settings: dict):
         _logger.error(f"Failed to start OPC UA CSV Data Server: {e}")
         return None
 
-def shutdown_opcua_subprocesses():
+async def shutdown_opcua_subprocesses():
     _logger.info("Shutting down OPC UA subprocesses...")
-    for process in running_opcua_subprocesses:
-        if process.poll() is None: # Check if process is still running
-            _logger.info(f"Terminating process {process.pid}...")
-            if os.name == 'nt':
-                process.send_signal(signal.CTRL_BREAK_EVENT) # For Windows, to allow graceful shutdown if handled
-            else:
-                process.terminate() # SIGTERM
-            try:
-                process.wait(timeout=10) # Wait for graceful termination
-                _logger.info(f"Process {process.pid} terminated gracefully.")
-            except subprocess.TimeoutExpired:
-                _logger.warning(f"Process {process.pid} did not terminate gracefully, killing.")
-                process.kill()
-                _logger.info(f"Process {process.pid} killed.")
-            except Exception as e:
-                 _logger.error(f"Error during termination of {process.pid}: {e}")
+    live_processes = [process for process in running_opcua_subprocesses if process.returncode is None] # Still running
+    for process in live_processes:
+        _logger.info(f"Terminating process {process.pid}...")
+        try:
+            _terminate_process(process)
+        except ProcessLookupError:
+            pass # Exited on its own since the check above; wait() below reaps it
+
+    # Wait for all processes at once, so shutdown takes as long as the slowest one rather than the sum
+    results = await asyncio.gather(
+        *(asyncio.wait_for(process.wait(), timeout=10) for process in live_processes), # Wait for graceful termination
+        return_exceptions=True
+    )
+    for process, result in zip(live_processes, results):
+        if isinstance(result, asyncio.TimeoutError):
+            _logger.warning(f"Process {process.pid} did not terminate gracefully, killing.")
+            process.kill()
+            await process.wait() # Reap it so callers can rely on it having exited
+            _logger.info(f"Process {process.pid} killed.")
+        elif isinstance(result, Exception):
+            _logger.error(f"Error during termination of {process.pid}: {result}")
+        else:
+            _logger.info(f"Process {process.pid} terminated gracefully.")
     running_opcua_subprocesses.clear()
     _logger.info("OPC UA subprocess shutdown complete.")
 
@@ -152,10 +197,53 @@ class CsvDataServerSettings(BaseModel):
     update_interval_seconds: int = 10
     log_level: str = "INFO"
 
+class NodeBatchRequest(BaseModel):
+    creates: List[OpcUaNode] = []
+    updates: Dict[str, OpcUaNode] = {} # Keyed by the Node ID in the URL of the equivalent PUT
+    deletes: List[str] = []
+
 class OpcUaComponentsStartRequest(BaseModel):
     gateway_client_settings: Optional[GatewayClientSettings] = None
     csv_data_server_settings: Optional[CsvDataServerSettings] = None
 
+def _csv_file_ready(csv_file_path: str) -> bool:
+    return os.path.exists(csv_file_path) and os.path.getsize(csv_file_path) > 0
+
+async def _wait_for_csv_file(csv_file_path: str, timeout_seconds: float) -> bool:
+    """Waits until the CSV file exists and is non-empty, returning as soon as it is ready.
+
+    Uses filesystem change events when watchfiles is installed; otherwise polls with a
+    short interval that backs off, so a file that appears quickly is picked up in ms.
+    """
+    if _csv_file_ready(csv_file_path):
+        _logger.info(f"CSV file {csv_file_path} is ready.")
+        return True
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_seconds
+    watch_dir = os.path.dirname(os.path.abspath(csv_file_path))
+
+    if awatch is not None and os.path.isdir(watch_dir):
+        stop_event = asyncio.Event()
+        stop_handle = loop.call_at(deadline, stop_event.set)
+        try:
+            # yield_on_timeout re-checks the file at least every 2s in case an event was missed
+            async for _ in awatch(watch_dir, stop_event=stop_event, rust_timeout=2000, yield_on_timeout=True):
+                if _csv_file_ready(csv_file_path):
+                    break
+        finally:
+            stop_handle.cancel()
+    else:
+        delay = 0.05
+        while not _csv_file_ready(csv_file_path) and loop.time() < deadline:
+            await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+            delay = min(delay * 2, 2)
+
+    csv_ready = _csv_file_ready(csv_file_path)
+    if csv_ready:
+        _logger.info(f"CSV file {csv_file_path} is ready.")
+    return csv_ready
+
 async def _start_csv_server_with_delay_logic(csv_server_settings_dict: dict, gateway_client_was_started: bool):
     """Helper async function to handle delayed start of CSV server."""
     csv_file_path = csv_server_settings_dict.get("csv_file_path")
@@ -171,39 +259,74 @@ async def _start_csv_server_with_delay_logic(csv_server_settings_dict: dict, gat
         return False
 
     _logger.info(f"Waiting for OPC UA Gateway Client to create/populate CSV file: {csv_file_path}")
-    csv_ready = False
     max_wait_time_seconds = csv_server_settings_dict.get("wait_for_csv_timeout", 30)  # Allow timeout to be configurable
-    check_interval_seconds = 2
-    wait_time_elapsed = 0
-    
-    while wait_time_elapsed < max_wait_time_seconds:
-        if os.path.exists(csv_file_path) and os.path.getsize(csv_file_path) > 0:
-            _logger.info(f"CSV file {csv_file_path} is ready.")
-            csv_ready = True
-            break
-        _logger.info(f"CSV file {csv_file_path} not ready yet. Waiting {check_interval_seconds}s... ({wait_time_elapsed}/{max_wait_time_seconds}s)")
-        await asyncio.sleep(check_interval_seconds)
-        wait_time_elapsed += check_interval_seconds
+    csv_ready = await _wait_for_csv_file(csv_file_path, max_wait_time_seconds)
     
     if csv_ready:
-        start_opcua_csv_data_server(csv_server_settings_dict)
+        await start_opcua_csv_data_server(csv_server_settings_dict)
         return True
     else:
         _logger.error(f"CSV file {csv_file_path} was not ready after {max_wait_time_seconds} seconds. OPC UA CSV Data Server will not be started.")
         return False
 
+# Sync endpoints run concurrently in FastAPI's threadpool, so cache updates are serialized
+_server_config_lock = threading.Lock()
+
+# Statements built once at import and reused (with bound parameters) by every request
+_SELECT_SERVER_CONFIG = select(ServerConfig)
+_SELECT_ALL_NODES = select(OpcUaNode)
+_SELECT_NODE_BY_ID = select(OpcUaNode).where(OpcUaNode.node_id == bindparam("node_id"))
+_SELECT_NODES_BY_IDS = select(OpcUaNode).where(OpcUaNode.node_id.in_(bindparam("node_ids", expanding=True)))
+_NODE_ID_EXISTS = select(exists().where(OpcUaNode.node_id == bindparam("node_id")))
+
+def _get_node(db: Session, node_id: str) -> Optional[OpcUaNode]:
+    """Returns the node with the given Node ID, or None."""
+    return db.exec(_SELECT_NODE_BY_ID, params={"node_id": node_id}).one_or_none()
+
+# Bulk INSERT ... ON CONFLICT(node_id) DO UPDATE used by the full config import
+_NODE_UPSERT = sqlite_insert(OpcUaNode)
+_NODE_UPSERT = _NODE_UPSERT.on_conflict_do_update(
+    index_elements=["node_id"],
+    set_={column.name: _NODE_UPSERT.excluded[column.name] for column in OpcUaNode.__table__.columns if column.name not in ("id", "node_id")}
+)
+
+def _cache_server_config(config: Optional[ServerConfig]):
+    """Caches a detached copy of the single ServerConfig row and bumps the config version."""
+    cached = ServerConfig.model_validate(config.model_dump()) if config else None
+    with _server_config_lock:
+        app.state.server_config = cached
+        app.state.server_config_version += 1
+
+def _nodes_changed():
+    """Bumps the nodes version after any committed node change, invalidating cached exports."""
+    with _server_config_lock:
+        app.state.nodes_version += 1
+
+def _get_cached_server_config(db: Session) -> Optional[ServerConfig]:
+    """Returns the cached ServerConfig, reading it from the database only on a cache miss."""
+    if app.state.server_config is None:
+        _cache_server_config(db.exec(_SELECT_SERVER_CONFIG).first())
+    return app.state.server_config
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
     _logger.info("FastAPI application startup (lifespan)...")
     create_db_and_tables() 
+    # Load the single ServerConfig row once; endpoints refresh the cache after every change
+    app.state.server_config = None
+    app.state.server_config_version = 0
+    app.state.nodes_version = 0
+    app.state.export_cache = {} # format -> ((config version, nodes version), content)
+    with Session(engine) as session:
+        _cache_server_config(session.exec(_SELECT_SERVER_CONFIG).first())
     _logger.info("FastAPI application startup sequence complete (lifespan). OPC UA components will NOT be started automatically.")
     
     yield # FastAPI app runs here
     
     # Shutdown logic
     _logger.info("FastAPI application shutdown (lifespan)...")
-    shutdown_opcua_subprocesses() # This will stop any components started via the API
+    await shutdown_opcua_subprocesses() # This will stop any components started via the API
     _logger.info("FastAPI application shutdown complete (lifespan).")
 
 app = FastAPI(
@@ -218,16 +341,18 @@ def get_db():
         yield session
 
 # --- Server Configuration API Endpoints ---
+# Endpoints that only do blocking database work are plain `def` functions: FastAPI runs
+# them in its threadpool, so the synchronous Session calls no longer block the event loop.
 @app.get("/api/config", response_model=ServerConfig)
-async def get_server_config(db: Session = Depends(get_db)):
-    config = db.exec(select(ServerConfig)).first()
+def get_server_config(db: Session = Depends(get_db)):
+    config = _get_cached_server_config(db)
     if not config:
         raise HTTPException(status_code=404, detail="Server configuration not found.")
     return config
 
 @app.put("/api/config", response_model=ServerConfig)
-async def update_server_config(updated_config: ServerConfig, db: Session = Depends(get_db)):
-    db_config = db.exec(select(ServerConfig)).first()
+def update_server_config(updated_config: ServerConfig, db: Session = Depends(get_db)):
+    db_config = db.exec(_SELECT_SERVER_CONFIG).first()
     if not db_config:
         raise HTTPException(status_code=404, detail="Server configuration not found.")
 
@@ -254,12 +379,13 @@ async def update_server_config(updated_config: ServerConfig, db: Session = Depen
     db.add(db_config)
     db.commit()
     db.refresh(db_config)
+    _cache_server_config(db_config)
 
     return db_config
 
 @app.post("/api/server/start", status_code=status.HTTP_200_OK)
-async def start_server(db: Session = Depends(get_db)):
-    config = db.exec(select(ServerConfig)).first()
+def start_server(db: Session = Depends(get_db)):
+    config = db.exec(_SELECT_SERVER_CONFIG).first()
     if not config:
         raise HTTPException(status_code=404, detail="Server configuration not found.")
     
@@ -268,12 +394,13 @@ async def start_server(db: Session = Depends(get_db)):
     db.add(config)
     db.commit()
     db.refresh(config)
+    _cache_server_config(config)
 
     return {"message": "OPC UA Server started."}
 
 @app.post("/api/server/stop", status_code=status.HTTP_200_OK)
-async def stop_server(db: Session = Depends(get_db)):
-    config = db.exec(select(ServerConfig)).first()
+def stop_server(db: Session = Depends(get_db)):
+    config = db.exec(_SELECT_SERVER_CONFIG).first()
     if not config:
         raise HTTPException(status_code=404, detail="Server configuration not found.")
 
@@ -282,42 +409,44 @@ async def stop_server(db: Session = Depends(get_db)):
     db.add(config)
     db.commit()
     db.refresh(config)
+    _cache_server_config(config)
 
     return {"message": "OPC UA Server stopped."}
 
 # --- Node Management API Endpoints ---
 @app.get("/api/nodes", response_model=List[OpcUaNode])
-async def get_all_nodes(db: Session = Depends(get_db)):
-    nodes = db.exec(select(OpcUaNode)).all()
-    return nodes
+def get_all_nodes(db: Session = Depends(get_db)):
+    nodes = db.exec(_SELECT_ALL_NODES).all()
+    # Rows come straight from the table, so skip re-validating them against the response model
+    return Response(content=_dump_json([node.model_dump() for node in nodes]), media_type="application/json")
 
 @app.get("/api/nodes/{node_id_from_url}", response_model=OpcUaNode)
-async def get_node_by_id(node_id_from_url: str, db: Session = Depends(get_db)):
-    node = db.exec(select(OpcUaNode).where(OpcUaNode.node_id == node_id_from_url)).first()
+def get_node_by_id(node_id_from_url: str, db: Session = Depends(get_db)):
+    node = _get_node(db, node_id_from_url)
     if not node:
         raise HTTPException(status_code=404, detail="Node not found.")
     return node
 
 @app.post("/api/nodes", response_model=OpcUaNode, status_code=status.HTTP_201_CREATED)
-async def create_node(node: OpcUaNode, db: Session = Depends(get_db)):
-    # Check if node_id already exists to prevent integrity errors
-    existing_node = db.exec(select(OpcUaNode).where(OpcUaNode.node_id == node.node_id)).first()
-    if existing_node:
-        raise HTTPException(status_code=400, detail=f"Node with Node ID '{node.node_id}' already exists.")
-
+def create_node(node: OpcUaNode, db: Session = Depends(get_db)):
+    # The unique index on node_id rejects duplicates, so no lookup is needed before inserting
     try:
         db.add(node)
         db.commit()
         db.refresh(node)
+        _nodes_changed()
     except IntegrityError:
         db.rollback()
+        # Only on failure, check whether the Node ID was the conflict to report it precisely
+        if db.exec(_NODE_ID_EXISTS, params={"node_id": node.node_id}).one():
+            raise HTTPException(status_code=400, detail=f"Node with Node ID '{node.node_id}' already exists.")
         raise HTTPException(status_code=400, detail="A database integrity error occurred, possibly duplicate Node ID.")
 
     return node
 
 @app.put("/api/nodes/{node_id_from_url}", response_model=OpcUaNode)
-async def update_node(node_id_from_url: str, updated_node: OpcUaNode, db: Session = Depends(get_db)):
-    db_node = db.exec(select(OpcUaNode).where(OpcUaNode.node_id == node_id_from_url)).first()
+def update_node(node_id_from_url: str, updated_node: OpcUaNode, db: Session = Depends(get_db)):
+    db_node = _get_node(db, node_id_from_url)
     if not db_node:
         raise HTTPException(status_code=404, detail="Node not found.")
 
@@ -330,20 +459,80 @@ async def update_node(node_id_from_url: str, updated_node: OpcUaNode, db: Sessio
     db.add(db_node)
     db.commit()
     db.refresh(db_node)
+    _nodes_changed()
 
     return db_node
 
 @app.delete("/api/nodes/{node_id_from_url}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_node(node_id_from_url: str, db: Session = Depends(get_db)):
-    db_node = db.exec(select(OpcUaNode).where(OpcUaNode.node_id == node_id_from_url)).first()
+def delete_node(node_id_from_url: str, db: Session = Depends(get_db)):
+    db_node = _get_node(db, node_id_from_url)
     if not db_node:
         raise HTTPException(status_code=404, detail="Node not found.")
     
     db.delete(db_node)
     db.commit()
+    _nodes_changed()
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+@app.post("/api/nodes/batch", status_code=status.HTTP_200_OK)
+def batch_nodes(batch: NodeBatchRequest, db: Session = Depends(get_db)):
+    """
+    Applies node deletes, creates and updates in a single request and transaction, in that order,
+    so a batch can delete a Node ID and create it again. Updates apply to nodes that existed before
+    the batch and were not deleted by it.
+    Returns one result per sub-request with the status code its own endpoint would return.
+    """
+    referenced_ids = {node.node_id for node in batch.creates} | set(batch.updates) | set(batch.deletes)
+    existing = {node.node_id: node for node in db.exec(_SELECT_NODES_BY_IDS, params={"node_ids": list(referenced_ids)}).all()}
+    results = []
+
+    delete_ids = []
+    for node_id in batch.deletes:
+        if not existing.pop(node_id, None):
+            results.append({"op": "delete", "node_id": node_id, "status": 404, "detail": "Node not found."})
+            continue
+        delete_ids.append(node_id)
+        results.append({"op": "delete", "node_id": node_id, "status": 204})
+
+    new_rows = []
+    for node in batch.creates:
+        if node.node_id in existing:
+            results.append({"op": "create", "node_id": node.node_id, "status": 400, "detail": f"Node with Node ID '{node.node_id}' already exists."})
+            continue
+        existing[node.node_id] = None # Reserve the Node ID against duplicates later in the batch
+        new_rows.append(node.model_dump(exclude={"id"}))
+        results.append({"op": "create", "node_id": node.node_id, "status": 201})
+
+    updates = []
+    for node_id, updated_node in batch.updates.items():
+        db_node = existing.get(node_id)
+        if not db_node:
+            results.append({"op": "update", "node_id": node_id, "status": 404, "detail": "Node not found."})
+            continue
+        updates.append((db_node, updated_node.model_dump(exclude_unset=True)))
+        results.append({"op": "update", "node_id": node_id, "status": 200})
+
+    try:
+        # Updates are applied to the ORM objects only after the DELETE and INSERT have run, since the
+        # DELETE would otherwise autoflush them first and an update taking a deleted Node ID would fail
+        if delete_ids:
+            db.exec(delete(OpcUaNode).where(OpcUaNode.node_id.in_(delete_ids)))
+        if new_rows:
+            db.execute(insert(OpcUaNode), new_rows)
+        for db_node, update_data in updates:
+            for key, value in update_data.items():
+                if key != "id": # 'id' is primary key, should not be updated
+                    setattr(db_node, key, value)
+            db.add(db_node)
+        db.commit()
+        _nodes_changed()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="A database integrity error occurred, possibly duplicate Node ID. No changes were applied.")
+
+    return {"results": results}
+
 # --- Full Configuration Import/Export Endpoints ---
 @app.post("/api/config/import_full", status_code=status.HTTP_200_OK)
 async def import_full_config(file: UploadFile = File(...), db: Session = Depends(get_db)):
@@ -354,9 +543,13 @@ async def import_full_config(file: UploadFile = File(...), db: Session = Depends
     if not (file.filename.endswith('.yaml') or file.filename.endswith('.yml') or file.filename.endswith('.json')):
         raise HTTPException(status_code=400, detail="Only YAML or JSON files are supported for full config import.")
     
-    content = await file.read()
+    await file.seek(0)
     try:
-        config_data = yaml.safe_load(content.decode("utf-8"))
+        # Parse straight from the spooled upload in a worker thread instead of copying it into memory
+        if file.filename.endswith('.json'):
+            config_data = await asyncio.to_thread(_load_json, file.file)
+        else:
+            config_data = await asyncio.to_thread(yaml.load, file.file, Loader=YamlLoader)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse config file: {e}")
 
@@ -367,7 +560,7 @@ async def import_full_config(file: UploadFile = File(...), db: Session = Depends
     # Process server_config
     server_config_data = config_data.get("server_config")
     if server_config_data:
-        current_config = db.exec(select(ServerConfig)).first()
+        current_config = db.exec(_SELECT_SERVER_CONFIG).first()
         if not current_config:
             current_config = ServerConfig()
             db.add(current_config)
@@ -377,7 +570,8 @@ async def import_full_config(file: UploadFile = File(...), db: Session = Depends
         for key, value in server_config_data.items():
             if key == "password_hash":
                 if value and not str(value).startswith('$2b$'): # Only hash if it's not already hashed
-                    current_config.set_password(value)
+                    # Hash off the event loop; bcrypt takes hundreds of ms by design
+                    current_config.password_hash = await asyncio.to_thread(hash_password, value)
                 elif value:
                     current_config.password_hash = value # Assume it's already hashed
                 else: # if password_hash is null/empty
@@ -396,20 +590,33 @@ async def import_full_config(file: UploadFile = File(...), db: Session = Depends
     # Process opcua_nodes
     nodes_data = config_data.get("opcua_nodes", [])
     
-    # Clear existing nodes for a clean import
-    db.exec(delete(OpcUaNode))
-    db.commit()
-    
+    # Validate every row up front so bad rows are reported without touching the DB
+    node_rows = []
+    seen_node_ids = set()
     for node_row in nodes_data:
         try:
-            node = OpcUaNode(**node_row)
-            db.add(node)
-            db.commit() # Commit each node to ensure it gets an ID and is available for refresh
-            db.refresh(node)
-            imported_nodes_count += 1
+            node = OpcUaNodeBase.model_validate(node_row)
         except Exception as e:
             errors.append(f"Error importing node row {node_row}: {e}")
-            db.rollback() # Rollback the failed node creation
+            continue
+        if node.node_id in seen_node_ids:
+            errors.append(f"Error importing node row {node_row}: duplicate Node ID '{node.node_id}'")
+            continue
+        seen_node_ids.add(node.node_id)
+        node_rows.append(node.model_dump())
+
+    # Replace existing nodes in one transaction: drop nodes missing from the file, then upsert the
+    # rest on the unique node_id index so unchanged nodes keep their rows and ids
+    try:
+        db.exec(delete(OpcUaNode).where(OpcUaNode.node_id.not_in(seen_node_ids)))
+        if node_rows:
+            db.execute(_NODE_UPSERT, node_rows)
+        db.commit()
+        _nodes_changed()
+        imported_nodes_count = len(node_rows)
+    except Exception as e:
+        db.rollback()
+        errors.append(f"Error importing nodes: {e}")
 
     _logger.info(f"Nodes imported: {imported_nodes_count}, errors: {len(errors)}")
 
@@ -420,33 +627,53 @@ async def import_full_config(file: UploadFile = File(...), db: Session = Depends
         db.add(imported_server_config)
         db.commit()
         db.refresh(imported_server_config)
+        _cache_server_config(imported_server_config)
 
     # Shutdown and restart external OPC UA subprocesses
-    shutdown_opcua_subprocesses()
+    await shutdown_opcua_subprocesses()
     if config_data.get("gateway_client_settings"):
-        start_opcua_gateway_client(config_data["gateway_client_settings"])
+        await start_opcua_gateway_client(config_data["gateway_client_settings"])
     if config_data.get("csv_data_server_settings"):
-        start_opcua_csv_data_server(config_data["csv_data_server_settings"])
+        await start_opcua_csv_data_server(config_data["csv_data_server_settings"])
 
     return {"message": "Full configuration import finished.", "imported_nodes": imported_nodes_count, "errors": errors}
 
 @app.get("/api/config/export_full", status_code=status.HTTP_200_OK)
-async def export_full_config(db: Session = Depends(get_db)):
-    """Exports the full gateway configuration (server settings and nodes) as a YAML file."""
-    server_config = db.exec(select(ServerConfig)).first()
-    nodes = db.exec(select(OpcUaNode)).all()
-
-    # Convert SQLModel instances to dict for YAML/JSON serialization
-    export_data = {
-        "server_config": server_config.model_dump() if server_config else {},
-        "opcua_nodes": [node.model_dump() for node in nodes]
-    }
-
-    output = io.StringIO()
-    # Use sort_keys=False to preserve order, better for human readability in YAML
-    yaml.dump(export_data, output, sort_keys=False, default_flow_style=False, allow_unicode=True) 
-
-    response = Response(content=output.getvalue(), media_type="application/x-yaml")
+def export_full_config(request: Request, db: Session = Depends(get_db)):
+    """Exports the full gateway configuration (server settings and nodes) as a YAML file,
+    or as JSON when the client sends Accept: application/json."""
+    export_format = "json" if "application/json" in request.headers.get("accept", "") else "yaml"
+
+    # Reuse the last export of this format while neither the config nor any node has changed
+    versions = (app.state.server_config_version, app.state.nodes_version)
+    cached = app.state.export_cache.get(export_format)
+    if cached and cached[0] == versions:
+        content = cached[1]
+    else:
+        server_config = db.exec(_SELECT_SERVER_CONFIG).first()
+        nodes = db.exec(_SELECT_ALL_NODES).all()
+
+        # Convert SQLModel instances to dict for YAML/JSON serialization
+        export_data = {
+            "server_config": server_config.model_dump() if server_config else {},
+            "opcua_nodes": [node.model_dump() for node in nodes]
+        }
+
+        if export_format == "json":
+            content = _dump_json(export_data)
+        else:
+            output = io.StringIO()
+            # Use sort_keys=False to preserve order, better for human readability in YAML
+            yaml.dump(export_data, output, Dumper=YamlDumper, sort_keys=False, default_flow_style=False, allow_unicode=True) 
+            content = output.getvalue()
+        app.state.export_cache[export_format] = (versions, content)
+
+    if export_format == "json":
+        response = Response(content=content, media_type="application/json")
+        response.headers["Content-Disposition"] = "attachment; filename=gateway_config.json"
+        return response
+
+    response = Response(content=content, media_type="application/x-yaml")
     response.headers["Content-Disposition"] = "attachment; filename=gateway_config.yaml"
     return response
 
@@ -457,9 +684,7 @@ async def api_start_opcua_components(config_request: OpcUaComponentsStartRequest
 
     # Stop any existing managed subprocesses first
     _logger.info("Shutting down any existing OPC UA subprocesses before starting new ones...")
-    shutdown_opcua_subprocesses() 
-    # Give a brief moment for processes to terminate if needed
-    await asyncio.sleep(1) 
+    await shutdown_opcua_subprocesses() # Returns once every child has exited
 
     gateway_client_started_successfully = False
 
@@ -467,7 +692,7 @@ async def api_start_opcua_components(config_request: OpcUaComponentsStartRequest
         if config_request.gateway_client_settings.enabled:
             _logger.info("Attempting to start OPC UA Gateway Client based on provided configuration.")
             client_settings_dict = config_request.gateway_client_settings.model_dump()
-            process = start_opcua_gateway_client(client_settings_dict)
+            process = await start_opcua_gateway_client(client_settings_dict)
             if process:
                 gateway_client_started_successfully = True
         else:
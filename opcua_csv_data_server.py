@@ -1,29 +1,116 @@
 import asyncio
 import logging
 import csv
+import functools
+import json
+import mmap
+from collections import OrderedDict
 from datetime import datetime
 import os
-from asyncua import Server, ua
+from asyncua import Server, Node, ua
 from asyncua.common.methods import uamethod
 import argparse
 import re
 from typing import Optional
+try:
+    from watchfiles import awatch # Optional: react to CSV changes instead of polling on a timer
+except ImportError:
+    awatch = None
 
 # Basic logging setup
 _logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# Columns read from each CSV row, in the order they are unpacked
+_CSV_COLUMNS = ('Timestamp', 'PLCName', 'NodeID', 'Value')
+
+# ISO 8601 prefix check (YYYY-MM-DDTHH:MM:SS); datetime.fromisoformat does the actual validation
+_ISO_DATETIME_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+
+# Common spellings of booleans, matched without lowercasing; other casings take the slow path
+_TRUE_STRINGS = frozenset(('true', 'True', 'TRUE'))
+_FALSE_STRINGS = frozenset(('false', 'False', 'FALSE'))
+
+def _parse_boolean(value_str: str) -> bool:
+    if value_str in _TRUE_STRINGS:
+        return True
+    if value_str in _FALSE_STRINGS:
+        return False
+    if len(value_str) in (4, 5):
+        lowered = value_str.lower()
+        if lowered == 'true':
+            return True
+        if lowered == 'false':
+            return False
+    raise ValueError(f"Not a boolean: {value_str!r}")
+
+def _parse_datetime(value_str: str) -> datetime:
+    return datetime.fromisoformat(value_str.replace('Z', '+00:00')) # Handle Z for UTC
+
+# Parsers for values of a variable whose data type is already known, keyed by VariantType.
+# Each raises ValueError when a value does not fit the type.
+_VALUE_PARSERS = {
+    ua.VariantType.Boolean: _parse_boolean,
+    ua.VariantType.Int64: int,
+    ua.VariantType.Double: float,
+    ua.VariantType.DateTime: _parse_datetime,
+    ua.VariantType.String: str,
+}
+
+# Variables kept in nodes_cache; least recently updated ones are evicted beyond this and
+# looked up again in the address space if they reappear
+MAX_CACHED_NODES = 10000
+
+# Value a restored variable holds until the CSV provides one, keyed by VariantType
+_DEFAULT_VALUES = {
+    ua.VariantType.Boolean: False,
+    ua.VariantType.Int64: 0,
+    ua.VariantType.Double: 0.0,
+    ua.VariantType.DateTime: datetime(1601, 1, 1), # OPC UA DateTime epoch
+    ua.VariantType.String: "",
+}
+
+# AccessLevel bits for variables clients may both read and write
+_READ_WRITE_ACCESS = ua.AccessLevel.CurrentRead.mask | ua.AccessLevel.CurrentWrite.mask
+
+def _folder_node_name(plc_name: str) -> str:
+    """String identifier of a PLC folder's NodeId."""
+    return f"folder:{plc_name}"
+
+def _variable_node_name(plc_name: str, variable_name: str) -> str:
+    """String identifier of a variable's NodeId. Dots and backslashes in the PLC name are escaped,
+       so the first unescaped dot always separates it from the variable name and no two
+       (plc_name, variable_name) pairs, nor any folder, share an identifier.
+    """
+    escaped_plc = plc_name.replace("\\", "\\\\").replace(".", "\\.")
+    return f"var:{escaped_plc}.{variable_name}"
+
+class VarInfo:
+    """Cached variable node and the data type it was created with."""
+    __slots__ = ('node', 'vtype')
+
+    def __init__(self, node, vtype):
+        self.node = node
+        self.vtype = vtype
+
 class CsvDataPublisher:
-    def __init__(self, server_url, namespace_uri, csv_file_path, update_interval_seconds):
+    def __init__(self, server_url, namespace_uri, csv_file_path, update_interval_seconds, max_cached_nodes=MAX_CACHED_NODES):
         self.server_url = server_url
         self.namespace_uri = namespace_uri
         self.csv_file_path = csv_file_path
         self.update_interval = update_interval_seconds
         self.server = Server()
         self.idx = 0 # Namespace index
-        self.nodes_cache = {} # To keep track of created nodes: {plc_name: {node_id_csv: {col_name: node}}}
-        self.last_known_row_count = 0
+        self.plc_folders = {} # Folder node of each PLC: {plc_name: node}
+        self.nodes_cache = OrderedDict() # Most recently updated variables last: {(plc_name, variable_name): VarInfo}
+        self.max_cached_nodes = max_cached_nodes
+        self._last_file_offset = 0 # Bytes of the CSV already processed; only appended rows are read each cycle
+        self._csv_columns = None # Positions of _CSV_COLUMNS, from the header at the start of the file
+        self._rows_consumed = 0 # Data rows already processed, for row numbers in log messages
         self.objects_node = None
+        self.known_nodes_path = f"{csv_file_path}.nodes.json" # Sidecar listing created variables, to recreate them on restart
+        self._known_nodes = {} # Every variable created so far: {(plc_name, variable_name): VariantType name}
+        self._known_nodes_dirty = False
 
     async def setup_server(self):
         _logger.info(f"Setting up CSV Data OPC UA Server at {self.server_url}")
@@ -41,174 +128,327 @@ class CsvDataPublisher:
         self.idx = await self.server.register_namespace(self.namespace_uri)
         _logger.info(f"Namespace '{self.namespace_uri}' registered with index {self.idx}")
         self.objects_node = self.server.nodes.objects
+        await self._restore_known_nodes()
 
     async def read_and_update_nodes(self):
         if not os.path.exists(self.csv_file_path) or os.path.getsize(self.csv_file_path) == 0:
             _logger.info(f"CSV file {self.csv_file_path} not found or is empty. Skipping update cycle.")
             return
 
+        file_size = os.path.getsize(self.csv_file_path)
+        if file_size < self._last_file_offset:
+            _logger.info(f"CSV file {self.csv_file_path} was truncated or replaced. Reading it from the start.")
+            self._last_file_offset = 0
+            self._csv_columns = None
+            self._rows_consumed = 0
+        elif file_size == self._last_file_offset:
+            _logger.debug("No new rows in CSV file %s.", self.csv_file_path)
+            return
+
+        # Group data by PLC name first, streaming only the rows appended since the last cycle
+        plc_data_map = {}
+        first_row_index = self._rows_consumed
         try:
-            with open(self.csv_file_path, 'r', newline='', encoding='utf-8') as csvfile:
-                reader = list(csv.DictReader(csvfile))
+            # Map the file rather than reading it through a buffer; lines are split out of the page cache
+            with open(self.csv_file_path, 'rb') as csvfile, mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as csv_map:
+                # skipinitialspace drops blanks after delimiters while parsing, so fields need no strip()
+                reader = csv.reader(self._read_new_lines(csv_map), skipinitialspace=True)
+                if self._csv_columns is None:
+                    header = next(reader, None)
+                    if header is None:
+                        return
+                    header = [column.strip() for column in header]
+                    try:
+                        self._csv_columns = tuple(header.index(column) for column in _CSV_COLUMNS)
+                    except ValueError:
+                        _logger.error(f"CSV header {header} is missing expected columns. Ensure CSV has 'Timestamp', 'PLCName', 'NodeID', 'Value'.")
+                        self._last_file_offset = 0 # Check the header again next cycle
+                        return
+                timestamp_index, plc_name_index, node_id_index, value_index = self._csv_columns
+                for row in reader:
+                    if not row:
+                        continue # Blank line
+                    row_index = self._rows_consumed
+                    self._rows_consumed += 1
+                    try:
+                        timestamp_str = row[timestamp_index]
+                        plc_name = row[plc_name_index]
+                        variable_name = row[node_id_index] # Using NodeID as variable_name
+                        value_str = row[value_index]
+                        # 'Data Type' is not in plc_data_log.csv. We'll infer it or default later.
+                    except IndexError:
+                        _logger.error(f"CSV row {row_index + 2} is missing expected columns. Row content: {row}. Ensure CSV has 'Timestamp', 'PLCName', 'NodeID', 'Value'.")
+                        continue
+
+                    # Rows are appended in time order, so a later row supersedes earlier samples of the same variable
+                    if plc_name not in plc_data_map:
+                        plc_data_map[plc_name] = {}
+                    plc_data_map[plc_name][variable_name] = (timestamp_str, value_str, row_index)
         except Exception as e:
             _logger.error(f"Error reading CSV file {self.csv_file_path}: {e}")
             return
-        
-        _logger.info(f"Processing {len(reader)} rows from CSV.")
 
-        # Group data by PLC name first
-        plc_data_map = {}
-        for row_index, row in enumerate(reader):
-            try:
-                timestamp_str = row['Timestamp'].strip()
-                plc_name = row['PLCName'].strip() # Corrected column name and added strip()
-                variable_name = row['NodeID'].strip() # Corrected column name, using NodeID as variable_name, and added strip()
-                value_str = row['Value'].strip()
-                # 'Data Type' is not in plc_data_log.csv. We'll infer it or default later.
-                # status_code_str = row['StatusCode'].strip() # Available, but not directly used for node creation type
-            except KeyError as e:
-                _logger.error(f"CSV row {row_index + 2} is missing expected column: {e}. Row content: {row}. Ensure CSV has 'Timestamp', 'PLCName', 'NodeID', 'Value'.")
-                continue
+        _logger.info(f"Processing {self._rows_consumed - first_row_index} new rows from CSV.")
 
-            if plc_name not in plc_data_map:
-                plc_data_map[plc_name] = []
-            plc_data_map[plc_name].append((timestamp_str, variable_name, value_str, row_index))
+        # PLCs are independent, so their node creation awaits overlap instead of running one PLC after another
+        await asyncio.gather(*(self._process_plc(plc_name, data_points) for plc_name, data_points in plc_data_map.items()))
+        if self._known_nodes_dirty:
+            self._save_known_nodes()
 
-        for plc_name, data_points in plc_data_map.items():
-            plc_folder = None # Initialize plc_folder for each PLC
-            try:
-                _logger.debug(f"Processing PLC: {plc_name}")
-                # Get or create PLC folder under Objects node
+    async def _get_plc_folder(self, plc_name):
+        """Returns the PLC's folder under Objects, creating it if needed; None if it cannot be created."""
+        # Nodes are only ever created by this publisher, so a cache miss is checked against the
+        # in-process address space by NodeId instead of probing with get_child
+        plc_folder = self.plc_folders.get(plc_name)
+        if plc_folder is None:
+            plc_folder_node_id = ua.NodeId(_folder_node_name(plc_name), self.idx)
+            plc_folder = self._get_existing_node(plc_folder_node_id)
+            if plc_folder is None:
+                _logger.info("Folder for PLC '%s' not created yet. Creating it...", plc_name)
                 try:
-                    plc_folder_node_id_str = f"{self.idx}:{plc_name}"
-                    _logger.debug(f"Attempting to get folder for PLC: '{plc_name}' using browse name '{plc_folder_node_id_str}' under parent {self.objects_node}")
-                    plc_folder = await self.objects_node.get_child(plc_folder_node_id_str)
-                    _logger.info(f"Found existing folder for PLC: {plc_name} (Node: {plc_folder})")
-                except ua.UaStatusCodeError as e_get_folder:
-                    actual_code = e_get_folder.code
-                    _logger.warning(f"ENTERED UaStatusCodeError block for PLC folder '{plc_name}'. Actual Error Code: {actual_code} (0x{actual_code:X}), Msg: {getattr(e_get_folder, 'msg', str(e_get_folder))}")
-                    
-                    # Direct integer comparison
-                    is_bad_not_found = (actual_code == ua.StatusCodes.BadNotFound)
-                    is_bad_no_match = (actual_code == ua.StatusCodes.BadNoMatch)
-                    
-                    _logger.info(f"DEBUG: actual_code = {actual_code} (type: {type(actual_code)}) | ua.StatusCodes.BadNotFound = {ua.StatusCodes.BadNotFound} | ua.StatusCodes.BadNoMatch = {ua.StatusCodes.BadNoMatch}")
-                    _logger.info(f"DEBUG: Comparison results: is_bad_not_found = {is_bad_not_found}, is_bad_no_match = {is_bad_no_match}")
-
-                    if is_bad_not_found or is_bad_no_match:
-                        _logger.info(f"CONDITION TRUE: Folder for PLC '{plc_name}' not found (Actual Code: 0x{actual_code:X}). Attempting to create it...")
-                        try:
-                            plc_folder = await self.objects_node.add_folder(self.idx, plc_name)
-                            # Check if add_folder returned a node or a status code
-                            if not isinstance(plc_folder, ua.Node):
-                                _logger.error(f"Failed to create folder for PLC '{plc_name}'. add_folder returned {plc_folder} instead of a Node. Skipping this PLC.")
-                                continue
-                            _logger.info(f"Successfully created folder for PLC: {plc_name} (Node: {plc_folder})")
-                        except Exception as e_add_folder:
-                            _logger.error(f"Exception during add_folder for PLC '{plc_name}': {e_add_folder}. Skipping this PLC.")
-                            continue
-                    else:
-                        # Safer logging for unhandled status codes
-                        status_code_val = getattr(e_get_folder, 'code', 'UnknownCode')
-                        status_code_name = getattr(e_get_folder, 'name', 'UnknownName') # Try to get name safely
-                        status_code_msg = getattr(e_get_folder, 'msg', str(e_get_folder)) # Get msg safely
-                        _logger.error(f"CONDITION FALSE: OPC UA error (unhandled status code {status_code_name} [0x{status_code_val:X}]) getting PLC folder '{plc_name}': {status_code_msg}. Skipping this PLC.")
-                        continue
-                except Exception as e_generic_get_folder:
-                    _logger.error(f"Generic error getting PLC folder '{plc_name}': {e_generic_get_folder}. Skipping this PLC.")
-                    continue # Skip to the next PLC
-
-                if plc_folder is None:
-                    _logger.error(f"PLC folder for '{plc_name}' is None after get/create attempts. Cannot add variables. Skipping this PLC.")
-                    continue # Skip to the next PLC
-
-                # Process all data points for this PLC
-                for timestamp_str, variable_name, value_str, row_idx in data_points:
-                    # Sanitize variable_name to be a valid OPC UA node name if necessary
-                    # For now, assume variable_name is valid.
-                    variable_node = None
+                    plc_folder = await self.objects_node.add_folder(plc_folder_node_id, plc_name)
+                except Exception as e_add_folder:
+                    _logger.error(f"Exception during add_folder for PLC '{plc_name}': {e_add_folder}. Skipping this PLC.")
+                    return None
+                # Check if add_folder returned a node or a status code
+                if not isinstance(plc_folder, Node):
+                    _logger.error(f"Failed to create folder for PLC '{plc_name}'. add_folder returned {plc_folder} instead of a Node. Skipping this PLC.")
+                    return None
+                _logger.info("Successfully created folder for PLC: %s (Node: %s)", plc_name, plc_folder)
+            self.plc_folders[plc_name] = plc_folder
+        return plc_folder
+
+    async def _restore_known_nodes(self):
+        """Recreates the variables listed in the sidecar file, so a restart does not rebuild them one CSV row at a time."""
+        try:
+            with open(self.known_nodes_path, 'r', encoding='utf-8') as f:
+                known_nodes = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            _logger.warning(f"Could not load known nodes from {self.known_nodes_path}: {e}")
+            return
+
+        variables_by_plc = {}
+        for plc_name, variable_name, vtype_name in known_nodes:
+            vtype = getattr(ua.VariantType, vtype_name, None)
+            if vtype in _DEFAULT_VALUES:
+                variables_by_plc.setdefault(plc_name, []).append((variable_name, _DEFAULT_VALUES[vtype], vtype))
+        for plc_name, new_variables in variables_by_plc.items():
+            plc_folder = await self._get_plc_folder(plc_name)
+            if plc_folder is None:
+                continue
+            for (variable_name, _, vtype), result in zip(new_variables, await self._add_variables(plc_folder, plc_name, new_variables)):
+                if isinstance(result, Exception):
+                    _logger.error(f"Error restoring variable node '{variable_name}' for PLC '{plc_name}': {result}")
+                    continue
+                self._known_nodes[(plc_name, variable_name)] = vtype.name
+                self._cache_variable((plc_name, variable_name), result, vtype)
+        self._known_nodes_dirty = False
+        _logger.info(f"Restored {len(self._known_nodes)} variables from {self.known_nodes_path}.")
+
+    async def _add_variables(self, plc_folder, plc_name, new_variables):
+        """Creates writable variables under a PLC folder with a single AddNodes call.
+           new_variables is a list of (variable_name, initial_value, vtype); returns the new node or the exception for each.
+        """
+        items = []
+        for variable_name, initial_value, vtype in new_variables:
+            attrs = ua.VariableAttributes()
+            attrs.DisplayName = ua.LocalizedText(variable_name)
+            attrs.Description = ua.LocalizedText(variable_name)
+            attrs.Value = ua.Variant(initial_value, vtype)
+            attrs.DataType = ua.NodeId(vtype.value) # Built-in DataType NodeIds share the VariantType numbers
+            attrs.ValueRank = ua.ValueRank.Scalar
+            attrs.AccessLevel = _READ_WRITE_ACCESS # Writable by default, without a set_writable call per node
+            attrs.UserAccessLevel = _READ_WRITE_ACCESS
+            item = ua.AddNodesItem()
+            item.RequestedNewNodeId = ua.NodeId(_variable_node_name(plc_name, variable_name), self.idx)
+            item.BrowseName = ua.QualifiedName(variable_name, self.idx)
+            item.NodeClass = ua.NodeClass.Variable
+            item.ParentNodeId = plc_folder.nodeid
+            item.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HasComponent)
+            item.TypeDefinition = ua.NodeId(ua.ObjectIds.BaseDataVariableType)
+            item.NodeAttributes = attrs
+            items.append(item)
+        try:
+            results = await plc_folder.session.add_nodes(items)
+        except Exception as e:
+            return [e] * len(items)
+        return [
+            self.server.get_node(result.AddedNodeId) if result.StatusCode.is_good() else ua.UaStatusCodeError(result.StatusCode.value)
+            for result in results
+        ]
+
+    def _cache_variable(self, var_key, variable_node, vtype):
+        """Adds a variable to nodes_cache, evicting the least recently updated one beyond max_cached_nodes."""
+        var_info = self.nodes_cache[var_key] = VarInfo(variable_node, vtype)
+        if len(self.nodes_cache) > self.max_cached_nodes:
+            self.nodes_cache.popitem(last=False)
+        return var_info
+
+    def _save_known_nodes(self):
+        """Writes the created variables to the sidecar file, replacing it atomically."""
+        tmp_path = f"{self.known_nodes_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([[plc_name, variable_name, vtype_name] for (plc_name, variable_name), vtype_name in self._known_nodes.items()], f)
+            os.replace(tmp_path, self.known_nodes_path)
+        except OSError as e:
+            _logger.warning(f"Could not save known nodes to {self.known_nodes_path}: {e}")
+            return
+        self._known_nodes_dirty = False
+
+    async def _process_plc(self, plc_name, data_points):
+        """Creates any missing folder and variables for one PLC and writes its latest values."""
+        debug_enabled = _logger.isEnabledFor(logging.DEBUG)
+        nodes_cache = self.nodes_cache
+        try:
+            _logger.debug("Processing PLC: %s", plc_name)
+            plc_folder = await self._get_plc_folder(plc_name)
+            if plc_folder is None:
+                return
+
+            # Process the latest data point of each variable for this PLC
+            new_variables = [] # (variable_name, initial_value, vtype) for variables that do not exist yet
+            new_variable_rows = []
+            for variable_name, (timestamp_str, value_str, row_idx) in data_points.items():
+                # Sanitize variable_name to be a valid OPC UA node name if necessary
+                # For now, assume variable_name is valid.
+                # Parse with the data type the variable was created with, re-inferring the type only
+                # for new variables or values that no longer fit it
+                var_key = (plc_name, variable_name)
+                var_info = nodes_cache.get(var_key)
+                ua_data_type = None
+                if var_info is not None:
+                    nodes_cache.move_to_end(var_key)
+                    ua_data_type = var_info.vtype
                     try:
-                        # Try to get the variable node
-                        var_node_id_str = f"{self.idx}:{variable_name}" # Variables are directly under PLC folder with server's namespace
-                        _logger.debug(f"Attempting to get variable '{variable_name}' under folder '{plc_name}' (Node: {plc_folder})")
-                        variable_node = await plc_folder.get_child(var_node_id_str)
-                        _logger.debug(f"Found existing variable node '{variable_name}' for PLC '{plc_name}'.")
-                    except ua.UaStatusCodeError as e_get_var:
-                        actual_var_code = e_get_var.code
-                        if actual_var_code == ua.StatusCodes.BadNotFound or actual_var_code == ua.StatusCodes.BadNoMatch:
-                            _logger.debug(f"Variable node '{variable_name}' not found for PLC '{plc_name}'. Creating it...")
-                            # Determine initial value and data type for creation
-                            try:
-                                # Pass only value_str to _parse_value_and_type, as data_type_str is not available from CSV
-                                initial_val, ua_data_type = self._parse_value_and_type(value_str)
-                                if ua_data_type is None: # Parsing failed or type couldn't be determined
-                                    _logger.error(f"Skipping variable '{variable_name}' for PLC '{plc_name}' due to data type parsing error/inability to determine type from value '{value_str}' (CSV row {row_idx + 2}).")
-                                    continue # Skip this variable
-                                
-                                variable_node = await plc_folder.add_variable(self.idx, variable_name, initial_val, datatype=ua_data_type)
-                                await variable_node.set_writable(True) # Make it writable by default
-                                _logger.info(f"Created variable '{variable_name}' for PLC '{plc_name}' with initial value '{initial_val}'.")
-                            except Exception as e_add_var:
-                                _logger.error(f"Error creating variable node '{variable_name}' for PLC '{plc_name}': {e_add_var}. CSV row {row_idx + 2}.")
-                                continue # Skip this variable
-                        else:
-                            # Safer logging for unhandled status codes
-                            status_code_val = getattr(e_get_var, 'code', 'UnknownCode')
-                            status_code_name = getattr(e_get_var, 'name', 'UnknownName') # Try to get name safely
-                            status_code_msg = getattr(e_get_var, 'msg', str(e_get_var)) # Get msg safely
-                            _logger.error(f"OPC UA error (unhandled status code {status_code_name} [0x{status_code_val:X}]) getting variable '{variable_name}' for PLC '{plc_name}': {status_code_msg}. CSV row {row_idx + 2}.")
-                            continue # Skip this variable
-                    except Exception as e_generic_get_var:
-                        _logger.error(f"Generic error getting variable '{variable_name}' for PLC '{plc_name}': {e_generic_get_var}. CSV row {row_idx + 2}.")
-                        continue # Skip this variable
+                        current_val = _VALUE_PARSERS[ua_data_type](value_str)
+                    except ValueError:
+                        ua_data_type = None
+                if ua_data_type is None:
+                    current_val, ua_data_type = self._parse_value_and_type(value_str)
 
+                if var_info is None:
+                    variable_node = self._get_existing_node(ua.NodeId(_variable_node_name(plc_name, variable_name), self.idx))
                     if variable_node is None:
-                        _logger.error(f"Variable node '{variable_name}' for PLC '{plc_name}' is None after get/create attempts. Skipping update. CSV row {row_idx + 2}.")
-                        continue # Skip this variable
+                        if ua_data_type is None: # Parsing failed or type couldn't be determined
+                            _logger.error(f"Skipping variable '{variable_name}' for PLC '{plc_name}' due to data type parsing error/inability to determine type from value '{value_str}' (CSV row {row_idx + 2}).")
+                            continue # Skip this variable
+                        # Created below together with this PLC's other new variables, holding this value from the start
+                        _logger.debug("Variable node '%s' not created yet for PLC '%s'. Creating it...", variable_name, plc_name)
+                        new_variables.append((variable_name, current_val, ua_data_type))
+                        new_variable_rows.append(row_idx)
+                        continue
+                    var_info = self._cache_variable(var_key, variable_node, ua_data_type)
+
+                # Update the variable's value
+                if current_val is None: # Parsing failed
+                    _logger.warning(f"Could not parse value for '{plc_name}/{variable_name}' from CSV row {row_idx + 2} ('{value_str}'). Skipping update for this row.")
+                    continue
+                try:
+                    # The publisher is the server itself, so write straight into its address space instead of
+                    # going through Node.write_value and the attribute service. Server.write_attribute_value
+                    # discards the returned StatusCode, so the address space is called directly to catch
+                    # rejected writes such as BadTypeMismatch
+                    status = await self.server.iserver.aspace.write_attribute_value(
+                        var_info.node.nodeid, ua.AttributeIds.Value, ua.DataValue(ua.Variant(current_val, ua_data_type)))
+                    status.check()
+                except Exception as e_write_val:
+                    _logger.error(f"Error writing value to variable '{plc_name}/{variable_name}': {e_write_val}. CSV row {row_idx + 2}.")
+                    continue
+                if debug_enabled:
+                    _logger.debug("Updated variable '%s/%s' to '%s'.", plc_name, variable_name, current_val)
+
+            if new_variables:
+                results = await self._add_variables(plc_folder, plc_name, new_variables)
+                for (variable_name, current_val, ua_data_type), row_idx, result in zip(new_variables, new_variable_rows, results):
+                    if isinstance(result, Exception):
+                        _logger.error(f"Error creating variable node '{variable_name}' for PLC '{plc_name}': {result}. CSV row {row_idx + 2}.")
+                        continue
+                    _logger.info("Created variable '%s' for PLC '%s' with initial value '%s'.", variable_name, plc_name, current_val)
+                    self._cache_variable((plc_name, variable_name), result, ua_data_type)
+                    self._known_nodes[(plc_name, variable_name)] = ua_data_type.name
+                    self._known_nodes_dirty = True
+        
+        except Exception as e_outer_plc:
+            if isinstance(e_outer_plc, ua.StatusCode):
+                _logger.error(f"Outer loop error processing PLC {plc_name}: OPC UA StatusCode {e_outer_plc.name} (0x{e_outer_plc.value:X}) was raised directly. This PLC's data points may not have been processed.")
+            elif hasattr(e_outer_plc, 'name') and hasattr(e_outer_plc, 'code'): # Likely a UaStatusCodeError
+                _logger.error(f"Outer loop error processing PLC {plc_name}: {e_outer_plc.name} (0x{e_outer_plc.code:X}) - {getattr(e_outer_plc, 'msg', str(e_outer_plc))}. This PLC's data points may not have been processed.")
+            else:
+                _logger.error(f"Outer loop error processing PLC {plc_name}: {type(e_outer_plc).__name__} - {str(e_outer_plc)}. This PLC's data points may not have been processed.")
+            # import traceback # Uncomment for full stack trace if needed
+            # _logger.error(traceback.format_exc())
 
-                    # Update the variable's value
-                    try:
-                        # Pass only value_str to _parse_value_and_type
-                        current_val, ua_data_type_ignored = self._parse_value_and_type(value_str)
-                        if current_val is not None: # If parsing was successful
-                            await variable_node.write_value(current_val)
-                            _logger.debug(f"Updated variable '{plc_name}/{variable_name}' to '{current_val}'.")
-                        else:
-                            _logger.warning(f"Could not parse value for '{plc_name}/{variable_name}' from CSV row {row_idx + 2} ('{value_str}'). Skipping update for this row.")
-                    except Exception as e_write_val:
-                        _logger.error(f"Error writing value to variable '{plc_name}/{variable_name}': {e_write_val}. CSV row {row_idx + 2}.")
-            
-            except Exception as e_outer_plc:
-                if isinstance(e_outer_plc, ua.StatusCode):
-                    _logger.error(f"Outer loop error processing PLC {plc_name}: OPC UA StatusCode {e_outer_plc.name} (0x{e_outer_plc.value:X}) was raised directly. This PLC's data points may not have been processed.")
-                elif hasattr(e_outer_plc, 'name') and hasattr(e_outer_plc, 'code'): # Likely a UaStatusCodeError
-                    _logger.error(f"Outer loop error processing PLC {plc_name}: {e_outer_plc.name} (0x{e_outer_plc.code:X}) - {getattr(e_outer_plc, 'msg', str(e_outer_plc))}. This PLC's data points may not have been processed.")
-                else:
-                    _logger.error(f"Outer loop error processing PLC {plc_name}: {type(e_outer_plc).__name__} - {str(e_outer_plc)}. This PLC's data points may not have been processed.")
-                # import traceback # Uncomment for full stack trace if needed
-                # _logger.error(traceback.format_exc())
-                continue
+
+    def _get_existing_node(self, node_id):
+        """Returns the node if it exists in the in-process address space, else None; a dict lookup that never raises."""
+        if node_id in self.server.iserver.aspace:
+            return self.server.get_node(node_id)
+        return None
+
+    def _read_new_lines(self, csv_map):
+        """Yields complete lines of the mapped file from the resume offset, advancing the offset past each one."""
+        end = csv_map.rfind(b'\n', self._last_file_offset) + 1 # A trailing row still being written is picked up next cycle
+        csv_map.seek(self._last_file_offset)
+        while self._last_file_offset < end:
+            raw_line = csv_map.readline()
+            self._last_file_offset = csv_map.tell()
+            yield raw_line.decode('utf-8')
 
     async def start(self):
         await self.setup_server()
         async with self.server:
             _logger.info("OPC UA CSV Data Publisher Server started.")
-            while True:
-                await self.read_and_update_nodes()
-                await asyncio.sleep(self.update_interval)
+            watch_dir = os.path.dirname(os.path.abspath(self.csv_file_path))
+            if awatch is not None and os.path.isdir(watch_dir):
+                await self._watch_csv_file(watch_dir)
+            else:
+                await self._poll_csv_file()
+
+    async def _watch_csv_file(self, watch_dir):
+        """Processes the CSV as soon as filesystem events report a change, re-checking every update interval regardless."""
+        _logger.info(f"Watching {self.csv_file_path} for changes.")
+        csv_path = os.path.abspath(self.csv_file_path)
+        await self.read_and_update_nodes()
+        async for _ in awatch(
+            watch_dir,
+            watch_filter=lambda change, path: path == csv_path,
+            rust_timeout=int(self.update_interval * 1000),
+            yield_on_timeout=True,
+        ):
+            await self.read_and_update_nodes()
+
+    async def _poll_csv_file(self):
+        """Processes the CSV every update interval."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            await self.read_and_update_nodes()
+            # Wait for the next tick on the loop's monotonic clock so update time does not drift
+            deadline += self.update_interval
+            sleep_for = deadline - loop.time()
+            if sleep_for > 0:
+                await asyncio.sleep(sleep_for)
+            else:
+                deadline = loop.time()
 
-    def _parse_value_and_type(self, value_str: str, data_type_str: Optional[str] = None):
+    @staticmethod
+    @functools.lru_cache(maxsize=8192)
+    def _parse_value_and_type(value_str: str, data_type_str: Optional[str] = None):
         """Parses the value string and determines the UA data type.
            If data_type_str is provided, it's used as a hint but inference from value_str takes precedence for robustness.
            Now primarily infers from value_str as 'Data Type' column is not in plc_data_log.csv.
+           Memoized, since logs repeat the same value strings (booleans, small integers, unchanged readings).
         """
         value_str = value_str.strip()
         
         # Try boolean
-        if value_str.lower() == 'true':
-            return True, ua.VariantType.Boolean
-        if value_str.lower() == 'false':
-            return False, ua.VariantType.Boolean
+        try:
+            return _parse_boolean(value_str), ua.VariantType.Boolean
+        except ValueError:
+            pass
         
         # Try integer
         try:
@@ -226,14 +466,13 @@ class CsvDataPublisher:
         # This is a basic check; a more robust parser might be needed for various datetime strings.
         try:
             # Example check for ISO-like format (YYYY-MM-DDTHH:MM:SS...)
-            if 'T' in value_str and (value_str.count(':') >= 2):
-                dt_obj = datetime.fromisoformat(value_str.replace('Z', '+00:00')) # Handle Z for UTC
-                return dt_obj, ua.VariantType.DateTime
+            if _ISO_DATETIME_RE.match(value_str):
+                return _parse_datetime(value_str), ua.VariantType.DateTime
         except ValueError:
             pass # Not a recognized datetime format
 
         # Default to String if no other type matches
-        _logger.debug(f"Could not infer specific data type for value '{value_str}'. Defaulting to String.")
+        _logger.debug("Could not infer specific data type for value '%s'. Defaulting to String.", value_str)
         return value_str, ua.VariantType.String
 
 async def main():
@@ -2,49 +2,168 @@
 # opcua_gateway_client.py - OPC UA client for IoT gateway to connect to virtual PLCs
 
 import asyncio
+import json
 import logging
 import os
+import re
 import ssl
-import subprocess
+import sys
+import time
 import yaml
-from asyncua import Client, ua
+try:
+    # libyaml-backed parser; same safe YAML semantics, implemented in C
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+from asyncua import Client
 from asyncua.crypto.security_policies import SecurityPolicyType
 from asyncua.ua.uaprotocol_auto import MessageSecurityMode
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from types import MappingProxyType
 from typing import List, Dict, Any, Optional, Callable
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import csv
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Maps for converting security strings from config to enums
-SECURITY_POLICY_MAP = {
+SECURITY_POLICY_MAP = MappingProxyType({
     "NoSecurity": SecurityPolicyType.NoSecurity,
     "Basic256": SecurityPolicyType.Basic256_Sign,
     "Basic128Rsa15": SecurityPolicyType.Basic128Rsa15_Sign,
     "Basic256Sha256": SecurityPolicyType.Basic256Sha256_Sign,
     # Add others if used, e.g., Aes128_Sha256_RsaOaep
-}
+})
 
-MESSAGE_SECURITY_MODE_MAP = {
+MESSAGE_SECURITY_MODE_MAP = MappingProxyType({
     "None": MessageSecurityMode.None_,
     "Sign": MessageSecurityMode.Sign,
     "SignAndEncrypt": MessageSecurityMode.SignAndEncrypt,
-}
+})
+
+# Subscription key suffix of the subscription that logs a PLC's monitored variables to CSV
+CSV_LOG_SUBSCRIPTION = "csv_log"
+
+def generate_client_certificate(key_path: str, cert_path: str, plc_name: str, days: int = 365):
+    """Writes a new RSA key and a self-signed client certificate for connecting to a PLC as PEM files"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    subject = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, f"OPCUAGatewayClientFor{plc_name}"),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "MyClientOrg"),
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
+    ])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + timedelta(days=days))
+        .sign(key, hashes.SHA256())
+    )
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ))
+    os.chmod(key_path, 0o600)
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+
+# Columns of the CSV data log
+CSV_LOG_HEADER = ["Timestamp", "PLCName", "NodeID", "Value", "SourceTimestamp", "StatusCode"]
+
+# Maximum number of Node objects cached per PLC connection
+NODE_CACHE_SIZE = 4096
+
+# Upper bound in seconds for the wait between reconnect attempts to an unreachable PLC
+MAX_RECONNECT_BACKOFF = 300
+
+# Number of buffered rows that triggers a write to the CSV log
+CSV_BATCH_SIZE = 256
+
+# Characters that make csv.writer quote a field with the default dialect
+_CSV_QUOTE_CHARS = re.compile(r'[,"\r\n]')
+
+def csv_field(value) -> str:
+    """Formats a value as one CSV field, exactly as csv.writer does with the default dialect"""
+    if value is None:
+        return ''
+    text = str(value)
+    if _CSV_QUOTE_CHARS.search(text):
+        return '"' + text.replace('"', '""') + '"'
+    return text
 
 # CSV Writing Helper
-def write_data_to_csv(filename: str, data_row: list, header: Optional[list] = None):
-    file_exists = os.path.isfile(filename)
-    try:
-        with open(filename, 'a', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            if not file_exists and header:
-                writer.writerow(header)
-            writer.writerow(data_row)
-    except IOError as e:
-        logger.error(f"IOError writing to CSV {filename}: {e}")
-    except Exception as e:
-        logger.error(f"Unexpected error writing to CSV {filename}: {e}")
+class CsvLogWriter:
+    """
+    Appends rows to a CSV file through one long-lived file handle, writing them in batches.
+    Rows are complete lines, already formatted with csv_field and terminated by '\r\n'.
+    """
+    
+    def __init__(self, filename: str, header: Optional[list] = None, batch_size: int = CSV_BATCH_SIZE):
+        self.filename = filename
+        self.header = header
+        self.batch_size = batch_size
+        self._buffer = []
+        self._csvfile = None
+        self._written_end = 0  # File size after the previous flush
+    
+    def append(self, line: str) -> bool:
+        """Buffers a row without writing; returns True once batch_size rows are buffered"""
+        self._buffer.append(line)
+        return len(self._buffer) >= self.batch_size
+    
+    def flush(self):
+        """Writes all buffered rows to the file"""
+        if not self._buffer:
+            return
+        try:
+            if self._csvfile is None:
+                self._csvfile = open(self.filename, 'a', newline='', encoding='utf-8', buffering=1 << 20)
+                if self.header and self._csvfile.tell() == 0:
+                    csv.writer(self._csvfile).writerow(self.header)
+            self._csvfile.write(''.join(self._buffer))
+            self._csvfile.flush()
+            self._drop_cached_pages()
+        except IOError as e:
+            logger.error(f"IOError writing to CSV {self.filename}: {e}")
+            self.close_file() # Reopened on the next flush
+        except Exception as e:
+            logger.error(f"Unexpected error writing to CSV {self.filename}: {e}")
+        self._buffer.clear()
+    
+    def _drop_cached_pages(self):
+        """Lets the kernel drop cached pages of rows from earlier flushes, which are never read back"""
+        if not hasattr(os, 'posix_fadvise'):
+            return
+        fd = self._csvfile.fileno()
+        if self._written_end:
+            # Pages of the latest flush are likely still dirty and would be skipped, so they wait for the next one
+            os.posix_fadvise(fd, 0, self._written_end, os.POSIX_FADV_DONTNEED)
+        self._written_end = os.lseek(fd, 0, os.SEEK_CUR)
+    
+    def close_file(self):
+        """Closes the file handle without flushing the buffer"""
+        if self._csvfile is not None:
+            try:
+                self._csvfile.close()
+            except IOError as e:
+                logger.error(f"IOError closing CSV {self.filename}: {e}")
+            self._csvfile = None
+            self._written_end = 0
+    
+    def close(self):
+        """Flushes the buffered rows and closes the file"""
+        self.flush()
+        self.close_file()
 
 
 class OPCUAGatewayClient:
@@ -60,24 +179,121 @@ class OPCUAGatewayClient:
             config_file: Path to the configuration YAML file
         """
         self.config_file = config_file
+        self.config_cache_file = f"{config_file}.cache.json"
         self.config = None
+        self.plc_security = {}  # plc_name -> (SecurityPolicyType, MessageSecurityMode) parsed from its 'security' setting
         self.plc_clients = {}  # Dictionary to hold client connections
+        self.node_cache = {}  # plc_name -> {node ID string: Node} for the current connection
         self.subscriptions = {}  # To store active subscriptions
+        self.reconnect_failures = {}  # plc_name -> consecutive failed connection attempts
+        self.next_reconnect_at = {}  # plc_name -> time.monotonic() before which no reconnect is attempted
         self.cached_values = {}  # To store latest values
         self.csv_log_file = "plc_data_log.csv"
+        self.csv_writer = CsvLogWriter(self.csv_log_file, CSV_LOG_HEADER)
+        self.csv_queue = asyncio.Queue()  # Rows for write_csv_log; None stops it
         self.log_interval = 10
 
     async def load_config(self):
-        """Load configuration from YAML file"""
+        """Load configuration from YAML file, reusing the parsed copy cached for an unchanged file"""
         try:
-            with open(self.config_file, 'r') as f:
-                self.config = yaml.safe_load(f)
+            stat = os.stat(self.config_file)
+            self.config = self._load_cached_config(stat)
+            if self.config is None:
+                with open(self.config_file, 'r') as f:
+                    self.config = yaml.load(f, Loader=YamlLoader)
+                self._save_cached_config(stat)
+            if not self._resolve_security_settings():
+                return False
+            # Interned node IDs make the node cache lookups of monitored variables identity comparisons
+            for plc_config in (self.config.get('plcs') or {}).values():
+                if plc_config.get('variables_to_monitor'):
+                    plc_config['variables_to_monitor'] = [sys.intern(node_id) for node_id in plc_config['variables_to_monitor']]
             logger.info(f"Configuration loaded from {self.config_file}")
             return True
         except Exception as e:
             logger.error(f"Failed to load configuration: {e}")
             return False
     
+    def _resolve_security_settings(self) -> bool:
+        """Parses each PLC's 'Policy,Mode' security string into enums once, rejecting invalid settings up front"""
+        plc_security = {}
+        for plc_name, plc_config in (self.config.get('plcs') or {}).items():
+            security_settings_str = plc_config.get("security")
+            if not security_settings_str:
+                continue
+            try:
+                policy_str, mode_str = map(str.strip, security_settings_str.split(','))
+            except ValueError:
+                logger.error(f"Invalid security string format '{security_settings_str}' for {plc_name}. Expected 'Policy,Mode'.")
+                return False
+
+            policy_enum = SECURITY_POLICY_MAP.get(policy_str)
+            mode_enum = MESSAGE_SECURITY_MODE_MAP.get(mode_str)
+
+            if policy_enum is None:
+                logger.error(f"Unknown security policy string: '{policy_str}' for {plc_name}. Available: {list(SECURITY_POLICY_MAP.keys())}")
+                return False
+            if mode_enum is None:
+                logger.error(f"Unknown message security mode string: '{mode_str}' for {plc_name}. Available: {list(MESSAGE_SECURITY_MODE_MAP.keys())}")
+                return False
+            plc_security[plc_name] = (policy_enum, mode_enum)
+        self.plc_security = plc_security
+        return True
+    
+    def _load_cached_config(self, stat: os.stat_result) -> Optional[dict]:
+        """Returns the config from the JSON sidecar if it was parsed from a file with this mtime and size"""
+        try:
+            with open(self.config_cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('mtime_ns') != stat.st_mtime_ns or cached.get('size') != stat.st_size:
+            return None
+        return cached.get('config')
+    
+    def _save_cached_config(self, stat: os.stat_result):
+        """Writes the parsed config to the JSON sidecar, replacing it atomically"""
+        # Only cache configs that survive a JSON round trip unchanged (e.g. no dates or non-string keys)
+        try:
+            if json.loads(json.dumps(self.config)) != self.config:
+                return
+        except (TypeError, ValueError):
+            return
+        tmp_path = f"{self.config_cache_file}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'config': self.config}, f)
+            os.replace(tmp_path, self.config_cache_file)
+        except OSError as e:
+            logger.warning(f"Could not cache configuration to {self.config_cache_file}: {e}")
+    
+    async def write_csv_log(self, flush_interval: float):
+        """
+        Moves the rows queued on csv_queue into csv_writer until None is queued. This task owns
+        the writer and runs its disk writes in a worker thread, so they never stall the event loop.
+        
+        Args:
+            flush_interval: Seconds after which rows that did not fill a batch are written
+        """
+        loop = asyncio.get_running_loop()
+        queue = self.csv_queue
+        next_flush = loop.time() + flush_interval
+        while True:
+            timeout = next_flush - loop.time()
+            if timeout <= 0:
+                await asyncio.to_thread(self.csv_writer.flush)
+                next_flush = loop.time() + flush_interval
+                continue
+            try:
+                line = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                continue
+            if line is None:
+                break
+            if self.csv_writer.append(line):
+                await asyncio.to_thread(self.csv_writer.flush)
+        await asyncio.to_thread(self.csv_writer.close)
+    
     async def connect_to_plc(self, plc_name: str, plc_config: dict, client_certs_base_dir="certs/client_certs"):
         """
         Connect to a PLC OPC UA server
@@ -95,7 +311,7 @@ class OPCUAGatewayClient:
         logger.info(f"Connecting to PLC '{plc_name}' at {url}")
 
         try:
-            security_settings_str = plc_config.get("security")
+            security_settings = self.plc_security.get(plc_name)
             user_settings = plc_config.get("user_settings")
 
             if user_settings:
@@ -103,23 +319,9 @@ class OPCUAGatewayClient:
                 client.set_password(user_settings.get("password"))
                 logger.info(f"Set user/password for {plc_name}")
 
-            if security_settings_str:
-                logger.info(f"Configuring security for {plc_name} with settings: {security_settings_str}")
-                try:
-                    policy_str, mode_str = map(str.strip, security_settings_str.split(','))
-                except ValueError:
-                    logger.error(f"Invalid security string format '{security_settings_str}' for {plc_name}. Expected 'Policy,Mode'.")
-                    return None
-
-                policy_enum = SECURITY_POLICY_MAP.get(policy_str)
-                mode_enum = MESSAGE_SECURITY_MODE_MAP.get(mode_str)
-
-                if policy_enum is None:
-                    logger.error(f"Unknown security policy string: '{policy_str}' for {plc_name}. Available: {list(SECURITY_POLICY_MAP.keys())}")
-                    return None
-                if mode_enum is None:
-                    logger.error(f"Unknown message security mode string: '{mode_str}' for {plc_name}. Available: {list(MESSAGE_SECURITY_MODE_MAP.keys())}")
-                    return None
+            if security_settings:
+                policy_enum, mode_enum = security_settings
+                logger.info(f"Configuring security for {plc_name} with settings: {plc_config.get('security')}")
 
                 if policy_enum != SecurityPolicyType.NoSecurity:
                     client_cert_path = plc_config.get("client_cert_path", os.path.join(client_certs_base_dir, f"client_cert_{plc_name}.pem"))
@@ -132,32 +334,16 @@ class OPCUAGatewayClient:
                     if not (os.path.exists(client_cert_path) and os.path.exists(client_key_path)):
                         logger.info(f"Client certificate/key for {plc_name} not found at {client_cert_path}/{client_key_path}. Generating new ones...")
                         try:
-                            # Generate private key
-                            subprocess.run(["openssl", "genrsa", "-out", client_key_path, "2048"], check=True, capture_output=True, text=True)
-                            # Generate CSR
-                            csr_path = os.path.join(os.path.dirname(client_cert_path), f"client_csr_{plc_name}.csr")
-                            subject = f"/CN=OPCUAGatewayClientFor{plc_name}/O=MyClientOrg/C=US"
-                            subprocess.run([
-                                "openssl", "req", "-new", "-key", client_key_path,
-                                "-out", csr_path, "-subj", subject
-                            ], check=True, capture_output=True, text=True)
-                            # Generate self-signed certificate
-                            subprocess.run([
-                                "openssl", "x509", "-req", "-days", "365", "-in", csr_path,
-                                "-signkey", client_key_path, "-out", client_cert_path
-                            ], check=True, capture_output=True, text=True)
-                            os.chmod(client_key_path, 0o600)
+                            # RSA key generation is CPU-bound, so it runs in a worker thread
+                            await asyncio.to_thread(generate_client_certificate, client_key_path, client_cert_path, plc_name)
                             logger.info(f"Generated client certificate and key for {plc_name} at {client_cert_path} and {client_key_path}")
                             key_was_auto_generated = True
-                        except subprocess.CalledProcessError as e:
-                            logger.error(f"Failed to generate client cert/key for {plc_name}: {e.stderr}")
-                            return None
                         except Exception as e_gen:
                             logger.error(f"An unexpected error occurred during client cert/key generation for {plc_name}: {e_gen}")
                             return None
 
                     if not server_cert_path or not os.path.exists(server_cert_path):
-                        logger.error(f"Server certificate path for {plc_name} ('{server_cert_path}') is missing or invalid. Required for secure policy {policy_str}.")
+                        logger.error(f"Server certificate path for {plc_name} ('{server_cert_path}') is missing or invalid. Required for secure policy {policy_enum.name}.")
                         return None
                     
                     password_for_set_security = None
@@ -166,7 +352,7 @@ class OPCUAGatewayClient:
                     else:
                         password_for_set_security = plc_config.get("client_key_password")
 
-                    logger.info(f"Setting security for {plc_name}: Policy={policy_str}, Mode={mode_str}, ClientCert={client_cert_path}, ServerCert={server_cert_path}")
+                    logger.info(f"Setting security for {plc_name}: Policy={policy_enum.name}, Mode={mode_enum.name}, ClientCert={client_cert_path}, ServerCert={server_cert_path}")
                     await client.set_security(
                         policy_enum,
                         client_cert_path,
@@ -190,12 +376,11 @@ class OPCUAGatewayClient:
             await client.connect()
             logger.info(f"Successfully connected to PLC '{plc_name}'.")
             self.plc_clients[plc_name] = client
+            self.node_cache[plc_name] = {}
             return client
             
         except Exception as e:
-            logger.error(f"Failed to connect to {plc_name} at {url}: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"Failed to connect to {plc_name} at {url}: {e}")
             return None
     
     async def disconnect_from_plc(self, plc_name: str):
@@ -208,6 +393,30 @@ class OPCUAGatewayClient:
                 logger.error(f"Error disconnecting from {plc_name}: {e}")
             finally:
                 self.plc_clients[plc_name] = None
+                self.node_cache.pop(plc_name, None)
+                # Subscriptions end with the session
+                for sub_key in [key for key in self.subscriptions if key.startswith(f"{plc_name}:")]:
+                    del self.subscriptions[sub_key]
+    
+    def record_connect_result(self, plc_name: str, connected: bool):
+        """Schedules the next reconnect attempt to a PLC, doubling the wait after each consecutive failure"""
+        if connected:
+            self.reconnect_failures.pop(plc_name, None)
+            self.next_reconnect_at.pop(plc_name, None)
+            return
+        failures = self.reconnect_failures.get(plc_name, 0) + 1
+        self.reconnect_failures[plc_name] = failures
+        self.next_reconnect_at[plc_name] = time.monotonic() + min(2 ** failures, MAX_RECONNECT_BACKOFF)
+    
+    def get_node(self, plc_name: str, node_id: str):
+        """Returns the Node for a node ID on a connected PLC, parsing each node ID once per connection"""
+        nodes = self.node_cache.setdefault(plc_name, {})
+        node = nodes.get(node_id)
+        if node is None:
+            if len(nodes) >= NODE_CACHE_SIZE:
+                nodes.pop(next(iter(nodes))) # Ad-hoc reads and writes of many nodes evict the oldest entry
+            node = nodes[node_id] = self.plc_clients[plc_name].get_node(node_id)
+        return node
     
     async def disconnect_all(self):
         """Disconnect from all PLCs"""
@@ -278,10 +487,8 @@ class OPCUAGatewayClient:
             logger.error(f"No connection to {plc_name}")
             return None
         
-        client = self.plc_clients[plc_name]
-        
         try:
-            node = client.get_node(node_id)
+            node = self.get_node(plc_name, node_id)
             value = await node.read_value()
             
             # Cache the value
@@ -311,10 +518,8 @@ class OPCUAGatewayClient:
             logger.error(f"No connection to {plc_name}")
             return False
         
-        client = self.plc_clients[plc_name]
-        
         try:
-            node = client.get_node(node_id)
+            node = self.get_node(plc_name, node_id)
             await node.write_value(value)
             
             # Update cached value
@@ -358,7 +563,7 @@ class OPCUAGatewayClient:
             subscription = await client.create_subscription(500, handler)
             
             # Subscribe to node
-            node = client.get_node(node_id)
+            node = self.get_node(plc_name, node_id)
             await subscription.subscribe_data_change(node)
             
             # Store subscription for later management
@@ -376,6 +581,40 @@ class OPCUAGatewayClient:
             logger.error(f"Failed to subscribe to {node_id} on {plc_name}: {e}")
             return False
     
+    async def subscribe_to_nodes(self, plc_name: str, node_ids: List[str], handler, sub_name: str, publishing_interval_ms: float = 500) -> bool:
+        """
+        Subscribe to changes in several nodes of a PLC with one subscription
+        
+        Args:
+            plc_name: Name of the PLC
+            node_ids: Node IDs to subscribe to; all monitored items are created in one request
+            handler: Subscription handler receiving the data change notifications
+            sub_name: Name of the subscription, unique per PLC
+            publishing_interval_ms: How often the PLC publishes collected changes
+            
+        Returns:
+            True if subscription set up successfully, False otherwise
+        """
+        client = self.plc_clients.get(plc_name)
+        if client is None:
+            logger.error(f"No connection to {plc_name}")
+            return False
+        
+        sub_key = f"{plc_name}:{sub_name}"
+        
+        try:
+            nodes = [self.get_node(plc_name, node_id) for node_id in node_ids]
+            subscription = await client.create_subscription(publishing_interval_ms, handler)
+            await subscription.subscribe_data_change(nodes)
+            
+            self.subscriptions[sub_key] = subscription
+            logger.info(f"Subscribed to {len(nodes)} nodes on {plc_name}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to subscribe to nodes on {plc_name}: {e}")
+            return False
+    
     async def unsubscribe_from_node(self, plc_name: str, node_id: str) -> bool:
         """
         Unsubscribe from changes in a specific node
@@ -428,6 +667,52 @@ class SubHandler:
         """Called when a subscribed node's value changes"""
         await self.callback(self.plc_name, self.node_id, val)
 
+class CsvLogHandler:
+    """Subscription handler that logs data changes of a PLC's monitored variables to the CSV file"""
+    
+    def __init__(self, plc_name, node_ids, csv_queue):
+        self.plc_name = plc_name
+        self.node_ids = node_ids  # NodeId -> node ID string as written in the config
+        self.csv_queue = csv_queue
+        # The PLC name and node ID columns of each node's rows, formatted once
+        self.row_middles = {nodeid: f",{csv_field(plc_name)},{csv_field(node_id_str)}," for nodeid, node_id_str in node_ids.items()}
+        # Formatted timestamps reused across the notifications of a publish response
+        self._second = None
+        self._second_iso = None
+        self._source_timestamp = None
+        self._source_timestamp_iso = None
+    
+    def _now_iso(self) -> str:
+        """Same as datetime.now().isoformat(), but formats the date and time of day only once per second"""
+        now = time.time()
+        second = int(now)
+        if second != self._second:
+            self._second = second
+            self._second_iso = datetime.fromtimestamp(second).isoformat()
+        return f"{self._second_iso}.{int((now - second) * 1_000_000):06d}"
+        
+    async def datachange_notification(self, node, val, data):
+        """Called when a subscribed node's value changes"""
+        node_id_str = self.node_ids.get(node.nodeid, str(node.nodeid))
+        data_value = data.monitored_item.Value
+        if data_value.StatusCode.is_bad():
+            logger.error(f"Error reading node {node_id_str} from {self.plc_name}: (Status: {data_value.StatusCode.name})")
+            return
+        try:
+            current_time_iso = self._now_iso()
+            source_timestamp = data_value.SourceTimestamp
+            if source_timestamp != self._source_timestamp:
+                self._source_timestamp = source_timestamp
+                self._source_timestamp_iso = source_timestamp.isoformat() if source_timestamp else None
+            source_timestamp_iso = self._source_timestamp_iso
+            status_code_name = data_value.StatusCode.name
+            
+            row_middle = self.row_middles.get(node.nodeid) or f",{csv_field(self.plc_name)},{csv_field(node_id_str)},"
+            line = f"{current_time_iso}{row_middle}{csv_field(val)},{csv_field(source_timestamp_iso)},{status_code_name}\r\n"
+            self.csv_queue.put_nowait(line)
+        except Exception as e:
+            logger.error(f"Unexpected error processing node {node_id_str} from {self.plc_name}: {e}")
+
 async def main():
     opcua_gw_client = OPCUAGatewayClient(config_file="opcua_client_config.yaml")
     if not await opcua_gw_client.load_config(): # Added await here
@@ -438,28 +723,43 @@ async def main():
     # These should be initialized in OPCUAGatewayClient.__init__ (e.g., from config or defaults)
     csv_log_file = getattr(opcua_gw_client, 'csv_log_file', "plc_data_log.csv")
     log_interval_seconds = getattr(opcua_gw_client, 'log_interval', 10)
-    csv_header = ["Timestamp", "PLCName", "NodeID", "Value", "SourceTimestamp", "StatusCode"]
 
-    # Initial connection attempts to all configured PLCs
+    # Initial connection attempts to all configured PLCs, concurrently so an unreachable PLC does not delay the others
+    initial_connects = {}
     for plc_name_init, plc_config_init in opcua_gw_client.config.get('plcs', {}).items():
         if plc_name_init not in opcua_gw_client.plc_clients or opcua_gw_client.plc_clients.get(plc_name_init) is None:
             logger.info(f"Attempting initial connection to {plc_name_init}...")
-            await opcua_gw_client.connect_to_plc(plc_name_init, plc_config_init)
+            initial_connects[plc_name_init] = opcua_gw_client.connect_to_plc(plc_name_init, plc_config_init)
+    results = await asyncio.gather(*initial_connects.values(), return_exceptions=True)
+    for plc_name_init, result in zip(initial_connects, results):
+        opcua_gw_client.record_connect_result(plc_name_init, result is not None and not isinstance(result, BaseException))
     
     if not any(opcua_gw_client.plc_clients.values()):
         logger.warning("No PLCs could be connected initially. Gateway will attempt to connect in the main loop.")
 
-    logger.info(f"Starting data logging to {csv_log_file} every {log_interval_seconds} seconds.")
+    logger.info(f"Starting data logging to {csv_log_file} on data changes, published at most every {log_interval_seconds} seconds.")
     logger.info("Press Ctrl+C to stop.")
 
+    # Rows that did not fill a batch are written at least once per interval
+    csv_log_task = asyncio.create_task(opcua_gw_client.write_csv_log(log_interval_seconds))
     try:
         while True:
-            active_plc_in_current_cycle = False
+            # Values are logged by each PLC's subscription as the PLC reports changes; this loop only
+            # checks connections, subscribes newly connected PLCs and reconnects lost ones
             for plc_name, plc_asyncua_client in list(opcua_gw_client.plc_clients.items()): # Iterate over connected/attempted PLCs
                 if plc_asyncua_client is None: # Connection might have failed or been closed
                     continue
                 
-                active_plc_in_current_cycle = True
+                try:
+                    await plc_asyncua_client.check_connection()
+                except Exception as e:
+                    logger.warning(f"Connection issue with {plc_name} (Reason: {e}). Marking for reconnect.")
+                    await opcua_gw_client.disconnect_from_plc(plc_name) # disconnect_plc should set client to None in self.plc_clients
+                    continue
+
+                if f"{plc_name}:{CSV_LOG_SUBSCRIPTION}" in opcua_gw_client.subscriptions:
+                    continue # Already logging
+
                 current_plc_config = opcua_gw_client.config['plcs'].get(plc_name)
                 if not current_plc_config:
                     logger.warning(f"Configuration for {plc_name} not found during logging. Skipping.")
@@ -468,41 +768,32 @@ async def main():
                 variables_to_monitor = current_plc_config.get('variables_to_monitor', [])
                 if not variables_to_monitor:
                     continue # No variables specified for this PLC
-                
+
+                node_ids = {}
                 for node_id_str in variables_to_monitor:
                     try:
-                        node = plc_asyncua_client.get_node(node_id_str)
-                        data_value = await node.read_data_value()
-                        
-                        current_time_iso = datetime.now().isoformat()
-                        value = data_value.Value.Value if data_value.Value is not None else None
-                        source_timestamp_iso = data_value.SourceTimestamp.isoformat() if data_value.SourceTimestamp else None
-                        status_code_name = data_value.StatusCode.name
-                        
-                        data_row = [current_time_iso, plc_name, node_id_str, value, source_timestamp_iso, status_code_name]
-                        write_data_to_csv(csv_log_file, data_row, csv_header)
-
-                    except ua.UaStatusCodeError as e:
-                        logger.error(f"Error reading node {node_id_str} from {plc_name}: {e} (Status: {e.code.name})")
-                        # Basic disconnect & mark for reconnect logic
-                        if e.code in [ua.StatusCodes.BadSessionIdInvalid, 
-                                      ua.StatusCodes.BadSecureChannelIdInvalid,
-                                      ua.StatusCodes.BadConnectionClosed,
-                                      ua.StatusCodes.BadTimeout]:
-                            logger.warning(f"Connection issue with {plc_name} (Reason: {e.code.name}). Marking for reconnect.")
-                            await opcua_gw_client.disconnect_from_plc(plc_name) # disconnect_plc should set client to None in self.plc_clients
-                    except AttributeError as e:
-                        logger.error(f"Attribute error processing node {node_id_str} for {plc_name}: {e}. PLC might be disconnected.")
+                        node_ids[opcua_gw_client.get_node(plc_name, node_id_str).nodeid] = node_id_str
                     except Exception as e:
-                        logger.error(f"Unexpected error processing node {node_id_str} from {plc_name}: {e}")
+                        logger.error(f"Invalid node ID {node_id_str} for {plc_name}: {e}. Not logging it.")
+                if not node_ids:
+                    continue
+                handler = CsvLogHandler(plc_name, node_ids, opcua_gw_client.csv_queue)
+                await opcua_gw_client.subscribe_to_nodes(plc_name, list(node_ids.values()), handler, CSV_LOG_SUBSCRIPTION, log_interval_seconds * 1000)
             
             # Reconnection logic for PLCs that are marked as disconnected (None in plc_clients)
             configured_plcs = opcua_gw_client.config.get('plcs', {})
             if configured_plcs:
+                reconnects = {}
+                now = time.monotonic()
                 for plc_name_rc, plc_config_rc in configured_plcs.items():
                     if plc_name_rc not in opcua_gw_client.plc_clients or opcua_gw_client.plc_clients.get(plc_name_rc) is None:
+                        if now < opcua_gw_client.next_reconnect_at.get(plc_name_rc, 0):
+                            continue # Still backing off after failed attempts
                         logger.info(f"Attempting to reconnect to disconnected PLC: {plc_name_rc}...")
-                        await opcua_gw_client.connect_to_plc(plc_name_rc, plc_config_rc)
+                        reconnects[plc_name_rc] = opcua_gw_client.connect_to_plc(plc_name_rc, plc_config_rc)
+                results = await asyncio.gather(*reconnects.values(), return_exceptions=True)
+                for plc_name_rc, result in zip(reconnects, results):
+                    opcua_gw_client.record_connect_result(plc_name_rc, result is not None and not isinstance(result, BaseException))
             
             await asyncio.sleep(log_interval_seconds)
 
@@ -511,6 +802,8 @@ async def main():
     finally:
         logger.info("Disconnecting from all PLCs...")
         await opcua_gw_client.disconnect_all()
+        opcua_gw_client.csv_queue.put_nowait(None) # Writes the remaining rows and closes the log
+        await csv_log_task
         logger.info("All PLC connections closed and client shut down.")
 
 if __name__ == "__main__":
@@ -1,8 +1,133 @@
 #!/usr/bin/env python3
+import gzip
+import hashlib
+import threading
+import zlib
 import yaml
+try:
+    # libyaml-backed parser; same safe YAML semantics, implemented in C
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 from flask import request, jsonify
 from snmpy import build_snmpv1_command, build_snmpv2c_command, build_snmpv3_command
-from utils import execute_snmp_command
+from utils import (execute_snmp_command, execute_snmp_commands, SNMP_ENGINE_OIDS, SNMP_ENGINE_OUTPUT_OPTIONS,
+                   v3_engine_args, v3_engine_discovery_due, learn_v3_engine, forget_v3_engine)
+
+# Parsed request bodies keyed by their BLAKE2b digest, so the cache holds no copies of the bodies
+_YAML_CACHE = {}
+_YAML_CACHE_SIZE = 1024
+_YAML_CACHE_LOCK = threading.Lock() # Requests are served from several threads
+
+def _parse_yaml(data: bytes):
+    """Parses a YAML request body; clients tend to resend identical configs, which are parsed only once.
+    The result is shared between requests, so callers must not modify it."""
+    key = hashlib.blake2b(data, digest_size=16).digest()
+    with _YAML_CACHE_LOCK:
+        config = _YAML_CACHE.get(key)
+    if config is not None:
+        return config
+    config = yaml.load(data, Loader=YamlLoader)
+    with _YAML_CACHE_LOCK:
+        if len(_YAML_CACHE) >= _YAML_CACHE_SIZE:
+            _YAML_CACHE.pop(next(iter(_YAML_CACHE)), None)
+        _YAML_CACHE[key] = config
+    return config
+
+# Operations supported by all SNMP versions
+SNMP_OPERATIONS = frozenset(("get", "walk", "set"))
+
+class _EngineDiscoveryError(Exception):
+    """Reading an SNMPv3 agent's engine parameters failed; result is the command result to report"""
+    def __init__(self, result):
+        super().__init__(result.get("error"))
+        self.result = result
+
+def _build_snmpv3_command(operation, snmp_config):
+    """
+    Builds an SNMPv3 command that reuses the agent's engine parameters, reading them first if unknown
+    Raises _EngineDiscoveryError if the agent could not be reached or rejected the credentials
+    """
+    host = snmp_config.get("target", {}).get("host")
+    port = snmp_config.get("target", {}).get("port", 161)
+    engine_args = v3_engine_args(host, port)
+    if not engine_args and host and v3_engine_discovery_due(host, port):
+        engine_cmd = build_snmpv3_command("get", {**snmp_config, "oids": SNMP_ENGINE_OIDS}, [SNMP_ENGINE_OUTPUT_OPTIONS])
+        result = learn_v3_engine(host, port, engine_cmd, execute_snmp_command)
+        if not result["success"]:
+            # The command itself would fail the same way, after another full timeout
+            raise _EngineDiscoveryError(result)
+        engine_args = v3_engine_args(host, port)
+    return build_snmpv3_command(operation, snmp_config, engine_args)
+
+def _forget_v3_engine_on_failure(snmp_config, results):
+    """Drops the cached engine parameters of an agent when a command failed, e.g. because it was reinstalled"""
+    if not all(result["success"] for result in results):
+        target = snmp_config.get("target", {})
+        forget_v3_engine(target.get("host"), target.get("port", 161))
+
+def _handle_snmp_request(build_command, on_results=None):
+    """
+    Handles an SNMP request for the version whose command builder is build_command
+    Expects a YAML payload with SNMP configuration
+    on_results, if given, is called with the configuration and the list of command results
+    """
+    try:
+        if request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
+            config = _load_request_yaml()
+        else:
+            return jsonify({"error": "Content-Type must be application/x-yaml or text/yaml"}), 400
+        
+        # Check for protocols and snmp configuration
+        snmp_config = config.get("protocols", {}).get("snmp")
+        if not snmp_config:
+            return jsonify({"error": "Missing SNMP configuration in protocols section"}), 400
+        
+        # Get operation
+        operation = snmp_config.get("operation", "get")
+        if operation not in SNMP_OPERATIONS:
+            return jsonify({"error": f"Unsupported operation: {operation}"}), 400
+        
+        # Each walk command covers one subtree, so several subtrees are walked concurrently
+        oids = snmp_config.get("oids")
+        if operation == "walk" and isinstance(oids, list) and len(oids) > 1:
+            commands = [build_command(operation, {**snmp_config, "oids": [oid]}) for oid in oids]
+            results = execute_snmp_commands(commands)
+            if on_results:
+                on_results(snmp_config, results)
+            return jsonify({"success": all(result["success"] for result in results), "results": results})
+        
+        # Build and execute command
+        cmd = build_command(operation, snmp_config)
+        result = execute_snmp_command(cmd)
+        if on_results:
+            on_results(snmp_config, [result])
+        
+        return jsonify(result)
+    
+    except _EngineDiscoveryError as e:
+        return jsonify(e.result)
+    except yaml.YAMLError as e:
+        return jsonify({"error": f"Invalid YAML: {str(e)}"}), 400
+    except (gzip.BadGzipFile, zlib.error, EOFError) as e:
+        return jsonify({"error": f"Invalid gzip body: {str(e)}"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+
+# Bodies up to this size are parsed through the _parse_yaml cache; larger ones are parsed
+# straight from the request stream instead of being buffered whole first
+_MAX_CACHED_YAML_BODY = 64 * 1024
+
+def _load_request_yaml():
+    """Parses the YAML request body, decompressing a gzip Content-Encoding on the fly"""
+    if request.content_encoding == 'gzip':
+        with gzip.GzipFile(fileobj=request.stream) as stream:
+            return yaml.load(stream, Loader=YamlLoader)
+    if request.content_length is not None and request.content_length <= _MAX_CACHED_YAML_BODY:
+        return _parse_yaml(request.get_data(cache=False))
+    return yaml.load(request.stream, Loader=YamlLoader)
 
 def register_routes(app):
     @app.route('/api/snmp/v1', methods=['POST'])
@@ -11,34 +136,7 @@ def register_routes(app):
         Endpoint for SNMPv1 operations
         Expects a YAML payload with SNMP configuration
         """
-        try:
-            if request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
-                config = yaml.safe_load(request.data)
-            else:
-                return jsonify({"error": "Content-Type must be application/x-yaml or text/yaml"}), 400
-            
-            # Check for protocols and snmp configuration
-            snmp_config = config.get("protocols", {}).get("snmp")
-            if not snmp_config:
-                return jsonify({"error": "Missing SNMP configuration in protocols section"}), 400
-            
-            # Get operation
-            operation = snmp_config.get("operation", "get")
-            if operation not in ["get", "walk", "set"]:
-                return jsonify({"error": f"Unsupported operation: {operation}"}), 400
-            
-            # Build and execute command
-            cmd = build_snmpv1_command(operation, snmp_config)
-            result = execute_snmp_command(cmd)
-            
-            return jsonify(result)
-        
-        except yaml.YAMLError as e:
-            return jsonify({"error": f"Invalid YAML: {str(e)}"}), 400
-        except ValueError as e:
-            return jsonify({"error": str(e)}), 400
-        except Exception as e:
-            return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+        return _handle_snmp_request(build_snmpv1_command)
 
     @app.route('/api/snmp/v2c', methods=['POST'])
     def snmp_v2c():
@@ -46,34 +144,7 @@ def register_routes(app):
         Endpoint for SNMPv2c operations
         Expects a YAML payload with SNMP configuration
         """
-        try:
-            if request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
-                config = yaml.safe_load(request.data)
-            else:
-                return jsonify({"error": "Content-Type must be application/x-yaml or text/yaml"}), 400
-            
-            # Check for protocols and snmp configuration
-            snmp_config = config.get("protocols", {}).get("snmp")
-            if not snmp_config:
-                return jsonify({"error": "Missing SNMP configuration in protocols section"}), 400
-            
-            # Get operation
-            operation = snmp_config.get("operation", "get")
-            if operation not in ["get", "walk", "set"]:
-                return jsonify({"error": f"Unsupported operation: {operation}"}), 400
-            
-            # Build and execute command
-            cmd = build_snmpv2c_command(operation, snmp_config)
-            result = execute_snmp_command(cmd)
-            
-            return jsonify(result)
-        
-        except yaml.YAMLError as e:
-            return jsonify({"error": f"Invalid YAML: {str(e)}"}), 400
-        except ValueError as e:
-            return jsonify({"error": str(e)}), 400
-        except Exception as e:
-            return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+        return _handle_snmp_request(build_snmpv2c_command)
 
     @app.route('/api/snmp/v3', methods=['POST'])
     def snmp_v3():
@@ -81,31 +152,4 @@ def register_routes(app):
         Endpoint for SNMPv3 operations
         Expects a YAML payload with SNMP configuration
         """
-        try:
-            if request.content_type == 'application/x-yaml' or request.content_type == 'text/yaml':
-                config = yaml.safe_load(request.data)
-            else:
-                return jsonify({"error": "Content-Type must be application/x-yaml or text/yaml"}), 400
-            
-            # Check for protocols and snmp configuration
-            snmp_config = config.get("protocols", {}).get("snmp")
-            if not snmp_config:
-                return jsonify({"error": "Missing SNMP configuration in protocols section"}), 400
-            
-            # Get operation
-            operation = snmp_config.get("operation", "get")
-            if operation not in ["get", "walk", "set"]:
-                return jsonify({"error": f"Unsupported operation: {operation}"}), 400
-            
-            # Build and execute command
-            cmd = build_snmpv3_command(operation, snmp_config)
-            result = execute_snmp_command(cmd)
-            
-            return jsonify(result)
-        
-        except yaml.YAMLError as e:
-            return jsonify({"error": f"Invalid YAML: {str(e)}"}), 400
-        except ValueError as e:
-            return jsonify({"error": str(e)}), 400
-        except Exception as e:
-            return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+        return _handle_snmp_request(_build_snmpv3_command, _forget_v3_engine_on_failure)
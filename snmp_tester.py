@@ -14,7 +14,7 @@ Options:
   --version VER      SNMP version to use (1, 2c, 3) (default: 2c)
   --community STR    Community string for SNMPv1/v2c (default: public)
   --operation OP     Operation to perform (get, walk, set) (default: get)
-  --oid OID          OID to operate on (default: 1.3.6.1.2.1.1.1.0)
+  --oid OID [OID..]  OIDs to operate on, several for get (default: 1.3.6.1.2.1.1.1.0)
   --type TYPE        Type for set operation (i, s, o, a, u) (default: s)
   --value VAL        Value for set operation
   --username USER    SNMPv3 username
@@ -28,13 +28,16 @@ Options:
 
 import argparse
 import subprocess
-import yaml
 import json
-import requests
+try:
+    import orjson # Optional: faster pretty-printing of large API responses when installed
+except ImportError:
+    orjson = None
 import logging
 import sys
 import os
-from contextlib import contextmanager
+import shutil
+import tempfile
 
 # Configure logging
 logging.basicConfig(
@@ -46,6 +49,9 @@ logger = logging.getLogger(__name__)
 # Default gateway IP
 DEFAULT_GATEWAY_IP = "192.168.47.190"
 
+# Repetitions per GETBULK request when walking with SNMPv2c/v3
+BULKWALK_REPETITIONS = 50
+
 # Common OIDs
 COMMON_OIDS = {
     "system": "1.3.6.1.2.1.1.1.0",        # System description
@@ -56,34 +62,27 @@ COMMON_OIDS = {
     "ifOperStatus": "1.3.6.1.2.1.2.2.1.8" # Interface operational status
 }
 
-@contextmanager
-def colored_output(color_code):
-    """Context manager for colored terminal output"""
-    try:
-        sys.stdout.write(f"\033[{color_code}m")
-        yield
-    finally:
-        sys.stdout.write("\033[0m")
+# Message formats with their colour codes applied, so each message is a single write
+_SUCCESS_FORMAT = "\033[32m✓ {}\033[0m"
+_ERROR_FORMAT = "\033[31m✗ {}\033[0m"
+_INFO_FORMAT = "\033[36mℹ {}\033[0m"
+_WARNING_FORMAT = "\033[33m⚠ {}\033[0m"
 
 def print_success(message):
     """Print success message in green"""
-    with colored_output(32):
-        print(f"✓ {message}")
+    print(_SUCCESS_FORMAT.format(message))
 
 def print_error(message):
     """Print error message in red"""
-    with colored_output(31):
-        print(f"✗ {message}")
+    print(_ERROR_FORMAT.format(message))
 
 def print_info(message):
     """Print info message in blue"""
-    with colored_output(36):
-        print(f"ℹ {message}")
+    print(_INFO_FORMAT.format(message))
 
 def print_warning(message):
     """Print warning message in yellow"""
-    with colored_output(33):
-        print(f"⚠ {message}")
+    print(_WARNING_FORMAT.format(message))
 
 def print_separator():
     """Print a separator line"""
@@ -127,9 +126,41 @@ def run_snmp_command(command, verbose=True):
             "command": ' '.join(command) if command else "Unknown"
         }
 
+def iter_snmp_output(command, result):
+    """
+    Run an SNMP command and yield its output line by line as it arrives, so that large
+    walks are never held in memory whole. Once exhausted, result holds the outcome
+    (success, error, command) in the same form as run_snmp_command.
+    """
+    result["command"] = ' '.join(command)
+    # stderr goes to a file so that a chatty agent can never block the command while stdout is read
+    with tempfile.TemporaryFile(mode='w+') as stderr:
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True, bufsize=1)
+        except Exception as e:
+            result.update(success=False, error=str(e))
+            return
+        try:
+            with process.stdout:
+                yield from process.stdout
+        except GeneratorExit:
+            # The caller stopped reading; don't leave the walk running
+            process.kill()
+            process.wait()
+            raise
+        returncode = process.wait()
+        stderr.seek(0)
+        result.update(success=returncode == 0, error=stderr.read())
+
+def command_prefix(operation, version):
+    """Build the tool and version arguments; walks use GETBULK where the version supports it"""
+    if operation == "walk" and version != "1":
+        return ["snmpbulkwalk", f"-v{version}", f"-Cr{BULKWALK_REPETITIONS}"]
+    return [f"snmp{operation}", f"-v{version}"]
+
 def build_snmpv1_command(operation, args):
     """Build SNMPv1 command"""
-    cmd = [f"snmp{operation}", "-v1"]
+    cmd = command_prefix(operation, "1")
     
     # Add community string
     cmd.extend(["-c", args.community])
@@ -138,9 +169,13 @@ def build_snmpv1_command(operation, args):
     host = args.gateway_ip
     target = f"{host}:161"
     
-    # Add OID
+    # Add OIDs; one GET request carries all of them
+    if operation != "get" and len(args.oid) > 1:
+        print_error(f"SNMP {operation} takes a single OID")
+        sys.exit(1)
+    
     cmd.append(target)
-    cmd.append(args.oid)
+    cmd.extend(args.oid)
     
     # Add type and value for set operations
     if operation == "set":
@@ -155,7 +190,7 @@ def build_snmpv1_command(operation, args):
 
 def build_snmpv2c_command(operation, args):
     """Build SNMPv2c command"""
-    cmd = [f"snmp{operation}", "-v2c"]
+    cmd = command_prefix(operation, "2c")
     
     # Add community string
     cmd.extend(["-c", args.community])
@@ -164,9 +199,13 @@ def build_snmpv2c_command(operation, args):
     host = args.gateway_ip
     target = f"{host}:161"
     
-    # Add OID
+    # Add OIDs; one GET request carries all of them
+    if operation != "get" and len(args.oid) > 1:
+        print_error(f"SNMP {operation} takes a single OID")
+        sys.exit(1)
+    
     cmd.append(target)
-    cmd.append(args.oid)
+    cmd.extend(args.oid)
     
     # Add type and value for set operations
     if operation == "set":
@@ -181,7 +220,7 @@ def build_snmpv2c_command(operation, args):
 
 def build_snmpv3_command(operation, args):
     """Build SNMPv3 command"""
-    cmd = [f"snmp{operation}", "-v3"]
+    cmd = command_prefix(operation, "3")
     
     # Add username
     if not args.username:
@@ -219,9 +258,13 @@ def build_snmpv3_command(operation, args):
     host = args.gateway_ip
     target = f"{host}:161"
     
-    # Add OID
+    # Add OIDs; one GET request carries all of them
+    if operation != "get" and len(args.oid) > 1:
+        print_error(f"SNMP {operation} takes a single OID")
+        sys.exit(1)
+    
     cmd.append(target)
-    cmd.append(args.oid)
+    cmd.extend(args.oid)
     
     # Add type and value for set operations
     if operation == "set":
@@ -237,12 +280,18 @@ def build_snmpv3_command(operation, args):
 def generate_yaml_for_gateway(args):
     """Generate YAML configuration for the gateway API"""
     print_info("Generating YAML configuration for gateway API...")
+    # yaml and requests are imported where they are used, as plain direct SNMP tests need neither
+    import yaml
+    try:
+        # libyaml-backed emitter; same safe YAML output, implemented in C
+        from yaml import CSafeDumper as YamlDumper
+    except ImportError:
+        from yaml import SafeDumper as YamlDumper
     
     config = {
         "protocols": {
             "snmp": {
                 "operation": args.operation,
-                "oid": args.oid,
                 "target": {
                     "host": args.gateway_ip,
                     "port": 161
@@ -252,6 +301,11 @@ def generate_yaml_for_gateway(args):
         }
     }
     
+    if len(args.oid) == 1:
+        config["protocols"]["snmp"]["oid"] = args.oid[0]
+    else:
+        config["protocols"]["snmp"]["oids"] = args.oid
+    
     # Add version-specific configuration
     if args.version == "1":
         config["protocols"]["snmp"]["authentication"]["version1"] = {
@@ -283,7 +337,7 @@ def generate_yaml_for_gateway(args):
         config["protocols"]["snmp"]["value"] = args.value
     
     # Convert to YAML
-    yaml_str = yaml.dump(config, default_flow_style=False)
+    yaml_str = yaml.dump(config, Dumper=YamlDumper, default_flow_style=False)
     
     # Save to file
     yaml_path = os.path.join(os.getcwd(), "snmp_config.yaml")
@@ -301,14 +355,27 @@ def generate_yaml_for_gateway(args):
     
     return yaml_str
 
+def format_json(body):
+    """Pretty-print a JSON response body"""
+    if orjson is not None:
+        return orjson.dumps(orjson.loads(body), option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(json.loads(body), indent=2)
+
+# Keep-alive connections to the gateway are reused across API requests
+_session = None
+
 def test_gateway_api(args, yaml_str):
     """Test the gateway API directly"""
     print_info(f"Testing gateway API at {args.gateway_ip}...")
+    import requests
+    global _session
+    if _session is None:
+        _session = requests.Session()
     
     endpoint = f"http://{args.gateway_ip}:5000/api/snmp/v{args.version}"
     
     try:
-        response = requests.post(
+        response = _session.post(
             endpoint,
             data=yaml_str,
             headers={"Content-Type": "application/x-yaml"},
@@ -318,7 +385,7 @@ def test_gateway_api(args, yaml_str):
         if response.status_code == 200:
             print_success(f"API request succeeded: {response.status_code}")
             print_info("Response:")
-            print(json.dumps(response.json(), indent=2))
+            print(format_json(response.content))
         else:
             print_error(f"API request failed: {response.status_code}")
             print_error(f"Response: {response.text}")
@@ -351,6 +418,21 @@ def test_direct_snmp(args):
         print_error(f"Unsupported SNMP version: {args.version}")
         sys.exit(1)
     
+    # Walks can return thousands of lines, which are printed as they arrive
+    if args.operation == "walk":
+        print_info(f"Running command: {' '.join(cmd)}")
+        result = {}
+        print("Output:")
+        for line in iter_snmp_output(cmd, result):
+            sys.stdout.write(line)
+        if result["success"]:
+            print_success("SNMP command succeeded")
+        else:
+            print_error("SNMP command failed")
+            print("Error:")
+            print(result["error"])
+        return
+
     # Execute command
     result = run_snmp_command(cmd)
     
@@ -363,32 +445,32 @@ def test_direct_snmp(args):
         print("Error:")
         print(result["error"])
 
-def parse_arguments():
-    """Parse command line arguments"""
+def _build_parser():
+    """Build the command line argument parser"""
     parser = argparse.ArgumentParser(description='SNMP Testing Script for IoT Gateway')
     
     parser.add_argument('--gateway-ip', type=str, default=DEFAULT_GATEWAY_IP,
                         help=f'IP address of the gateway (default: {DEFAULT_GATEWAY_IP})')
-    parser.add_argument('--version', type=str, choices=['1', '2c', '3'], default='2c',
+    parser.add_argument('--version', type=str, choices=('1', '2c', '3'), default='2c',
                         help='SNMP version (1, 2c, 3) (default: 2c)')
     parser.add_argument('--community', type=str, default='public',
                         help='Community string for SNMPv1/v2c (default: public)')
-    parser.add_argument('--operation', type=str, choices=['get', 'walk', 'set'], default='get',
+    parser.add_argument('--operation', type=str, choices=('get', 'walk', 'set'), default='get',
                         help='Operation to perform (get, walk, set) (default: get)')
-    parser.add_argument('--oid', type=str, default='1.3.6.1.2.1.1.1.0',
-                        help='OID to operate on (default: 1.3.6.1.2.1.1.1.0 - system description)')
+    parser.add_argument('--oid', type=str, nargs='+', default=['1.3.6.1.2.1.1.1.0'],
+                        help='OIDs to operate on; get accepts several (default: 1.3.6.1.2.1.1.1.0 - system description)')
     parser.add_argument('--type', type=str, default='s',
                         help='Type for set operation (i=integer, s=string, etc.) (default: s)')
     parser.add_argument('--value', type=str, help='Value for set operation')
     parser.add_argument('--username', type=str, help='SNMPv3 username')
-    parser.add_argument('--auth-protocol', type=str, choices=['MD5', 'SHA'],
+    parser.add_argument('--auth-protocol', type=str, choices=('MD5', 'SHA'),
                         help='SNMPv3 authentication protocol (MD5, SHA)')
     parser.add_argument('--auth-key', type=str, help='SNMPv3 authentication key')
-    parser.add_argument('--priv-protocol', type=str, choices=['DES', 'AES'],
+    parser.add_argument('--priv-protocol', type=str, choices=('DES', 'AES'),
                         help='SNMPv3 privacy protocol (DES, AES)')
     parser.add_argument('--priv-key', type=str, help='SNMPv3 privacy key')
     parser.add_argument('--security-level', type=str, 
-                        choices=['noAuthNoPriv', 'authNoPriv', 'authPriv'],
+                        choices=('noAuthNoPriv', 'authNoPriv', 'authPriv'),
                         help='SNMPv3 security level (noAuthNoPriv, authNoPriv, authPriv)')
     parser.add_argument('--generate-yaml', action='store_true',
                         help='Generate YAML configuration for gateway API')
@@ -397,25 +479,47 @@ def parse_arguments():
     parser.add_argument('--list-oids', action='store_true',
                         help='List common OIDs for testing')
     
-    return parser.parse_args()
+    return parser
+
+# The parser is built once and reused by every parse_arguments call
+_PARSER = _build_parser()
+
+def parse_arguments(argv=None):
+    """Parse command line arguments, or argv if given"""
+    return _PARSER.parse_args(argv)
 
 def check_snmp_tools():
     """Check if SNMP tools are installed"""
-    tools = ["snmpget", "snmpwalk", "snmpset"]
+    tools = ["snmpget", "snmpwalk", "snmpbulkwalk", "snmpset"]
     
+    # shutil.which searches PATH in-process rather than spawning `which` per tool
     for tool in tools:
-        try:
-            subprocess.run(["which", tool], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.CalledProcessError:
+        if shutil.which(tool) is None:
             print_error(f"{tool} not found. Install net-snmp-utils package.")
             return False
     
     return True
 
-def main():
+# Argument defaults for run(), parsed once
+_defaults = None
+
+def run(**options):
+    """
+    Run the tests from Python, without building a command line for each call, e.g.
+    run(version="2c", operation="walk", oid=["1.3.6.1.2.1.2.2.1.2"])
+    Options are named like the command line arguments; omitted ones take their defaults.
+    """
+    global _defaults
+    if _defaults is None:
+        _defaults = vars(parse_arguments([]))
+    _run(argparse.Namespace(**{**_defaults, **options}))
+
+def main(argv=None):
     # Parse arguments
-    args = parse_arguments()
-    
+    _run(parse_arguments(argv))
+
+def _run(args):
+    """Run the tests selected by args"""
     print_separator()
     print_info("SNMP Testing Script for IoT Gateway")
     print_separator()
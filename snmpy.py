@@ -1,132 +1,103 @@
 #!/usr/bin/env python3
 
-def build_snmpv1_command(operation, config):
-    """Build SNMP v1 command based on the provided configuration"""
-    if not config.get("target", {}).get("host"):
-        raise ValueError("Missing target host in configuration")
-    
-    cmd = [f"snmp{operation}", "-v1"]
-    
-    # Add community string
-    if "community" not in config.get("authentication", {}).get("version1", {}):
-        raise ValueError("Missing community string for SNMPv1")
-    
-    community = config["authentication"]["version1"]["community"]
-    cmd.extend(["-c", community])
-    
-    # Add host
-    host = config["target"]["host"]
-    port = config["target"].get("port", 161)
-    target = f"{host}:{port}"
-    
-    # Add OID
-    if "oid" not in config:
+# Repetitions per GETBULK request when walking with SNMPv2c/v3
+BULKWALK_REPETITIONS = 50
+
+def _command_prefix(operation, version):
+    """Return the tool and version arguments; walks use GETBULK where the version supports it"""
+    if operation == "walk" and version != "1":
+        return ("snmpbulkwalk", f"-v{version}", f"-Cr{BULKWALK_REPETITIONS}")
+    return (f"snmp{operation}", f"-v{version}")
+
+# Command prefixes of every operation and version, built once
+_COMMAND_PREFIXES = {
+    (operation, version): _command_prefix(operation, version)
+    for operation in ("get", "walk", "set")
+    for version in ("1", "2c", "3")
+}
+
+# SNMPv3 (option, config key) pairs per security level, with the error raised when a key is missing
+_V3_AUTH_ARGS = ((("-a", "auth_protocol"), ("-A", "auth_passphrase")), "Missing authentication protocol or passphrase for SNMPv3")
+_V3_PRIV_ARGS = ((("-x", "priv_protocol"), ("-X", "priv_passphrase")), "Missing privacy protocol or passphrase for SNMPv3")
+_V3_SECURITY_ARGS = {
+    "authNoPriv": (_V3_AUTH_ARGS,),
+    "authPriv": (_V3_AUTH_ARGS, _V3_PRIV_ARGS),
+}
+
+def get_oids(operation, config):
+    """Return the OIDs of the configuration: 'oids' lists several, 'oid' names a single one"""
+    if "oids" in config:
+        oids = config["oids"]
+        if not isinstance(oids, list) or not oids:
+            raise ValueError("'oids' must be a non-empty list")
+    elif "oid" in config:
+        oids = [config["oid"]]
+    else:
         raise ValueError("Missing OID in configuration")
     
-    cmd.append(target)
-    cmd.append(config["oid"])
-    
-    # Add type and value for set operations
-    if operation == "set":
-        if "type" not in config or "value" not in config:
-            raise ValueError("Missing type or value for SNMP set operation")
-        cmd.append(config["type"])
-        cmd.append(config["value"])
-    
-    return cmd
+    # Only GET carries several OIDs in one request
+    if operation != "get" and len(oids) > 1:
+        raise ValueError(f"SNMP {operation} takes a single OID")
+    return oids
 
-def build_snmpv2c_command(operation, config):
-    """Build SNMP v2c command based on the provided configuration"""
+def _command_start(operation, version, config):
+    """Check the target host and return the tool and version arguments"""
     if not config.get("target", {}).get("host"):
         raise ValueError("Missing target host in configuration")
     
-    cmd = [f"snmp{operation}", "-v2c"]
-    
-    # Add community string
-    if "community" not in config.get("authentication", {}).get("version2c", {}):
-        raise ValueError("Missing community string for SNMPv2c")
-    
-    community = config["authentication"]["version2c"]["community"]
-    cmd.extend(["-c", community])
-    
-    # Add host
-    host = config["target"]["host"]
-    port = config["target"].get("port", 161)
-    target = f"{host}:{port}"
-    
-    # Add OID
-    if "oid" not in config:
-        raise ValueError("Missing OID in configuration")
+    return _COMMAND_PREFIXES.get((operation, version)) or _command_prefix(operation, version)
+
+def _target_args(operation, config):
+    """Return the target, the OIDs and, for set operations, the type and value"""
+    target = config["target"]
+    oids = get_oids(operation, config)
     
-    cmd.append(target)
-    cmd.append(config["oid"])
+    # One GET request carries all OIDs
+    args = (f"{target['host']}:{target.get('port', 161)}", *oids)
     
-    # Add type and value for set operations
     if operation == "set":
         if "type" not in config or "value" not in config:
             raise ValueError("Missing type or value for SNMP set operation")
-        cmd.append(config["type"])
-        cmd.append(config["value"])
+        args += (config["type"], config["value"])
     
-    return cmd
+    return args
 
-def build_snmpv3_command(operation, config):
-    """Build SNMP v3 command based on the provided configuration"""
-    if not config.get("target", {}).get("host"):
-        raise ValueError("Missing target host in configuration")
+def _build_community_command(operation, config, version, auth_key, label):
+    """Build an SNMP v1/v2c command, which authenticates with a community string"""
+    start = _command_start(operation, version, config)
     
-    cmd = [f"snmp{operation}", "-v3"]
+    auth = config.get("authentication", {}).get(auth_key, {})
+    if "community" not in auth:
+        raise ValueError(f"Missing community string for {label}")
+    
+    return (*start, "-c", auth["community"], *_target_args(operation, config))
+
+def build_snmpv1_command(operation, config):
+    """Build SNMP v1 command based on the provided configuration"""
+    return _build_community_command(operation, config, "1", "version1", "SNMPv1")
+
+def build_snmpv2c_command(operation, config):
+    """Build SNMP v2c command based on the provided configuration"""
+    return _build_community_command(operation, config, "2c", "version2c", "SNMPv2c")
+
+def build_snmpv3_command(operation, config, engine_args=()):
+    """
+    Build SNMP v3 command based on the provided configuration
+    engine_args are extra options such as a known engine ID (-e) and boots/time (-Z)
+    """
+    start = _command_start(operation, "3", config)
     
     v3_auth = config.get("authentication", {}).get("version3", {})
     if not v3_auth.get("username"):
         raise ValueError("Missing username for SNMPv3")
     
-    # Add username
-    cmd.extend(["-u", v3_auth["username"]])
-    
-    # Add security level
     level = v3_auth.get("level", "noAuthNoPriv")
-    cmd.extend(["-l", level])
-    
-    # Add authentication protocol and passphrase if needed
-    if level in ["authNoPriv", "authPriv"]:
-        if not v3_auth.get("auth_protocol") or not v3_auth.get("auth_passphrase"):
-            raise ValueError("Missing authentication protocol or passphrase for SNMPv3")
-        
-        auth_protocol = v3_auth["auth_protocol"]
-        auth_passphrase = v3_auth["auth_passphrase"]
-        
-        cmd.extend(["-a", auth_protocol])
-        cmd.extend(["-A", auth_passphrase])
     
-    # Add privacy protocol and passphrase if needed
-    if level == "authPriv":
-        if not v3_auth.get("priv_protocol") or not v3_auth.get("priv_passphrase"):
-            raise ValueError("Missing privacy protocol or passphrase for SNMPv3")
-        
-        priv_protocol = v3_auth["priv_protocol"]
-        priv_passphrase = v3_auth["priv_passphrase"]
-        
-        cmd.extend(["-x", priv_protocol])
-        cmd.extend(["-X", priv_passphrase])
-    
-    # Add host
-    host = config["target"]["host"]
-    port = config["target"].get("port", 161)
-    target = f"{host}:{port}"
-    
-    # Add OID
-    if "oid" not in config:
-        raise ValueError("Missing OID in configuration")
-    
-    cmd.append(target)
-    cmd.append(config["oid"])
-    
-    # Add type and value for set operations
-    if operation == "set":
-        if "type" not in config or "value" not in config:
-            raise ValueError("Missing type or value for SNMP set operation")
-        cmd.append(config["type"])
-        cmd.append(config["value"])
+    # The authentication and privacy protocols and passphrases the security level needs
+    security_args = ()
+    for option_keys, error in _V3_SECURITY_ARGS.get(level, ()):
+        if not all(v3_auth.get(key) for _, key in option_keys):
+            raise ValueError(error)
+        security_args += tuple(arg for option, key in option_keys for arg in (option, v3_auth[key]))
     
-    return cmd
+    return (*start, *engine_args, "-u", v3_auth["username"], "-l", level, *security_args, *_target_args(operation, config))
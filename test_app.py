@@ -2,15 +2,29 @@
 import unittest
 import yaml
 import json
+import os
+import tempfile
+import modbus_master
 from app import app
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+try:
+    # Optional: the OPC UA backend tests need FastAPI, SQLModel and asyncua
+    import opcua_backend
+    from fastapi.testclient import TestClient
+    from sqlalchemy.pool import StaticPool
+    from sqlmodel import Session, SQLModel, create_engine
+except ImportError:
+    opcua_backend = None
+
+app.config['TESTING'] = True
 
 class TestSNMPServer(unittest.TestCase):
-    def setUp(self):
-        app.config['TESTING'] = True
-        self.client = app.test_client()
+    @classmethod
+    def setUpClass(cls):
+        # The client keeps no state between requests, so all tests share one
+        cls.client = app.test_client()
     
-    @patch('app.execute_snmp_command')
+    @patch('routes.execute_snmp_command')
     def test_snmpv1_get(self, mock_execute):
         # Set up mock
         mock_execute.return_value = {
@@ -47,7 +61,7 @@ class TestSNMPServer(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertEqual(data['output'], "SNMPv1-MIB::sysDescr.0 = STRING: Test System Description")
     
-    @patch('app.execute_snmp_command')
+    @patch('routes.execute_snmp_command')
     def test_snmpv2c_walk(self, mock_execute):
         # Set up mock
         mock_execute.return_value = {
@@ -84,7 +98,7 @@ class TestSNMPServer(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertIn("SNMPv2-MIB::sysDescr.0", data['output'])
     
-    @patch('app.execute_snmp_command')
+    @patch('routes.execute_snmp_command')
     def test_snmpv3_get(self, mock_execute):
         # Set up mock
         mock_execute.return_value = {
@@ -126,7 +140,43 @@ class TestSNMPServer(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertEqual(data['output'], "SNMPv2-MIB::sysDescr.0 = STRING: Test System Description")
     
-    @patch('app.execute_snmp_command')
+    @patch('routes.execute_snmp_command')
+    def test_snmpv3_unreachable_agent(self, mock_execute):
+        mock_execute.return_value = {
+            "success": False,
+            "error": "Command returned non-zero exit status 1.",
+            "stderr": "Timeout: No Response from 192.168.1.2:161.",
+            "command": "snmpget -v3 -u snmpuser -l authNoPriv -a SHA -A authpassword 192.168.1.2:161"
+        }
+        
+        test_yaml = """
+        protocols:
+          snmp:
+            operation: get
+            target:
+              host: 192.168.1.2
+              port: 161
+            authentication:
+              version3:
+                username: snmpuser
+                level: authNoPriv
+                auth_protocol: SHA
+                auth_passphrase: authpassword
+            oid: 1.3.6.1.2.1.1.1.0
+        """
+        
+        # The failed engine discovery is reported without running the command itself
+        response = self.client.post('/api/snmp/v3', data=test_yaml, content_type='application/x-yaml')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(json.loads(response.data)['success'])
+        self.assertEqual(mock_execute.call_count, 1)
+        
+        # Discovery is not retried right away; the next request runs just the command
+        response = self.client.post('/api/snmp/v3', data=test_yaml, content_type='application/x-yaml')
+        self.assertFalse(json.loads(response.data)['success'])
+        self.assertEqual(mock_execute.call_count, 2)
+    
+    @patch('routes.execute_snmp_command')
     def test_snmpv2c_set(self, mock_execute):
         # Set up mock
         mock_execute.return_value = {
@@ -195,5 +245,127 @@ class TestSNMPServer(unittest.TestCase):
         self.assertIn("error", data)
         self.assertIn("Missing SNMP configuration", data["error"])
 
+class TestModbus(unittest.TestCase):
+    def setUp(self):
+        # Keep the snapshot and journal out of the working tree
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        for name, file_name in (('CSV_FILE_PATH', 'modbus_tags.csv'), ('JOURNAL_FILE_PATH', 'modbus_ops.log')):
+            patcher = patch.object(modbus_master, name, os.path.join(tmp_dir.name, file_name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_reload_after_remove(self):
+        config = {"modbus": {"slaves": [
+            {"slave_name": "pump", "ip_address": "127.0.0.1", "address": 40001},
+            {"slave_name": "valve", "ip_address": "127.0.0.1", "address": 1},
+        ]}}
+        master = modbus_master.ModbusMaster(config)
+        master.remove_slave("pump")
+        
+        reloaded = modbus_master.ModbusMaster()
+        self.assertTrue(reloaded.load_from_csv())
+        self.assertEqual(set(reloaded.tags), {"valve"})
+        
+        # A master built from a fresh configuration starts a new snapshot without earlier removals
+        modbus_master.ModbusMaster(config)
+        reloaded = modbus_master.ModbusMaster()
+        self.assertTrue(reloaded.load_from_csv())
+        self.assertEqual(set(reloaded.tags), {"pump", "valve"})
+    
+    def test_write_with_malformed_slave_id(self):
+        config = {"modbus": {"slaves": [
+            {"slave_name": "pump", "ip_address": "127.0.0.1", "address": 40001, "slave_id": "x"},
+        ]}}
+        master = modbus_master.ModbusMaster(config)
+        master.clients["pump"] = client = MagicMock()
+        
+        # Rejected instead of being written to unit 1
+        self.assertFalse(master.write_data_fast("pump", 5))
+        client.write_register.assert_not_called()
+    
+    def test_execute_retries_only_dropped_connections(self):
+        master = modbus_master.ModbusMaster()
+        client = MagicMock()
+        client.read_coils.side_effect = modbus_master.ConnectionException("Failed to connect")
+        
+        # A fresh connect that fails is not paid for twice
+        client.is_socket_open.return_value = False
+        with self.assertRaises(modbus_master.ConnectionException):
+            master._execute(client, "read_coils", 0, 1, unit=1)
+        self.assertEqual(client.read_coils.call_count, 1)
+        
+        # A connection that was open and dropped is reconnected once
+        client.is_socket_open.return_value = True
+        with self.assertRaises(modbus_master.ConnectionException):
+            master._execute(client, "read_coils", 0, 1, unit=1)
+        self.assertEqual(client.read_coils.call_count, 3)
+    
+    def test_add_slave_rejects_non_mapping(self):
+        import modbus_routes
+        self.addCleanup(lambda: modbus_routes.HANDLE.ref and modbus_routes.HANDLE.ref.stop_scanning())
+        response = app.test_client().post('/api/modbus/add-slave', json=["pump"])
+        self.assertEqual(response.status_code, 400)
+    
+    def test_reconfigure_after_remove(self):
+        import modbus_routes
+        config = {"modbus": {"slaves": [
+            {"slave_name": "pump", "ip_address": "127.0.0.1", "port": 1, "address": 40001},
+            {"slave_name": "valve", "ip_address": "127.0.0.1", "port": 1, "address": 1},
+        ]}}
+        client = app.test_client()
+        self.addCleanup(lambda: modbus_routes.HANDLE.ref and modbus_routes.HANDLE.ref.stop_scanning())
+        
+        self.assertEqual(client.post('/api/modbus/configure', json=config).status_code, 200)
+        self.assertEqual(client.delete('/api/modbus/remove-slave/pump').status_code, 200)
+        
+        # The same configuration must be applied again, since the tags changed in between
+        data = json.loads(client.post('/api/modbus/configure', json=config).data)
+        self.assertNotIn("cached", data)
+        self.assertEqual(data["slave_count"], 2)
+
+@unittest.skipIf(opcua_backend is None, "OPC UA backend dependencies are not installed")
+class TestOpcUaNodeBatch(unittest.TestCase):
+    def setUp(self):
+        # One in-memory database shared by the test client's threads
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        SQLModel.metadata.create_all(engine)
+        def get_db():
+            with Session(engine) as session:
+                yield session
+        opcua_backend.app.dependency_overrides[opcua_backend.get_db] = get_db
+        self.addCleanup(opcua_backend.app.dependency_overrides.clear)
+        opcua_backend.app.state.nodes_version = 0
+        self.client = TestClient(opcua_backend.app)
+        self.batch({"creates": [self.node("A"), self.node("B")]})
+    
+    @staticmethod
+    def node(node_id, name=None):
+        name = name or node_id
+        return {"name": name, "node_id": node_id, "data_type": "Double", "browse_name": name, "display_name": name}
+    
+    def batch(self, body):
+        response = self.client.post('/api/nodes/batch', json=body)
+        self.assertEqual(response.status_code, 200)
+        return [result["status"] for result in response.json()["results"]]
+    
+    def nodes(self):
+        return {node["node_id"]: node["name"] for node in self.client.get('/api/nodes').json()}
+    
+    def test_delete_and_recreate(self):
+        statuses = self.batch({"deletes": ["A", "missing"], "creates": [self.node("A", "new"), self.node("B")]})
+        self.assertEqual(statuses, [204, 404, 201, 400])
+        self.assertEqual(self.nodes(), {"A": "new", "B": "B"})
+    
+    def test_update_takes_deleted_node_id(self):
+        statuses = self.batch({"deletes": ["A"], "updates": {"B": self.node("A", "renamed")}})
+        self.assertEqual(statuses, [204, 200])
+        self.assertEqual(self.nodes(), {"A": "renamed"})
+    
+    def test_update_of_deleted_node(self):
+        statuses = self.batch({"deletes": ["A"], "updates": {"A": self.node("A", "renamed")}})
+        self.assertEqual(statuses, [204, 404])
+        self.assertEqual(self.nodes(), {"B": "B"})
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,22 @@
 #!/usr/bin/env python3
+import asyncio
 import subprocess
+import time
+
+# snmpEngineID, snmpEngineBoots and snmpEngineTime (SNMP-FRAMEWORK-MIB) of an SNMPv3 agent
+SNMP_ENGINE_OIDS = ["1.3.6.1.6.3.10.2.1.1.0", "1.3.6.1.6.3.10.2.1.2.0", "1.3.6.1.6.3.10.2.1.3.0"]
+
+# Net-SNMP output options printing bare values, octet strings as hex and no units
+SNMP_ENGINE_OUTPUT_OPTIONS = "-OqvxU"
+
+# (host, port) -> (engine ID, boots, engine time, time.monotonic() when read) of known SNMPv3 agents
+_v3_engines = {}
+
+# Seconds during which an agent whose engine parameters could not be read is sent plain commands
+V3_ENGINE_RETRY_DELAY = 60
+
+# (host, port) -> time.monotonic() before which reading the agent's engine parameters is not retried
+_v3_engine_failures = {}
 
 def execute_snmp_command(command):
     """
@@ -30,3 +47,88 @@ def execute_snmp_command(command):
             "error": str(e),
             "command": " ".join(command) if command else "Unknown"
         }
+
+async def execute_snmp_command_async(command):
+    """
+    Execute an SNMP command without blocking the event loop and return the result
+    in the same form as execute_snmp_command
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "command": " ".join(command) if command else "Unknown"
+        }
+    if process.returncode != 0:
+        return {
+            "success": False,
+            "error": str(subprocess.CalledProcessError(process.returncode, command)),
+            "stderr": stderr.decode(errors="replace"),
+            "command": " ".join(command)
+        }
+    return {
+        "success": True,
+        "output": stdout.decode(errors="replace"),
+        "command": " ".join(command)
+    }
+
+def execute_snmp_commands(commands):
+    """
+    Execute several SNMP commands concurrently and return their results in order,
+    so a batch takes as long as its slowest command rather than the sum of all of them
+    """
+    async def execute_all():
+        return await asyncio.gather(*(execute_snmp_command_async(command) for command in commands))
+    return asyncio.run(execute_all())
+
+def v3_engine_args(host, port):
+    """
+    Return the Net-SNMP options that supply a known agent's engine ID and boots/time,
+    so SNMPv3 commands skip the discovery and time synchronisation round trips
+    """
+    engine = _v3_engines.get((host, port))
+    if engine is None:
+        return []
+    engine_id, boots, engine_time, read_at = engine
+    return ["-e", engine_id, "-Z", f"{boots},{engine_time + int(time.monotonic() - read_at)}"]
+
+def v3_engine_discovery_due(host, port):
+    """Whether an agent's engine parameters are unknown and reading them hasn't failed recently"""
+    if (host, port) in _v3_engines:
+        return False
+    retry_at = _v3_engine_failures.get((host, port))
+    return retry_at is None or time.monotonic() >= retry_at
+
+def learn_v3_engine(host, port, command, execute=execute_snmp_command):
+    """
+    Execute command, an snmpget of SNMP_ENGINE_OIDS with SNMP_ENGINE_OUTPUT_OPTIONS, through
+    execute and remember the agent's engine parameters for v3_engine_args
+    Returns the result of the command; if no parameters were learned, discovery is not
+    retried for V3_ENGINE_RETRY_DELAY seconds
+    """
+    result = execute(command)
+    try:
+        if not result["success"]:
+            raise ValueError(result.get("error"))
+        lines = result["output"].splitlines()
+        engine_id = "".join(lines[0].strip().strip('"').split())
+        bytes.fromhex(engine_id) # Validate
+        boots = int(lines[1].split()[0])
+        engine_time = int(lines[2].split()[0])
+    except (IndexError, ValueError):
+        _v3_engine_failures[(host, port)] = time.monotonic() + V3_ENGINE_RETRY_DELAY
+        return result
+    _v3_engine_failures.pop((host, port), None)
+    _v3_engines[(host, port)] = (f"0x{engine_id}", boots, engine_time, time.monotonic())
+    return result
+
+def forget_v3_engine(host, port):
+    """Forget an agent's engine parameters, e.g. after a command using them failed"""
+    _v3_engines.pop((host, port), None)
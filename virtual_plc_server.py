@@ -1,20 +1,69 @@
 # virtual_plc_server.py
 import asyncio
 import logging
+import multiprocessing
 import os
-import subprocess
+import sqlite3
 import sys 
+from collections import defaultdict
 from typing import Dict, Optional, List, Any
 import datetime
 from asyncua import Server, ua
 from asyncua.ua import SecurityPolicyType 
 from asyncua.server.user_managers import UserManager
 from asyncua.server.history_sql import HistorySQLite
+from asyncua.common.sql_injection import validate_table_name
+from asyncua.ua.ua_binary import variant_to_binary
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+try:
+    import uvloop # Optional: libuv-based event loop with cheaper socket I/O for the servers
+except ImportError:
+    uvloop = None
 
 # Setup logger
 _logger = logging.getLogger(__name__)
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s') # Configured in __main__
 
+# SecurityPolicyType members by (policy, mode), e.g. ("Basic256Sha256", "SignAndEncrypt"); NoSecurity has no mode
+_SECURITY_POLICY_TYPES = {
+    tuple(policy_type.name.split("_", 1)) if "_" in policy_type.name else (policy_type.name, None): policy_type
+    for policy_type in SecurityPolicyType
+}
+
+def generate_server_certificate(key_path: str, cert_path: str, plc_name: str, days: int = 365):
+    """Writes a new RSA key (PEM) and a self-signed server certificate (DER) for a virtual PLC"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    subject = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, plc_name),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "VirtualPLC"),
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
+        x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "California"),
+        x509.NameAttribute(NameOID.LOCALITY_NAME, "CityName"),
+    ])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=days))
+        .sign(key, hashes.SHA256())
+    )
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+    os.chmod(key_path, 0o600)
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.DER))
+
 # Basic user manager for authentication
 class SimpleUserManager(UserManager):
     def __init__(self, username_password_map):
@@ -28,6 +77,130 @@ class SimpleUserManager(UserManager):
         _logger.warning(f"Failed authentication for user: {user_name}")
         return False
 
+# Write-ahead logging appends commits to the WAL instead of rewriting a rollback journal and lets
+# history reads proceed alongside writes; NORMAL sync skips the fsync on every commit in WAL mode
+HISTORY_DB_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-16384;
+PRAGMA mmap_size=67108864;
+"""
+
+class BatchedHistorySQLite(HistorySQLite):
+    """
+    SQLite history that commits once per simulation tick instead of once per value change:
+    save_node_value only queues the row, and flush() inserts everything queued since the
+    last tick, trims each table to its history limits and commits, all in one transaction
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self._pending_rows = defaultdict(list) # node_id -> rows queued since the last flush
+
+    async def init(self):
+        await super().init()
+        await self._db.executescript(HISTORY_DB_PRAGMAS)
+
+    async def save_node_value(self, node_id, datavalue):
+        self._pending_rows[node_id].append((
+            datavalue.ServerTimestamp,
+            datavalue.SourceTimestamp,
+            datavalue.StatusCode.value,
+            str(datavalue.Value.Value),
+            datavalue.Value.VariantType.name,
+            sqlite3.Binary(variant_to_binary(datavalue.Value)),
+        ))
+
+    async def flush(self):
+        if not self._pending_rows:
+            return
+        pending_rows, self._pending_rows = self._pending_rows, defaultdict(list)
+        try:
+            for node_id, rows in pending_rows.items():
+                table = self._get_table_name(node_id)
+                validate_table_name(table)
+                await self._db.executemany(f'INSERT INTO "{table}" VALUES (NULL, ?, ?, ?, ?, ?, ?)', rows)
+                period, count = self._datachanges_period[node_id]
+                if period:
+                    date_limit = datetime.datetime.now(datetime.timezone.utc) - period
+                    await self._db.execute(f'DELETE FROM "{table}" WHERE SourceTimestamp < ?', (date_limit,))
+                if count:
+                    # Keep only the newest count rows
+                    await self._db.execute(
+                        f'DELETE FROM "{table}" WHERE _Id <= (SELECT _Id FROM "{table}" ORDER BY _Id DESC LIMIT 1 OFFSET ?)',
+                        (count,)
+                    )
+            await self._db.commit()
+        except sqlite3.Error as e:
+            _logger.error(f"Failed to write history batch to {self._db_file}: {e}")
+            await self._db.rollback()
+
+    async def stop(self):
+        await self.flush()
+        await super().stop()
+
+# Every value the byte-sized simulated nodes can take, created once; the wrappers are immutable ints
+_BYTE_VALUES = tuple(ua.Byte(i) for i in range(256))
+_SBYTE_VALUES = tuple(ua.SByte(i) for i in range(128))
+
+# Values written to counter-driven simulated nodes on each tick, by node id; the counter never goes
+# negative, so masking wraps it like the modulo of the matching power of two
+_COUNTER_VALUES = {
+    "SimulatedString": lambda counter: f"String_{counter % 10}",
+    "SimulatedDateTime": lambda counter: datetime.datetime.now(),
+    "SimulatedByte": lambda counter: _BYTE_VALUES[counter & 0xFF],
+    "SimulatedSByte": lambda counter: _SBYTE_VALUES[counter & 0x7F],
+    "SimulatedInt16": lambda counter: ua.Int16(counter & 0x7FFF),
+    "SimulatedUInt16": lambda counter: ua.UInt16(counter & 0xFFFF),
+    "SimulatedInt32": lambda counter: ua.Int32(counter & 0x7FFFFFFF),
+    "SimulatedUInt32": lambda counter: ua.UInt32(counter & 0xFFFFFFFF),
+    "SimulatedFloat": lambda counter: ua.Float(counter % 1000),
+    "SimulatedDouble": lambda counter: ua.Double(counter % 1000.0),
+}
+
+def _make_node_updater(server, node_suffix, node):
+    """
+    Returns the coroutine function that writes the next simulated value of node on each tick,
+    or None if node_suffix is not a simulated node. It takes the PLC's simulation state
+    (the tick counter) and returns the node's new value.
+    Current values are read straight from the server's address space, which picks up
+    client writes without issuing a read service call per tick.
+    """
+    if node_suffix == "SimulatedAnalogValue":
+        async def update(state):
+            new_val = server.read_attribute_value(node.nodeid).Value.Value + 0.5
+            await node.write_value(new_val) # Assuming Double, cast if necessary
+            return new_val
+    elif node_suffix == "SimulatedCounter":
+        async def update(state):
+            state["counter"] += 1
+            new_val = ua.Int32(state["counter"]) # Explicitly cast to Int32
+            await node.write_value(new_val)
+            return new_val
+    elif node_suffix == "SimulatedBoolean":
+        async def update(state):
+            new_val = not server.read_attribute_value(node.nodeid).Value.Value
+            await node.write_value(new_val)
+            return new_val
+    elif node_suffix in _COUNTER_VALUES:
+        value_for = _COUNTER_VALUES[node_suffix]
+        written_counter = None
+        async def update(state):
+            nonlocal written_counter
+            counter = state["counter"]
+            new_val = value_for(counter)
+            # These values follow the tick counter, which advances every tick when the PLC has a
+            # SimulatedCounter node, so they are then written without comparing. Without one the
+            # counter stands still and an unchanged value is not rewritten, sparing the history
+            # insert and the client notifications a write would trigger
+            if counter != written_counter or server.read_attribute_value(node.nodeid).Value.Value != new_val:
+                await node.write_value(new_val)
+                written_counter = counter
+            return new_val
+    else:
+        return None
+    return update
+
 async def run_virtual_plc_server(
     plc_name: str, 
     url: str, 
@@ -45,14 +218,6 @@ async def run_virtual_plc_server(
     server = Server()
     await server.init()
 
-    # DEBUG: Check available server methods for security configuration
-    _logger.info(f"DEBUG SERVER METHODS for {plc_name}: Available attributes on server object: dir(server) partially shown for brevity if too long")
-    # To avoid excessively long logs, let's check for specific ones:
-    _logger.info(f"DEBUG SERVER METHODS for {plc_name}: hasattr(server, 'set_security_policies'): {hasattr(server, 'set_security_policies')}")
-    _logger.info(f"DEBUG SERVER METHODS for {plc_name}: hasattr(server, 'set_security_policy'): {hasattr(server, 'set_security_policy')}") # Singular
-    _logger.info(f"DEBUG SERVER METHODS for {plc_name}: hasattr(server, 'set_security'): {hasattr(server, 'set_security')}") # Generic method often used for endpoints
-    _logger.info(f"DEBUG SERVER METHODS for {plc_name}: type(server): {type(server)}")
-
     server.set_endpoint(url)
     server.set_server_name(f"VirtualOPCUAPLC_{plc_name}")
     server.set_application_uri(f"urn:virtualplc:{plc_name.replace(' ', '_')}") # Required for security
@@ -62,6 +227,7 @@ async def run_virtual_plc_server(
     _logger.info(f"Virtual PLC '{plc_name}' namespace registered at index: {idx}")
     
     history_successfully_enabled = False
+    history_backend = None
     if enable_history:
         _logger.info(f"Attempting to enable history for {plc_name}...")
         try:
@@ -74,7 +240,7 @@ async def run_virtual_plc_server(
                 _logger.error(f"aiosqlite library not found for {plc_name}. History will be disabled. Please install aiosqlite.")
                 raise
             
-            history_backend = HistorySQLite(db_path)
+            history_backend = BatchedHistorySQLite(db_path)
             # The init method of HistorySQLite is async and needs to be awaited.
             if hasattr(history_backend, 'init') and asyncio.iscoroutinefunction(history_backend.init):
                  _logger.info(f"Explicitly calling await history_backend.init() for {plc_name}")
@@ -88,6 +254,7 @@ async def run_virtual_plc_server(
         except Exception as e_hist_storage:
             _logger.error(f"Failed to set history storage for {plc_name}: {e_hist_storage}. History will be disabled.")
             history_successfully_enabled = False
+            history_backend = None
     
     # Setup authentication if needed
     if username and password:
@@ -108,19 +275,10 @@ async def run_virtual_plc_server(
                 await server.load_private_key(key_path)
                 _logger.info(f"Certificates loaded successfully for {plc_name} for policy {security_policy}.")
                 
-                # Construct the full enum member name, e.g., Basic256Sha256_SignAndEncrypt
-                full_policy_name = security_policy
-                if security_mode and security_mode.lower() != "none":
-                    # Append mode, ensuring typical OPC UA naming (e.g., _Sign, _SignAndEncrypt)
-                    mode_suffix = "_" + security_mode.replace("And", "_And_") # Basic256_Sign, Basic256_Sign_And_Encrypt - adjust as per actual enum names
-                    # A common pattern is just Policy_Mode, e.g. Basic256Sha256_Sign
-                    # Let's assume simpler concatenation for now, like PolicyName_ModeName
-                    # Example: Basic256Sha256_Sign, Basic256Sha256_SignAndEncrypt
-                    # The exact enum names in SecurityPolicyType matter here.
-                    # For example, SecurityPolicyType.Basic256Sha256_Sign, SecurityPolicyType.Basic256Sha256_SignAndEncrypt
-                    full_policy_name = f"{security_policy}_{security_mode}"
-                
-                selected_policy_enum = getattr(SecurityPolicyType, full_policy_name, None)
+                # Look up the enum member, e.g., Basic256Sha256_SignAndEncrypt for ("Basic256Sha256", "SignAndEncrypt")
+                mode = security_mode if security_mode and security_mode.lower() != "none" else None
+                full_policy_name = f"{security_policy}_{mode}" if mode else security_policy
+                selected_policy_enum = _SECURITY_POLICY_TYPES.get((security_policy, mode))
                 
                 if selected_policy_enum and selected_policy_enum != SecurityPolicyType.NoSecurity:
                     policies_to_set = [selected_policy_enum, SecurityPolicyType.NoSecurity] # Offer both secure and insecure
@@ -163,7 +321,8 @@ async def run_virtual_plc_server(
     _logger.info(f"Created folder for {plc_name} variables")
     
     # Add variables to the address space
-    simulated_nodes = {}
+    node_updaters = {}
+    attribute_writes = [] # Description and access level writes, applied together once all variables exist
     for variable_config in variables_config:
         node_id_suffix = variable_config["node_id"]
         var_type = variable_config["type"]
@@ -197,13 +356,14 @@ async def run_virtual_plc_server(
         )
         
         # Set Description attribute (DisplayName is set by add_variable via bname)
-        await variable_node.write_attribute(ua.AttributeIds.Description, 
-                                          ua.DataValue(ua.LocalizedText(f"Simulated {node_id_suffix} for {plc_name}")))
+        attribute_writes.append(variable_node.write_attribute(ua.AttributeIds.Description, 
+                                          ua.DataValue(ua.LocalizedText(f"Simulated {node_id_suffix} for {plc_name}"))))
         
         # Make it writable
-        await variable_node.set_writable()
+        attribute_writes.append(variable_node.set_writable())
         
-        # Enable history for this variable if requested
+        # Enable history for this variable if requested. This stays sequential: the history manager
+        # creates its subscription on the first call, and concurrent first calls would each create one
         if history_successfully_enabled:
             try:
                 await server.historize_node_data_change(variable_node, period=None, count=100)
@@ -213,64 +373,48 @@ async def run_virtual_plc_server(
         elif enable_history:
             _logger.warning(f"Skipping historization for variable '{node_id_suffix}' in {plc_name} due to earlier history storage setup failure.")
         
-        # Store node for later updates
-        simulated_nodes[node_id_suffix] = variable_node
+        # Store the node's update for the simulation loop
+        update = _make_node_updater(server, node_id_suffix, variable_node)
+        if update is not None:
+            node_updaters[node_id_suffix] = update
         _logger.info(f"Added variable '{node_id_suffix}' to {plc_name}")
+    await asyncio.gather(*attribute_writes)
     
     _logger.info(f"Starting Virtual PLC Server '{plc_name}' on {url}")
     
     # Start server and run simulation loop
     async with server:
-        counter_val = 0
+        state = {"counter": 0}
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
         while True:
-            await asyncio.sleep(1)
-            # Simulate data changes for each node
-            for node_suffix, node_obj in simulated_nodes.items():
-                try:
-                    if node_suffix == "SimulatedAnalogValue":
-                        new_val = await node_obj.get_value() + 0.5
-                        await node_obj.write_value(new_val) # Assuming Double, cast if necessary
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {new_val:.1f}")
-                    elif node_suffix == "SimulatedCounter":
-                        counter_val += 1
-                        await node_obj.write_value(ua.Int32(counter_val)) # Explicitly cast to Int32
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {counter_val}")
-                    elif node_suffix == "SimulatedBoolean":
-                        current_bool = await node_obj.get_value()
-                        await node_obj.write_value(not current_bool)
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {not current_bool}")
-                    elif node_suffix == "SimulatedString":
-                        await node_obj.write_value(f"String_{counter_val % 10}")
-                        _logger.debug(f"[{plc_name}] {node_suffix} = String_{counter_val % 10}")
-                    elif node_suffix == "SimulatedDateTime":
-                        await node_obj.write_value(datetime.datetime.now())
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {datetime.datetime.now()}")
-                    elif node_suffix == "SimulatedByte":
-                        await node_obj.write_value(ua.Byte(counter_val % 256))
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {counter_val % 256}")
-                    elif node_suffix == "SimulatedSByte":
-                        await node_obj.write_value(ua.SByte(counter_val % 128))
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {counter_val % 128}")
-                    elif node_suffix == "SimulatedInt16":
-                        await node_obj.write_value(ua.Int16(counter_val % 32768))
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {counter_val % 32768}")
-                    elif node_suffix == "SimulatedUInt16":
-                        await node_obj.write_value(ua.UInt16(counter_val % 65536))
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {counter_val % 65536}")
-                    elif node_suffix == "SimulatedInt32":
-                        await node_obj.write_value(ua.Int32(counter_val % 2147483648))
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {counter_val % 2147483648}")
-                    elif node_suffix == "SimulatedUInt32":
-                        await node_obj.write_value(ua.UInt32(counter_val % 4294967296))
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {counter_val % 4294967296}")
-                    elif node_suffix == "SimulatedFloat":
-                        await node_obj.write_value(ua.Float(counter_val % 1000))
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {counter_val % 1000}")
-                    elif node_suffix == "SimulatedDouble":
-                        await node_obj.write_value(ua.Double(counter_val % 1000.0))
-                        _logger.debug(f"[{plc_name}] {node_suffix} = {counter_val % 1000.0}")
-                except Exception as e:
-                    _logger.error(f"Error updating {node_suffix} in {plc_name}: {e}")
+            # Wake on whole seconds since start, so the time spent updating doesn't make the ticks drift
+            await asyncio.sleep(1 - (loop.time() - start_time) % 1)
+            # Simulate data changes for all nodes at once; each update takes the counter it needs
+            # before its first await, so they see the same counter values as when run one by one
+            results = await asyncio.gather(*(update(state) for update in node_updaters.values()), return_exceptions=True)
+            debug_enabled = _logger.isEnabledFor(logging.DEBUG)
+            for node_suffix, result in zip(node_updaters, results):
+                if isinstance(result, Exception):
+                    _logger.error(f"Error updating {node_suffix} in {plc_name}: {result}")
+                elif debug_enabled:
+                    _logger.debug("[%s] %s = %s", plc_name, node_suffix, result)
+            # Commit the history of this tick's data changes in one transaction
+            if history_backend is not None:
+                await history_backend.flush()
+
+def run_virtual_plc_process(**server_kwargs):
+    """Runs one virtual PLC server on its own event loop; the target of each PLC's process"""
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    try:
+        asyncio.run(run_virtual_plc_server(**server_kwargs))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        _logger.error(f"Error running PLC {server_kwargs['plc_name']}: {e}")
+        import traceback
+        _logger.error(traceback.format_exc())
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -319,63 +463,49 @@ if __name__ == "__main__":
     
     # Generate certificates if they don't exist
     if not (os.path.exists(plc2_cert_path) and os.path.exists(plc2_key_path)):
-        _logger.warning(f"Certificates for {plc2_name} not found. Generating new certificates using OpenSSL.")
+        _logger.warning(f"Certificates for {plc2_name} not found. Generating new certificates.")
         try:
-            import subprocess
-            # Generate private key
-            subprocess.run(["openssl", "genrsa", "-out", plc2_key_path, "2048"], check=True, capture_output=True)
-            
-            # Generate self-signed certificate (DER format as used before)
-            subject = f"/CN={plc2_name}/O=VirtualPLC/C=US/ST=California/L=CityName"
-            subprocess.run([
-                "openssl", "req", "-new", "-x509", "-key", plc2_key_path, 
-                "-out", plc2_cert_path, "-days", "365", 
-                "-subj", subject,
-                "-outform", "DER"  # Output in DER format
-            ], check=True, capture_output=True)
-            
-            # Set appropriate permissions for the private key
-            os.chmod(plc2_key_path, 0o600)
-            _logger.info(f"Generated certificates for {plc2_name} using OpenSSL.")
-        except subprocess.CalledProcessError as e:
-            _logger.error(f"OpenSSL command failed for {plc2_name}: {e}")
-            _logger.error(f"stdout: {e.stdout.decode() if e.stdout else 'N/A'}")
-            _logger.error(f"stderr: {e.stderr.decode() if e.stderr else 'N/A'}")
-            sys.exit(1)
+            generate_server_certificate(plc2_key_path, plc2_cert_path, plc2_name)
+            _logger.info(f"Generated certificates for {plc2_name}.")
         except Exception as e:
             _logger.error(f"Failed to generate certificates for {plc2_name}: {e}")
             import traceback
             _logger.error(traceback.format_exc())
             sys.exit(1)
 
-    # Run servers concurrently
-    async def run_all_plcs():
-        try:
-            await asyncio.gather(
-                run_virtual_plc_server(
-                    plc_name=plc1_name, 
-                    url=plc1_url, 
-                    namespace_uri=plc1_namespace_uri, 
-                    variables_config=plc1_variables_config,
-                    enable_history=True
-                ),
-                run_virtual_plc_server(
-                    plc_name=plc2_name, 
-                    url=plc2_url, 
-                    namespace_uri=plc2_namespace_uri, 
-                    variables_config=plc2_variables_config,
-                    username=plc2_username, 
-                    password=plc2_password,
-                    security_policy=plc2_security_policy,
-                    security_mode=plc2_security_mode,
-                    cert_path=plc2_cert_path, 
-                    key_path=plc2_key_path,
-                    enable_history=True
-                )
-            )
-        except Exception as e:
-            _logger.error(f"Error running PLCs: {e}")
-            import traceback
-            _logger.error(traceback.format_exc())
-
-    asyncio.run(run_all_plcs())
\ No newline at end of file
+    # Run each server in its own process, so the PLCs don't share one event loop and one core
+    plc_server_configs = [
+        dict(
+            plc_name=plc1_name, 
+            url=plc1_url, 
+            namespace_uri=plc1_namespace_uri, 
+            variables_config=plc1_variables_config,
+            enable_history=True
+        ),
+        dict(
+            plc_name=plc2_name, 
+            url=plc2_url, 
+            namespace_uri=plc2_namespace_uri, 
+            variables_config=plc2_variables_config,
+            username=plc2_username, 
+            password=plc2_password,
+            security_policy=plc2_security_policy,
+            security_mode=plc2_security_mode,
+            cert_path=plc2_cert_path, 
+            key_path=plc2_key_path,
+            enable_history=True
+        ),
+    ]
+    plc_processes = [
+        multiprocessing.Process(target=run_virtual_plc_process, kwargs=config, name=config["plc_name"])
+        for config in plc_server_configs
+    ]
+    for plc_process in plc_processes:
+        plc_process.start()
+    try:
+        for plc_process in plc_processes:
+            plc_process.join()
+    except KeyboardInterrupt:
+        # The interrupt reaches the PLC processes too; wait for them to shut their servers down
+        for plc_process in plc_processes:
+            plc_process.join()